@@ -0,0 +1,115 @@
+"""Write overhead of checkpointing the email agent.
+
+Runs a synthetic corpus through the graph (scripted models without latency,
+the in-memory Google fake) with no checkpointer, LangGraph's in-memory saver,
+and the SQLite checkpointer committing every write (`--flush-ms 0`) or
+batching them. Reported per variant: emails/sec, checkpoint steps, time spent
+in the checkpointer calls per step, commits, and database bytes per step.
+
+    python -m benchmarks.checkpoint --emails 200 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agent import build_email_agent, google_auth
+from agent.checkpoint import SqliteCheckpointer
+from agent.configuration import Configuration
+from agent.models import STAGES, register_chat_model
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+from tests.fakes.google_api import FakeGoogleHttp
+
+
+class Timed:
+    """Time spent by the callers in `put` and `put_writes` of a checkpointer."""
+
+    def __init__(self, checkpointer):
+        self.seconds = 0.0
+        self.steps = 0
+        # The graph runs asynchronously, so only the async methods are called
+        for name in ("aput", "aput_writes"):
+            setattr(checkpointer, name, self._wrap(getattr(checkpointer, name), name == "aput"))
+
+    def _wrap(self, method, is_step: bool):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - start
+                self.steps += is_step
+
+        return timed
+
+
+async def run_variant(name: str, checkpointer, corpus, configurable: dict, concurrency: int, path: Optional[str]) -> dict:
+    timed = Timed(checkpointer) if checkpointer is not None else None
+    graph = build_email_agent(checkpointer=checkpointer)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(i: int, text: str) -> None:
+        async with semaphore:
+            config = {"configurable": {**configurable, "thread_id": f"{name}-{i}"}, "recursion_limit": 50}
+            await graph.ainvoke({"messages": [{"role": "user", "content": text}]}, config)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(process(i, item.text) for i, item in enumerate(corpus)))
+    if isinstance(checkpointer, SqliteCheckpointer):
+        checkpointer.close()
+    elapsed = time.perf_counter() - start
+
+    result = {"emails_per_second": round(len(corpus) / elapsed, 1)}
+    if timed is not None:
+        result["steps"] = timed.steps
+        result["us_per_step"] = round(timed.seconds / max(timed.steps, 1) * 1e6, 1)
+    if isinstance(checkpointer, SqliteCheckpointer):
+        size = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+        result["commits"] = checkpointer.commits
+        result["bytes_per_step"] = round(size / max(timed.steps, 1))
+    return result
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    corpus = generate_corpus(args.emails, seed=args.seed)
+    oracle = CorpusOracle(corpus)
+    for stage in STAGES:
+        register_chat_model(f"fake:{stage}", FakeChatModel(respond=oracle.respond, structured=oracle.structured))
+    google_auth.set_service_registry(FakeGoogleHttp().registry(), Configuration.langgraph_user_id)
+    configurable = {f"{stage}_model": f"fake:{stage}" for stage in STAGES}
+    configurable["classification_cache"] = "none"
+
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        variants = {
+            "none": (None, None),
+            "memory": (InMemorySaver(), None),
+            "sqlite_per_write": (f"{directory}/per_write.sqlite", dict(flush_interval_ms=0, compress_min_bytes=1 << 30)),
+            "sqlite_batched": (f"{directory}/batched.sqlite", dict(flush_interval_ms=args.flush_ms)),
+        }
+        for name, (target, options) in variants.items():
+            path = target if options is not None else None
+            checkpointer = SqliteCheckpointer(path, **options) if options is not None else target
+            report[name] = await run_variant(name, checkpointer, corpus, configurable, args.concurrency, path)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--flush-ms", type=int, default=20, help="flush interval of the batched variant")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
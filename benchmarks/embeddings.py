@@ -0,0 +1,70 @@
+"""Embeddings/sec of the embedding service on CPU.
+
+Concurrent callers embed one memory each, as memory writes and searches from
+parallel graph runs do. The run is repeated without micro-batching
+(max_batch_size=1), with micro-batching, and with a warm disk cache.
+
+    python -m benchmarks.embeddings --backend onnx-int8 --texts 2000
+
+`--synthetic` replaces the model with a fake encoder costing a fixed overhead
+per forward pass plus a per-text cost, to measure the service itself without
+downloading the model.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from agent.embeddings import DEFAULT_MODEL, EmbeddingService, load_encoder
+
+
+def synthetic_encoder(overhead: float = 0.01, per_text: float = 0.0005):
+    def encode(texts: list[str]) -> np.ndarray:
+        time.sleep(overhead + per_text * len(texts))
+        return np.ones((len(texts), 384), dtype=np.float32)
+
+    return encode
+
+
+def run(name: str, service: EmbeddingService, texts: list[str], concurrency: int) -> dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(service.embed_query, texts))
+    elapsed = time.perf_counter() - start
+    stats = service.stats()
+    return {
+        "run": name,
+        "texts": len(texts),
+        "embeddings_per_second": round(len(texts) / elapsed, 1),
+        "model_embeddings_per_second": round(stats.embeddings_per_second, 1),
+        "forward_passes": stats.forward_passes,
+        "cache_hits": stats.cache_hits,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--synthetic", action="store_true")
+    args = parser.parse_args()
+
+    encoder = synthetic_encoder() if args.synthetic else load_encoder(args.model, args.backend)
+    texts = [f"Memory {i}: follow up with contact {i % 97} about the Q{i % 4 + 1} planning" for i in range(args.texts)]
+    with tempfile.TemporaryDirectory() as path:
+        unbatched = EmbeddingService(args.model, args.backend, cache_path=None, max_batch_size=1, encoder=encoder)
+        print(json.dumps(run("unbatched", unbatched, texts, args.concurrency)), flush=True)
+        batched = EmbeddingService(args.model, args.backend, cache_path=f"{path}/cache.sqlite", encoder=encoder)
+        print(json.dumps(run("micro-batched", batched, texts, args.concurrency)), flush=True)
+        cached = EmbeddingService(args.model, args.backend, cache_path=f"{path}/cache.sqlite", encoder=encoder)
+        print(json.dumps(run("cached", cached, texts, args.concurrency)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
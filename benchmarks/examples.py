@@ -0,0 +1,102 @@
+"""Retrieval latency and prompt cost of the few-shot triage examples.
+
+Fills an example store (`agent/examples.py`) with 1k, 10k and 100k corrections
+built from the synthetic corpus, then reports for held-out emails:
+
+- the latency of `examples_message` (query embedding, IVF search, snippets)
+  and of the vector search alone, p50/p95 in milliseconds;
+- the approximate prompt tokens the examples add to a triage call;
+- how often the retrieved examples carry the email's label (precision@k) and
+  the accuracy of their majority vote, a proxy for the accuracy they bring to
+  the triage model. The corpus is templated, so this is an upper bound of what
+  real corrections give.
+
+The feature-hashed `hash_embed` stands in for the embedding model, whose
+latency `python -m benchmarks.embeddings` reports separately.
+
+    python -m benchmarks.examples --sizes 1000 10000 100000 --k 3
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+from langchain_core.messages.utils import count_tokens_approximately
+
+from agent.examples import ExampleStore, TriageExample, email_text, hash_embed
+from tests.fakes.corpus import generate_corpus
+
+DIMS = 256
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 3)
+
+
+def labeled_emails(n: int, seed: int) -> list:
+    # Duplicates would be retrieved as their own nearest example
+    corpus = generate_corpus(n, seed=seed, duplicates=0.0, requests=0.0)
+    return [item for item in corpus if item.email is not None]
+
+
+def run_size(size: int, queries: list, k: int, seed: int) -> dict:
+    items = labeled_emails(size, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        store = ExampleStore(directory, embed=hash_embed, dims=DIMS)
+        start = time.perf_counter()
+        for offset in range(0, len(items), 5000):
+            batch = items[offset : offset + 5000]
+            store.add_many([TriageExample(email=item.email, correct=item.label) for item in batch])
+        build_seconds = time.perf_counter() - start
+
+        total_ms, search_ms, tokens, precision, votes = [], [], [], [], []
+        for item in queries:
+            start = time.perf_counter()
+            message = store.examples_message(item.email, k)
+            total_ms.append((time.perf_counter() - start) * 1000)
+
+            query = hash_embed([email_text(item.email)], DIMS)[0]
+            start = time.perf_counter()
+            store.index.search(query, ("examples", "default"), k)
+            search_ms.append((time.perf_counter() - start) * 1000)
+
+            tokens.append(count_tokens_approximately([{"role": "user", "content": message}]) if message else 0)
+            labels = [example.correct for example in store.nearest(item.email, k)]
+            if labels:
+                precision.append(sum(label == item.label for label in labels) / len(labels))
+                votes.append(Counter(labels).most_common(1)[0][0] == item.label)
+
+    return {
+        "examples": len(items),
+        "build_seconds": round(build_seconds, 2),
+        "latency_ms": {"p50": _percentile(total_ms, 50), "p95": _percentile(total_ms, 95)},
+        "search_ms": {"p50": _percentile(search_ms, 50), "p95": _percentile(search_ms, 95)},
+        "added_prompt_tokens": round(statistics.mean(tokens), 1),
+        "emails_with_examples": round(len(precision) / len(queries), 3),
+        "precision_at_k": round(statistics.mean(precision), 3) if precision else None,
+        "vote_accuracy": round(float(statistics.mean(votes)), 3) if votes else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Held out: generated with another seed, so none of them is in the store
+    queries = labeled_emails(args.queries * 2, args.seed + 1)[: args.queries]
+    report = {"k": args.k, "queries": len(queries)}
+    for size in args.sizes:
+        report[str(size)] = run_size(size, queries, args.k, args.seed)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
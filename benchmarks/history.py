@@ -0,0 +1,81 @@
+"""Tokens sent to the response model as a thread gets longer.
+
+Every turn of the simulated thread asks for availability, so the agent calls a
+tool returning a long listing and then answers: two model calls per turn. The
+thread is replayed with the whole history (`history_max_tokens=None`) and with
+the token-budgeted window, using a scripted model that records its input.
+
+    python -m benchmarks.history --turns 10,50,200 --budget 6000
+"""
+
+import argparse
+import json
+import time
+
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import START, StateGraph
+from langgraph.prebuilt import create_react_agent
+from langgraph.store.memory import InMemoryStore
+
+from agent.history import amanage_history, manage_history, propagate
+from agent.state import State
+from tests.fakes.chat_models import FakeChatModel, call_tool_then_answer
+
+
+@tool
+def check_calendar_availability(day: str) -> str:
+    """Check calendar availability for a given day."""
+    return "\n".join(f"{day} {hour:02d}:{minute:02d}-{hour:02d}:{minute + 15:02d}" for hour in range(9, 18) for minute in (0, 15, 30))
+
+
+def run(turns: int, budget, tool_output_max_tokens: int) -> dict:
+    model = FakeChatModel(respond=call_tool_then_answer("check_calendar_availability", {"day": "2025-05-01"}))
+    agent = create_react_agent(
+        model,
+        tools=[check_calendar_availability],
+        pre_model_hook=RunnableLambda(manage_history, afunc=amanage_history),
+    )
+    builder = StateGraph(State)
+    builder.add_node("response_agent", lambda state, config: propagate(state["messages"], agent.invoke(state, config)))
+    builder.add_edge(START, "response_agent")
+    store = InMemoryStore()
+    graph = builder.compile(store=store, checkpointer=InMemorySaver())
+    config = {
+        "configurable": {"thread_id": "thread", "history_max_tokens": budget, "tool_output_max_tokens": tool_output_max_tokens},
+        "recursion_limit": 100,
+    }
+
+    start = time.perf_counter()
+    for i in range(turns):
+        message = f"Can we find 30 minutes for the design review of project {i}? Any day next week works for me."
+        result = graph.invoke({"messages": [{"role": "user", "content": message}]}, config)
+    elapsed = time.perf_counter() - start
+    return {
+        "turns": turns,
+        "history_max_tokens": budget,
+        "first_call_tokens": model.input_tokens[0],
+        "last_call_tokens": model.input_tokens[-1],
+        "mean_call_tokens": round(sum(model.input_tokens) / len(model.input_tokens)),
+        "total_tokens": sum(model.input_tokens),
+        "thread_messages": len(result["messages"]),
+        "memories": len(store.search(("email_assistant", "lance", "collection"), limit=turns)),
+        "ms_per_turn": round(elapsed / turns * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", default="10,50,200")
+    parser.add_argument("--budget", type=int, default=6000)
+    parser.add_argument("--tool-output-max-tokens", type=int, default=1000)
+    args = parser.parse_args()
+
+    for turns in [int(n) for n in args.turns.split(",")]:
+        for budget in (None, args.budget):
+            print(json.dumps(run(turns, budget, args.tool_output_max_tokens)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Recall@k and latency of the IVF memory index against brute-force search.
+
+Memories are synthetic clustered embeddings (384 dims, like all-MiniLM-L6-v2),
+queries are perturbed copies of random memories.
+
+    python -m benchmarks.memory_index --sizes 10000,100000,1000000 --dtype float16
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from agent.memory_index import IVFIndex
+
+NAMESPACE = ("email_assistant", "lance", "collection")
+BATCH = 1000
+
+
+def synthetic_embeddings(centers: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    labels = rng.integers(0, len(centers), size=n)
+    return centers[labels] + 0.6 * rng.normal(size=(n, centers.shape[1])).astype(np.float32)
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return float(np.percentile(np.asarray(samples) * 1000, q))
+
+
+def run(size: int, dims: int, dtype: str, nprobe: int, queries: int, k: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(16, size // 500), dims)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as path:
+        index = IVFIndex(dims, path=path, dtype=dtype, nprobe=nprobe, train_threshold=size + 1)
+        targets = []
+        start = time.perf_counter()
+        # Incremental inserts, as manage_memory batches them
+        for offset in range(0, size, BATCH):
+            vectors = synthetic_embeddings(centers, min(BATCH, size - offset), rng)
+            index.add_batch([(NAMESPACE, str(offset + i), vector) for i, vector in enumerate(vectors)])
+            targets.append(vectors[rng.integers(0, len(vectors))])
+        insert_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        index.train()
+        train_seconds = time.perf_counter() - start
+
+        targets = np.asarray(targets)[rng.integers(0, len(targets), size=queries)]
+        probes = targets + 0.3 * rng.normal(size=targets.shape).astype(np.float32)
+        ann_latency, exact_latency, recalls = [], [], []
+        for query in probes:
+            start = time.perf_counter()
+            approximate = index.search(query, NAMESPACE, k)
+            ann_latency.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            exact = index.exact_search(query, NAMESPACE, k)
+            exact_latency.append(time.perf_counter() - start)
+            recalls.append(len({key for _, key, _ in approximate} & {key for _, key, _ in exact}) / k)
+
+    return {
+        "memories": size,
+        "dtype": dtype,
+        "nprobe": nprobe,
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "ann_p50_ms": round(percentile(ann_latency, 50), 3),
+        "ann_p95_ms": round(percentile(ann_latency, 95), 3),
+        "exact_p50_ms": round(percentile(exact_latency, 50), 3),
+        "exact_p95_ms": round(percentile(exact_latency, 95), 3),
+        "inserts_per_second": round(size / insert_seconds),
+        "train_seconds": round(train_seconds, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in [int(size) for size in args.sizes.split(",")]:
+        print(json.dumps(run(size, args.dims, args.dtype, args.nprobe, args.queries, args.k, args.seed)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
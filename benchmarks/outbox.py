@@ -0,0 +1,146 @@
+"""Sending a burst of emails under a per-user quota, directly and through the outbox.
+
+Each account's mailbox is a fake Gmail API answering 429 above `--quota` sends
+per second, like Gmail's per-user rate limit. Every account sends `--emails`
+emails at once, as when a batch of received emails is processed, and a
+`--duplicates` fraction of them is sent a second time under a new tool call,
+as when the agent retries:
+
+- `direct`: each tool call sends at once through the mutation batcher, which
+  retries 429s with exponential backoff (the behavior before the outbox);
+- `outbox`: each tool call queues its email and returns; the outbox worker
+  sends at `--rate` per second and account, deduplicating repeated emails.
+
+Reported per variant: tool call latency, time until every email is sent, 429
+responses and emails delivered twice.
+
+    python -m benchmarks.outbox --accounts 4 --emails 20 --quota 5 --rate 4 --burst 1
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import google_auth
+from agent.google_batch import MutationBatcher
+from agent.outbox import GmailSender, Outbox
+from tests.fakes.google_api import FakeGoogleHttp
+
+
+class QuotaGoogleHttp(FakeGoogleHttp):
+    """Fake Gmail API answering 429 above `quota` sends in any second."""
+
+    def __init__(self, quota: int):
+        super().__init__()
+        self.quota = quota
+        self.rejected = 0
+        self._recent: deque = deque()
+
+    def _send_message(self, match, query, data):
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.quota:
+            self.rejected += 1
+            return 429, {"error": {"code": 429, "message": "User-rate limit exceeded"}}
+        self._recent.append(now)
+        return super()._send_message(match, query, data)
+
+
+def workload(args: argparse.Namespace) -> list[tuple[str, str, str]]:
+    rng = random.Random(args.seed)
+    emails = [
+        (f"user{a}", f"contact{i}@example.com", f"Re: Request {i}")
+        for a in range(args.accounts)
+        for i in range(args.emails)
+    ]
+    emails += rng.sample(emails, int(len(emails) * args.duplicates))
+    rng.shuffle(emails)
+    return emails
+
+
+def _mailboxes(args: argparse.Namespace) -> dict[str, QuotaGoogleHttp]:
+    mailboxes = {f"user{a}": QuotaGoogleHttp(args.quota) for a in range(args.accounts)}
+    services = {account: mailbox.registry().service("gmail", "v1") for account, mailbox in mailboxes.items()}
+    # Each account has its own mailbox and quota
+    google_auth.get_gmail_service = lambda user_id=None: services[user_id]
+    return mailboxes
+
+
+def run_direct(emails: list, args: argparse.Namespace) -> tuple[list[float], float, dict]:
+    mailboxes = _mailboxes(args)
+    batcher = MutationBatcher()
+
+    def send(email: tuple[str, str, str]) -> float:
+        account, to, subject = email
+        start = time.perf_counter()
+        service = google_auth.get_gmail_service(account)
+        request = service.users().messages().send(
+            userId="me", body=google_auth.create_message(to, subject, "Thanks, I will look into it.")
+        )
+        try:
+            batcher.execute(request, group=account)
+        except Exception:
+            pass
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(emails)) as pool:
+        latencies = list(pool.map(send, emails))
+    return latencies, time.perf_counter() - start, mailboxes
+
+
+def run_outbox(emails: list, args: argparse.Namespace) -> tuple[list[float], float, dict]:
+    mailboxes = _mailboxes(args)
+    outbox = Outbox(send=GmailSender(), rate=args.rate, burst=args.burst)
+    latencies = []
+    start = time.perf_counter()
+    for account, to, subject in emails:
+        call = time.perf_counter()
+        outbox.enqueue(account, to, subject, "Thanks, I will look into it.")
+        latencies.append(time.perf_counter() - call)
+    outbox.join()
+    elapsed = time.perf_counter() - start
+    outbox.close()
+    return latencies, elapsed, mailboxes
+
+
+def report(emails: list, latencies: list[float], elapsed: float, mailboxes: dict) -> dict:
+    sent = [message for mailbox in mailboxes.values() for message in mailbox.sent_messages]
+    distinct = sum(len({message["raw"] for message in mailbox.sent_messages}) for mailbox in mailboxes.values())
+    return {
+        "tool_call_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+        },
+        "seconds_until_all_sent": round(elapsed, 2),
+        "http_429": sum(mailbox.rejected for mailbox in mailboxes.values()),
+        "emails_sent": len(sent),
+        "sent_twice": len(sent) - distinct,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=4)
+    parser.add_argument("--emails", type=int, default=20, help="emails per account")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="fraction of emails sent a second time")
+    parser.add_argument("--quota", type=int, default=5, help="sends per second and account accepted by the fake API")
+    parser.add_argument("--rate", type=float, default=4.0, help="outbox sends per second and account")
+    parser.add_argument("--burst", type=int, default=1, help="burst + rate must stay within the quota")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    emails = workload(args)
+    result = {"settings": vars(args), "tool_calls": len(emails)}
+    result["direct"] = report(emails, *run_direct(emails, args))
+    result["outbox"] = report(emails, *run_outbox(emails, args))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
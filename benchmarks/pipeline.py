@@ -0,0 +1,226 @@
+"""Offline throughput and latency of the email agent on a synthetic corpus.
+
+The labeled corpus of `tests/fakes/corpus.py` runs through the compiled graph
+with scripted chat models of fixed (optionally jittered) latency per stage and
+the in-memory fake of the Gmail and Calendar APIs, so runs are reproducible
+and need no network. Reported: p50/p95/p99 latency per graph node and per email,
+emails/sec, and model calls and Google round trips per email.
+
+    python -m benchmarks.pipeline --emails 300 --concurrency 8 --output before.json
+    python -m benchmarks.pipeline --emails 300 --concurrency 8 --baseline before.json
+
+With `--baseline`, the main metrics are compared with an earlier result file
+and the exit status is 1 if one regressed by more than `--tolerance`.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Optional
+from uuid import UUID
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agent import google_auth
+from agent.configuration import Configuration
+from agent.graph import build_email_agent
+from agent.models import STAGES, model_stats, register_chat_model
+from agent.telemetry import telemetry_handler
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+from tests.fakes.google_api import FakeGoogleHttp
+
+# Median seconds of a call per stage, roughly the ratios of a local 27B model
+# for the structured stages and a hosted model for the response agent
+LATENCIES = {"detection": 0.3, "parsing": 0.6, "triage": 0.5, "intake": 0.8, "response": 0.7, "summary": 0.4, "cascade": 0.15}
+
+# Lower is better for these metrics, higher for the others
+LOWER_IS_BETTER = ("latency", "calls_per_email", "round_trips_per_email")
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Wall time of every graph node run (including the response agent's own nodes)."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self._started: dict[UUID, tuple[str, float]] = {}
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+        metadata: Optional[dict] = None, **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name")
+        if not metadata or name != metadata.get("langgraph_node") or name.startswith("__"):
+            return
+        # The runnable of a node runs inside the node, under the same name
+        parent = self._started.get(parent_run_id)
+        if parent is None or parent[0] != name:
+            self._started[run_id] = (name, time.perf_counter())
+
+    def _end(self, run_id: UUID) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.latencies[started[0]].append(time.perf_counter() - started[1])
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+
+def percentiles(samples: list[float]) -> dict:
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_overrides(items: list[str]) -> dict:
+    overrides = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        try:
+            overrides[key] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[key] = value
+    return overrides
+
+
+async def run(args: argparse.Namespace) -> dict:
+    corpus = generate_corpus(args.emails, seed=args.seed, duplicates=args.duplicates)
+    oracle = CorpusOracle(corpus)
+    latencies = {**LATENCIES, **{k: float(v) for k, v in parse_overrides(args.latency).items()}}
+    models = {}
+    for i, stage in enumerate((*STAGES, "cascade")):
+        models[stage] = FakeChatModel(
+            respond=oracle.respond, structured=oracle.structured, latency=latencies[stage] * args.latency_scale,
+            jitter=args.jitter, seed=args.seed + i, callbacks=[telemetry_handler],
+        )
+        register_chat_model(f"fake:{stage}", models[stage])
+
+    fake = FakeGoogleHttp(latency=args.google_latency)
+    google_auth.set_service_registry(fake.registry(), Configuration.langgraph_user_id)
+
+    configurable = {f"{stage}_model": f"fake:{stage}" for stage in STAGES}
+    configurable.update({"intake_mode": args.mode, "classification_cache": "none"})
+    configurable.update(parse_overrides(args.config))
+    graph = build_email_agent()
+    timer = NodeTimer()
+    config = {"configurable": configurable, "callbacks": [timer], "recursion_limit": 50}
+    model_stats.reset()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    email_latencies, errors = [], 0
+
+    async def process(text: str) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await graph.ainvoke({"messages": [{"role": "user", "content": text}]}, config)
+            except Exception as e:
+                errors += 1
+                print(f"Run failed: {e!r}", file=sys.stderr)
+            email_latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(process(item.text) for item in corpus))
+    elapsed = time.perf_counter() - start
+
+    calls = {stage: model.calls for stage, model in models.items() if model.calls}
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {
+            "emails": len(corpus), "concurrency": args.concurrency, "mode": args.mode, "seed": args.seed,
+            "latencies": latencies, "latency_scale": args.latency_scale, "jitter": args.jitter,
+            "google_latency": args.google_latency, "configurable": configurable,
+        },
+        "emails_per_second": round(len(corpus) / elapsed, 2),
+        "errors": errors,
+        "email_latency": percentiles(email_latencies),
+        "node_latency": {node: percentiles(samples) for node, samples in sorted(timer.latencies.items())},
+        "model_calls": calls,
+        "model_calls_per_email": round(sum(calls.values()) / len(corpus), 3),
+        "google_round_trips_per_email": round(fake.round_trips / len(corpus), 3),
+        "escalation_rate": {stage: round(stats.escalation_rate, 3) for stage, stats in model_stats.report().items()},
+    }
+
+
+def _metrics(result: dict) -> dict[str, float]:
+    metrics = {
+        "emails_per_second": result["emails_per_second"],
+        "email_latency.p95_ms": result["email_latency"]["p95_ms"],
+        "model_calls_per_email": result["model_calls_per_email"],
+        "google_round_trips_per_email": result["google_round_trips_per_email"],
+    }
+    for node, stats in result["node_latency"].items():
+        metrics[f"node_latency.{node}.p95_ms"] = stats["p95_ms"]
+    return metrics
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print the change of every metric and return the regressed ones."""
+    regressions = []
+    current, previous = _metrics(result), _metrics(baseline)
+    for name, value in current.items():
+        if name not in previous or not previous[name]:
+            continue
+        change = (value - previous[name]) / previous[name]
+        worse = change > tolerance if any(key in name for key in LOWER_IS_BETTER) else change < -tolerance
+        print(f"{name:45} {previous[name]:>10} -> {value:>10} ({change:+.1%}){'  REGRESSION' if worse else ''}", file=sys.stderr)
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["fused", "staged"], default="fused")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="fraction of repeated emails")
+    parser.add_argument("--latency", action="append", default=[], metavar="STAGE=SECONDS", help="model latency of a stage")
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="multiplies every model latency")
+    parser.add_argument("--jitter", type=float, default=0.3, help="log-normal spread of the model latencies")
+    parser.add_argument("--google-latency", type=float, default=0.01, help="seconds per Google API round trip")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=VALUE", help="configurable value of the runs")
+    parser.add_argument("--output", help="write the JSON result to this file")
+    parser.add_argument("--baseline", help="JSON result of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            if compare(result, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""End-to-end latency of `respond` emails with and without the speculative memory search.
+
+Runs emails that need an answer through the graph, one at a time, with scripted
+models of fixed latency per stage (`benchmarks/pipeline.py` ratios) and a
+memory store whose query embedding takes `--memory-latency` seconds. The
+scripted response agent searches memory for the sender and subject first,
+unless the memories are already in its prompt, as a real model does.
+
+Reported for `speculative_memory_search` off and on: p50/p95 latency per
+email, response model calls per email and memory searches made by the agent.
+
+    python -m benchmarks.speculation --emails 40 --latency-scale 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from agent import build_email_agent, google_auth
+from agent.configuration import Configuration
+from agent.memory_index import AnnMemoryStore
+from agent.models import STAGES, register_chat_model
+from agent.tenants import Tenant
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+from tests.fakes.google_api import FakeGoogleHttp
+
+# Median seconds of a call per stage, as in benchmarks/pipeline.py
+LATENCIES = {"detection": 0.3, "parsing": 0.6, "triage": 0.5, "intake": 0.8, "response": 0.7, "summary": 0.4}
+DIMS = 64
+
+
+class SlowEmbeddings(Embeddings):
+    """Bag-of-characters embeddings taking `latency` seconds per call, like a model on CPU."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(DIMS, dtype=np.float32)
+        for char in text.lower():
+            vector[ord(char) % DIMS] += 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+
+def _percentiles(samples: list[float]) -> dict:
+    values = np.asarray(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(values, 50)), 1), "p95_ms": round(float(np.percentile(values, 95)), 1)}
+
+
+async def run_variant(speculate: bool, args: argparse.Namespace) -> dict:
+    corpus = generate_corpus(args.emails, seed=args.seed, duplicates=0.0, requests=0.0, mix=(1.0, 0.0, 0.0))
+    oracle = CorpusOracle(corpus, search_memory=True)
+    models = {}
+    for stage in STAGES:
+        models[stage] = FakeChatModel(
+            respond=oracle.respond, structured=oracle.structured, latency=LATENCIES[stage] * args.latency_scale
+        )
+        register_chat_model(f"fake:{stage}", models[stage])
+    google_auth.set_service_registry(FakeGoogleHttp().registry(), Configuration.langgraph_user_id)
+
+    store = AnnMemoryStore(index={"dims": DIMS, "embed": SlowEmbeddings(args.memory_latency * args.latency_scale)})
+    namespace = Tenant(Configuration.langgraph_user_id, {}, {}).memory_namespace
+    for item in corpus:
+        store.put(namespace, f"contact-{item.id}", {"content": f"{item.email.author_name} works on {item.email.subject}"})
+
+    configurable = {f"{stage}_model": f"fake:{stage}" for stage in STAGES}
+    configurable.update({
+        "langgraph_user_id": Configuration.langgraph_user_id,
+        "intake_mode": args.mode,
+        "classification_cache": "none",
+        "preclassifier": False,
+        "speculative_memory_search": speculate,
+    })
+    graph = build_email_agent(store=store)
+    latencies, agent_searches = [], 0
+    for item in corpus:
+        start = time.perf_counter()
+        result = await graph.ainvoke(
+            {"messages": [{"role": "user", "content": item.text}]},
+            {"configurable": configurable, "recursion_limit": 50},
+        )
+        latencies.append(time.perf_counter() - start)
+        agent_searches += sum(m.type == "tool" and m.name == "search_memory" for m in result["messages"])
+
+    return {
+        "email_latency": _percentiles(latencies),
+        "response_calls_per_email": round(models["response"].calls / len(corpus), 2),
+        "agent_memory_searches_per_email": round(agent_searches / len(corpus), 2),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    before = await run_variant(False, args)
+    after = await run_variant(True, args)
+    change = after["email_latency"]["p50_ms"] / before["email_latency"]["p50_ms"] - 1
+    return {
+        "settings": {"emails": args.emails, "mode": args.mode, "latency_scale": args.latency_scale,
+                     "memory_latency": args.memory_latency},
+        "before": before,
+        "after": after,
+        "p50_change": f"{change:+.1%}",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=40)
+    parser.add_argument("--mode", choices=["fused", "staged"], default="fused")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-scale", type=float, default=0.2, help="multiplies every model and search latency")
+    parser.add_argument("--memory-latency", type=float, default=0.1, help="seconds to embed a memory query")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Cold-start time of a worker importing the agent.
+
+Each run is a fresh interpreter executing `python -X importtime`, so the
+numbers include every module the agent pulls in. The slowest imports are
+listed to spot a heavy dependency sneaking back into module scope. Building the
+graph and the first response agent, which import the model providers and the
+agent tools, are timed separately.
+
+    python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+BUILD = """
+import time
+start = time.perf_counter()
+import agent
+imported = time.perf_counter()
+agent.build_email_agent()
+built = time.perf_counter()
+from agent.graph import get_response_agent
+get_response_agent()
+print(imported - start, built - imported, time.perf_counter() - built)
+"""
+
+
+def importtime(module: str = "agent") -> dict[str, tuple[int, int]]:
+    """Self and cumulative import time (us) of every module imported by `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args()
+
+    runs = [importtime() for _ in range(args.runs)]
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)[: args.top]
+    phases = [
+        [float(value) for value in subprocess.run(
+            [sys.executable, "-c", BUILD], capture_output=True, text=True, check=True
+        ).stdout.split()]
+        for _ in range(args.runs)
+    ]
+    print(json.dumps({
+        "import_agent_ms": round(statistics.median(run["agent"][1] for run in runs) / 1000, 1),
+        "modules": len(runs[-1]),
+        "build_email_agent_ms": round(statistics.median(phase[1] for phase in phases) * 1000, 1),
+        "first_response_agent_ms": round(statistics.median(phase[2] for phase in phases) * 1000, 1),
+        "slowest_imports_ms": {name: round(self_us / 1000, 1) for name, (self_us, _) in slowest},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Parse failures and local repairs of structured answers from an unreliable model.
+
+Asks a scripted model for the `email_detection`, `EmailInput` and `Router`
+answers of every email of the synthetic corpus. A `--malformed` fraction of
+the model's answers is damaged the way local models damage JSON (code fences,
+text around the object, Python literals, trailing commas, truncation,
+refusals; see `tests.fakes.chat_models.damage_json`):
+
+- `strict`: `with_structured_output` without retries (the behavior before
+  `StructuredOutput`): any damaged answer fails the email;
+- `repair`: `StructuredOutput` with local repair and a budget of `--retries`
+  calls asking again.
+
+Reported per variant and schema: the share of model answers that did not
+parse as they came, the share of those repaired without a model call, model
+calls per answer and the answers still failing; and the emails that would
+have failed their graph run.
+
+    python -m benchmarks.structured --emails 500 --malformed 0.2 --retries 2
+"""
+
+import argparse
+import json
+
+from agent.state import EmailInput, Router, email_detection
+from agent.structured import StructuredOutput
+from agent.telemetry import telemetry
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+
+SCHEMAS = {"detection": email_detection, "parsing": EmailInput, "triage": Router}
+
+
+def run_variant(name: str, corpus: list, args: argparse.Namespace) -> dict:
+    oracle = CorpusOracle(corpus)
+    telemetry.reset()
+    report, failed_emails = {}, set()
+    for i, (stage, schema) in enumerate(SCHEMAS.items()):
+        model = FakeChatModel(structured=oracle.structured, malformed=args.malformed, seed=args.seed + i)
+        if name == "strict":
+            structured = model.with_structured_output(schema)
+        else:
+            structured = StructuredOutput(model, schema, retries=args.retries, stage=stage)
+        failures = 0
+        for item in corpus:
+            try:
+                structured.invoke([{"role": "user", "content": item.text}])
+            except ValueError:
+                failures += 1
+                failed_emails.add(item.id)
+
+        if name == "strict":
+            unparsed, repaired = failures, 0.0
+        else:
+            # Every answer that did not parse was repaired, asked again, or failed the call
+            count = {
+                result: telemetry.counter_value("agent_structured_output_total", stage=stage, result=result)
+                for result in ("repaired", "retried", "failed")
+            }
+            unparsed, repaired = sum(count.values()), count["repaired"]
+        report[stage] = {
+            "parse_failure_rate": round(unparsed / model.calls, 3),
+            "repair_rate": round(repaired / unparsed, 3) if unparsed else None,
+            "model_calls_per_answer": round(model.calls / len(corpus), 3),
+            "failed_answers": failures,
+        }
+    report["emails_failed"] = len(failed_emails)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--malformed", type=float, default=0.2, help="fraction of damaged model answers")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    telemetry.enable()
+    # Received emails only, so every schema has an answer
+    corpus = generate_corpus(args.emails, seed=args.seed, requests=0.0)
+    result = {"settings": vars(args)}
+    for name in ("strict", "repair"):
+        result[name] = run_variant(name, corpus, args)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Overhead of the telemetry layer, disabled and enabled.
+
+Times a no-op function called directly and through `traced` with telemetry
+off and on, then runs the offline pipeline benchmark (`pipeline.py`) with
+telemetry off and on and compares emails/sec. With `--metrics`, the
+Prometheus text of the enabled run is written to a file.
+
+    python -m benchmarks.telemetry --calls 200000 --emails 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from pipeline import run
+
+from agent.telemetry import telemetry, traced
+
+
+def noop(x):
+    return x
+
+
+def per_call_ns(func, calls: int) -> float:
+    start = time.perf_counter_ns()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter_ns() - start) / calls
+
+
+def pipeline_args(args: argparse.Namespace) -> argparse.Namespace:
+    return argparse.Namespace(
+        emails=args.emails, concurrency=args.concurrency, mode="fused", seed=0, duplicates=0.1, latency=[],
+        latency_scale=args.latency_scale, jitter=0.0, google_latency=0.0, config=[],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="multiplies the model latencies; 0 isolates the overhead")
+    parser.add_argument("--metrics", help="write the Prometheus text of the enabled run to this file")
+    args = parser.parse_args()
+
+    wrapped = traced("node", "noop")(noop)
+    telemetry.disable()
+    calls = {"direct_ns": per_call_ns(noop, args.calls), "traced_disabled_ns": per_call_ns(wrapped, args.calls)}
+    telemetry.enable()
+    calls["traced_enabled_ns"] = per_call_ns(wrapped, args.calls)
+    telemetry.reset()
+
+    throughput = {}
+    for enabled in (False, True):
+        telemetry.enabled = enabled
+        result = asyncio.run(run(pipeline_args(args)))
+        throughput["enabled" if enabled else "disabled"] = result["emails_per_second"]
+
+    report = {
+        "per_call": {name: round(value, 1) for name, value in calls.items()},
+        "emails_per_second": throughput,
+        "overhead_enabled": round(1 - throughput["enabled"] / throughput["disabled"], 4),
+        "spans": len(telemetry.spans()),
+    }
+    print(json.dumps(report, indent=2))
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(telemetry.prometheus_text())
+    telemetry.disable()
+
+
+if __name__ == "__main__":
+    main()
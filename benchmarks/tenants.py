@@ -0,0 +1,80 @@
+"""Memory and latency of per-user state against the number of tenants.
+
+Each request resolves a user's tenant (profile and instructions), renders their
+triage and agent system prompts and searches their memory namespace, as a graph
+run does before calling a model. Users are drawn from a Zipf distribution, so a
+few mailboxes are busy and most are idle.
+
+    python -m benchmarks.tenants --tenants 10,100,1000 --requests 5000
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from langgraph.store.memory import InMemoryStore
+
+from agent.prompt_cache import PromptCache
+from agent.tenants import TenantRegistry
+
+
+def run(tenants: int, requests: int, max_tenants: int, memories: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as path:
+        for i in range(tenants):
+            with open(f"{path}/user{i}.json", "w") as f:
+                json.dump({"profile": {"name": f"User {i}", "full_name": f"User Number {i}"}}, f)
+
+        tracemalloc.start()
+        registry = TenantRegistry(path, max_tenants=max_tenants)
+        prompts = PromptCache()
+        store = InMemoryStore()
+        for i in range(tenants):
+            for j in range(memories):
+                store.put(("email_assistant", f"user{i}", "collection"), str(j), {"content": f"Memory {j} of user {i}"})
+
+        users = (rng.zipf(1.3, size=requests) - 1) % tenants
+        latencies = []
+        for user in users.tolist():
+            start = time.perf_counter()
+            tenant = registry.get(f"user{user}")
+            prompts.triage_system_prompt(tenant.profile, tenant.prompt_instructions)
+            prompts.agent_system_message(tenant.profile, tenant.prompt_instructions)
+            store.search(tenant.memory_namespace, limit=5)
+            latencies.append(time.perf_counter() - start)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "tenants": tenants,
+        "requests": requests,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "tenant_loads": registry.loads,
+        "cached_tenants": len(registry),
+        "prompt_cache_hit_rate": round(prompts.stats().hit_rate, 3),
+        "memory_mb": round(current / 2**20, 1),
+        "peak_memory_mb": round(peak / 2**20, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenants", default="10,100,1000")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--max-tenants", type=int, default=256)
+    parser.add_argument("--memories", type=int, default=20, help="memories per tenant")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for tenants in [int(n) for n in args.tenants.split(",")]:
+        print(json.dumps(run(tenants, args.requests, args.max_tenants, args.memories, args.seed)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Triage prompt size and summarization work on long email threads.
+
+Generates threads where every reply quotes the whole conversation below it,
+with signatures, and processes their messages in order:
+
+- `raw`: the body as received (`thread_preprocessing=False`);
+- `uncached`: quoted history and signatures stripped, long histories
+  summarized chunk by chunk, without reusing earlier summaries;
+- `cached`: the same with summaries cached by Message-ID, so a reply only
+  summarizes the new text of the message it answers.
+
+Reported per variant: approximate tokens of the triage user prompt (p50 and
+for the last message of a thread), summary chunks per message, and wall time
+per message with a scripted summary model of `--summary-latency` seconds.
+
+    python -m benchmarks.threads --threads 10 --messages 12 --min-tokens 400 --chunk-tokens 500
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from langchain_core.messages import AIMessage
+
+from agent.cache import InMemoryCacheBackend
+from agent.email_parser import email_from_message, parse_headers
+from agent.graph import _format_email
+from agent.threads import ThreadPreprocessor, count_tokens
+from tests.fakes.chat_models import FakeChatModel
+
+WORDS = "launch budget review customer contract deadline migration design hiring roadmap invoice release".split()
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "." for _ in range(sentences)
+    )
+
+
+def generate_thread(rng: random.Random, thread: int, messages: int) -> list[str]:
+    """Raw messages of a thread, each one quoting the previous message with its history."""
+    people = [("Alice Jones", "alice@example.com"), ("John Doe", "john@company.com")]
+    raw, body = [], ""
+    for i in range(messages):
+        name, address = people[i % 2]
+        to_name, to_address = people[(i + 1) % 2]
+        text = f"Hi {to_name.split()[0]},\n\n{_paragraph(rng, rng.randint(3, 12))}\n\nBest,\n{name.split()[0]}\n-- \n{name}\nACME Corp | +1 555 0100"
+        if body:
+            quoted = "\n".join(f"> {line}" if line else ">" for line in body.splitlines())
+            text += f"\n\nOn Mon, May {5 + i}, 2025 at 10:00 AM {people[(i + 1) % 2][0]} <{to_address}> wrote:\n{quoted}"
+        body = text
+        headers = f"From: {name} <{address}>\nTo: {to_name} <{to_address}>\nSubject: Re: Thread {thread}\n"
+        headers += f"Message-ID: <t{thread}.m{i}@example.com>\n"
+        if i:
+            headers += f"In-Reply-To: <t{thread}.m{i - 1}@example.com>\n"
+        raw.append(f"{headers}\n{text}")
+    return raw
+
+
+async def run_variant(name: str, threads: list[list[str]], args: argparse.Namespace) -> dict:
+    chunks = 0
+
+    def summarize(messages) -> AIMessage:
+        nonlocal chunks
+        chunks += 1
+        return AIMessage(content=f"Summary of {count_tokens(str(messages[-1].content))} tokens of the thread.")
+
+    model = FakeChatModel(respond=summarize, latency=args.summary_latency)
+    preprocessor = ThreadPreprocessor(InMemoryCacheBackend(), args.min_tokens, args.chunk_tokens)
+    tokens, last_tokens, seconds = [], [], []
+    for thread in threads:
+        for i, raw in enumerate(thread):
+            headers = parse_headers(raw)
+            email = email_from_message(headers)
+            start = time.perf_counter()
+            if name != "raw":
+                if name == "uncached":
+                    preprocessor.backend.clear()
+                plan = preprocessor.plan(email, headers)
+                email = preprocessor.finish(email, plan, await preprocessor.asummarize(plan, model))
+            seconds.append(time.perf_counter() - start)
+            tokens.append(count_tokens(_format_email(email)))
+            if i == len(thread) - 1:
+                last_tokens.append(tokens[-1])
+
+    messages = sum(len(thread) for thread in threads)
+    return {
+        "triage_prompt_tokens": {"p50": statistics.median(tokens), "last_message": round(statistics.mean(last_tokens))},
+        "summary_chunks_per_message": round(chunks / messages, 2),
+        "preprocessing_ms_per_message": round(statistics.mean(seconds) * 1000, 1),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    threads = [generate_thread(rng, t, args.messages) for t in range(args.threads)]
+    report = {"threads": args.threads, "messages_per_thread": args.messages}
+    for name in ("raw", "uncached", "cached"):
+        report[name] = await run_variant(name, threads, args)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-tokens", type=int, default=1500, help="histories up to this size are kept verbatim")
+    parser.add_argument("--chunk-tokens", type=int, default=1500)
+    parser.add_argument("--summary-latency", type=float, default=0.2, help="seconds per summary model call")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,16 @@
 This module defines a custom graph.
 """
 
-from agent.graph import email_agent
+from agent.graph import build_email_agent
+from agent.batch import triage_batch
 
-__all__ = ["email_agent"]
+__all__ = ["build_email_agent", "email_agent", "triage_batch"]
+
+
+def __getattr__(name: str):
+    # The compiled graph is built on first access, see `build_email_agent`
+    if name == "email_agent":
+        from agent.graph import email_agent
+
+        return email_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,128 @@
+"""Concurrent triage of a mailbox backlog.
+
+`email_agent.invoke` processes one email per graph run. When a mailbox with
+thousands of unread messages is onboarded, `triage_batch` parses and classifies
+them concurrently and yields each result as soon as it is ready.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Iterable, Iterator, Optional, Union
+
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+from agent import graph
+from agent.configuration import Configuration
+from agent.state import EmailInput, Router
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TriageResult:
+    """The outcome of triaging one email of a batch."""
+
+    index: int
+    email_info: Optional[EmailInput] = None
+    router: Optional[Router] = None
+    response: Optional[dict] = None
+    error: Optional[BaseException] = None
+    latency: float = 0.0
+
+
+class TriageBatch:
+    """Iterate over triage results in completion order.
+
+    Args:
+        emails (Iterable[str | EmailInput]): Raw emails or already parsed emails.
+        max_concurrency (int): Maximum number of emails processed at the same time.
+        config (RunnableConfig, optional): Configuration of the agent.
+        run_response_agent (bool): Also run the response agent for emails that
+            are not classified as `ignore`.
+    """
+
+    def __init__(
+        self,
+        emails: Iterable[Union[str, EmailInput]],
+        max_concurrency: int = 8,
+        config: Optional[RunnableConfig] = None,
+        run_response_agent: bool = False,
+    ):
+        self.emails = list(emails)
+        self.max_concurrency = max_concurrency
+        self.config = config or {}
+        self.configuration = Configuration.from_runnable_config(config)
+        self.run_response_agent = run_response_agent
+        self.completed = 0
+        self.elapsed = 0.0
+
+    @property
+    def emails_per_second(self) -> float:
+        return self.completed / self.elapsed if self.elapsed else 0.0
+
+    def _parse(self, email: Union[str, EmailInput]) -> tuple[EmailInput, Optional[EmailMessage]]:
+        if isinstance(email, EmailInput):
+            email_info, headers = email, None
+        else:
+            email_info, headers = graph._parse_email(email, self.configuration)
+        if email_info is None:
+            email_info = graph.get_stage_model(self.configuration, "parsing", EmailInput).invoke(
+                graph._parser_messages(email)
+            )
+        # Triaged like in the graph, on the thread without quotes and signatures
+        return graph._prepare_email(email_info, headers, self.configuration), headers
+
+    def _triage(self, item: tuple[int, Union[str, EmailInput]]) -> TriageResult:
+        index, email = item
+        start = time.perf_counter()
+        result = TriageResult(index=index)
+        try:
+            result.email_info, headers = self._parse(email)
+            result.router = graph._classify(result.email_info, self.configuration, headers)
+            if self.run_response_agent and result.router.classification != "ignore":
+                command = graph._route_email(result.router.classification, graph._format_email(result.email_info))
+                result.response = graph.get_response_agent(self.configuration.response_model).invoke(command.update, self.config)
+        except Exception as e:
+            result.error = e
+        result.latency = time.perf_counter() - start
+        return result
+
+    def __iter__(self) -> Iterator[TriageResult]:
+        start = time.perf_counter()
+        runner = RunnableLambda(self._triage)
+        for _, result in runner.batch_as_completed(
+            list(enumerate(self.emails)),
+            config={**self.config, "max_concurrency": self.max_concurrency},
+        ):
+            self.completed += 1
+            self.elapsed = time.perf_counter() - start
+            yield result
+        logger.info("Triaged %d emails in %.1fs (%.2f emails/sec)", self.completed, self.elapsed, self.emails_per_second)
+
+
+def triage_batch(
+    emails: Iterable[Union[str, EmailInput]],
+    max_concurrency: int = 8,
+    config: Optional[RunnableConfig] = None,
+    run_response_agent: bool = False,
+) -> TriageBatch:
+    """Parse and classify many emails concurrently.
+
+    Results are yielded as they finish, not in input order; use
+    `TriageResult.index` to match them with the input. The returned batch
+    exposes `completed`, `elapsed` and `emails_per_second` for sizing the
+    model backend.
+
+    Args:
+        emails (Iterable[str | EmailInput]): Raw emails or already parsed emails.
+        max_concurrency (int): Maximum number of emails processed at the same time.
+        config (RunnableConfig, optional): Configuration of the agent.
+        run_response_agent (bool): Also run the response agent for emails that
+            are not classified as `ignore`.
+
+    Returns:
+        TriageBatch: An iterable of `TriageResult` in completion order.
+    """
+    return TriageBatch(emails, max_concurrency=max_concurrency, config=config, run_response_agent=run_response_agent)
@@ -0,0 +1,214 @@
+"""Content-addressed cache of triage classifications.
+
+Newsletters, build notifications and mass announcements are received many
+times with the same or nearly the same content. The cache keys `Router` results
+by a normalized hash of the email and the triage context (rules and profile), so
+repeated copies are classified without calling the model again.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from agent.state import EmailInput, Router
+from agent.telemetry import telemetry
+
+
+@dataclass
+class CacheStats:
+    """Hit and miss counters of a cache."""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class InMemoryCacheBackend:
+    """Process-local LRU cache with optional TTL expiry."""
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk LRU cache with optional TTL expiry that survives restarts."""
+
+    def __init__(self, path: str, max_entries: int = 10_000, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        return count
+
+
+def _normalize(text: str) -> str:
+    # Collapse whitespace and digit runs (build numbers, dates, counters) so that
+    # near-identical copies of the same notification share a key
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return re.sub(r"\d+", "0", text)
+
+
+def _fingerprint(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class ClassificationCache:
+    """Cache of `Router` results keyed by the email and the triage context.
+
+    Entries are scoped per user. The triage rules and profile are part of the
+    key, so a user whose rules change misses on the old entries, which age out
+    of the LRU, while the entries of other users are kept.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = CacheStats()
+
+    def key(self, email_info: EmailInput, triage_rules: dict, profile: dict, scope: str = "default") -> str:
+        """Compute the content address of an email in a triage context."""
+        return _fingerprint(
+            {
+                "scope": scope,
+                "author": email_info.author_email.strip().lower(),
+                "subject": _normalize(email_info.subject),
+                "email_thread": _normalize(email_info.email_thread),
+                "triage_rules": triage_rules,
+                "profile": profile,
+            }
+        )
+
+    def get(self, email_info: EmailInput, triage_rules: dict, profile: dict, scope: str = "default") -> Optional[Router]:
+        """Return the cached classification of an email, if any."""
+        value = self.backend.get(self.key(email_info, triage_rules, profile, scope))
+        if value is None:
+            self.stats.misses += 1
+            telemetry.count("agent_cache_requests_total", cache="classification", result="miss")
+            return None
+        self.stats.hits += 1
+        telemetry.count("agent_cache_requests_total", cache="classification", result="hit")
+        return Router.model_validate_json(value)
+
+    def set(
+        self, email_info: EmailInput, triage_rules: dict, profile: dict, result: Router, scope: str = "default"
+    ) -> None:
+        """Store the classification of an email."""
+        self.backend.set(self.key(email_info, triage_rules, profile, scope), result.model_dump_json())
+
+    def clear(self) -> None:
+        self.backend.clear()
+        self.stats = CacheStats()
+
+
+@lru_cache
+def _cache_for(backend: str, path: str, max_entries: int, ttl_seconds: Optional[float]) -> ClassificationCache:
+    if backend == "sqlite":
+        return ClassificationCache(SQLiteCacheBackend(path, max_entries=max_entries, ttl_seconds=ttl_seconds))
+    return ClassificationCache(InMemoryCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds))
+
+
+def get_classification_cache(configuration) -> Optional[ClassificationCache]:
+    """Return the process-wide classification cache for a configuration.
+
+    Args:
+        configuration (Configuration): The agent configuration.
+
+    Returns:
+        Optional[ClassificationCache]: The shared cache, or None if caching is disabled.
+    """
+    if configuration.classification_cache == "none":
+        return None
+    return _cache_for(
+        configuration.classification_cache,
+        configuration.classification_cache_path,
+        configuration.classification_cache_max_entries,
+        configuration.classification_cache_ttl_seconds,
+    )
@@ -0,0 +1,276 @@
+"""Local free/busy index for calendar availability queries.
+
+While negotiating a meeting the agent checks availability several times. The
+engine loads a multi-week window of busy intervals with one `freebusy.query`,
+keeps them in a sorted, merged interval list and answers free-slot queries
+locally. Events created through `schedule_meeting` are added in place, and
+remote changes reported by the events sync token only reload the affected
+days.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Optional
+
+from googleapiclient.errors import HttpError
+
+from agent.google_auth import get_calendar_service
+
+logger = logging.getLogger(__name__)
+
+Interval = tuple[datetime, datetime]
+
+
+def _parse_time(value: dict) -> datetime:
+    """Parse the start or end of an event (`dateTime` or all-day `date`)."""
+    if "dateTime" in value:
+        parsed = datetime.fromisoformat(value["dateTime"])
+    else:
+        parsed = datetime.combine(date.fromisoformat(value["date"]), dtime())
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, dtime(), tzinfo=timezone.utc)
+
+
+def _days(start: datetime, end: datetime) -> list[date]:
+    days = []
+    day = start.date()
+    while _day_start(day) < end:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+class IntervalIndex:
+    """Sorted list of disjoint busy intervals."""
+
+    def __init__(self):
+        self.starts: list[datetime] = []
+        self.ends: list[datetime] = []
+
+    def add(self, start: datetime, end: datetime) -> None:
+        """Insert an interval, merging it with the ones it overlaps."""
+        if end <= start:
+            return
+        lo = bisect.bisect_left(self.ends, start)
+        hi = bisect.bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def clear(self, start: datetime, end: datetime) -> None:
+        """Remove everything between start and end, clipping partial overlaps."""
+        lo = bisect.bisect_right(self.ends, start)
+        hi = bisect.bisect_left(self.starts, end)
+        kept = []
+        if lo < hi and self.starts[lo] < start:
+            kept.append((self.starts[lo], start))
+        if lo < hi and self.ends[hi - 1] > end:
+            kept.append((end, self.ends[hi - 1]))
+        self.starts[lo:hi] = [interval[0] for interval in kept]
+        self.ends[lo:hi] = [interval[1] for interval in kept]
+
+    def busy(self, start: datetime, end: datetime) -> list[Interval]:
+        """Busy intervals overlapping [start, end), clipped to it."""
+        lo = bisect.bisect_right(self.ends, start)
+        hi = bisect.bisect_left(self.starts, end)
+        return [(max(s, start), min(e, end)) for s, e in zip(self.starts[lo:hi], self.ends[lo:hi])]
+
+    def free(self, start: datetime, end: datetime, min_duration: timedelta) -> list[Interval]:
+        """Gaps of at least `min_duration` between start and end."""
+        slots = []
+        cursor = start
+        for busy_start, busy_end in self.busy(start, end):
+            if busy_start - cursor >= min_duration:
+                slots.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        if end - cursor >= min_duration:
+            slots.append((cursor, end))
+        return slots
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+class AvailabilityEngine:
+    """Free/busy cache of one calendar.
+
+    Args:
+        service_factory (Callable): Returns the Calendar API client.
+        calendar_id (str): The calendar to track.
+        window_days (int): Number of days loaded by one freebusy query.
+        sync_interval (float): Minimum seconds between two sync token checks.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable,
+        calendar_id: str = "primary",
+        window_days: int = 28,
+        sync_interval: float = 60.0,
+    ):
+        self.service_factory = service_factory
+        self.calendar_id = calendar_id
+        self.window_days = window_days
+        self.sync_interval = sync_interval
+        self.index = IntervalIndex()
+        self.queries = 0
+        self._loaded: Optional[Interval] = None
+        self._stale: set[date] = set()
+        self._sync_token: Optional[str] = None
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+
+    def _query(self, start: datetime, end: datetime) -> list[Interval]:
+        self.queries += 1
+        body = {
+            "timeMin": start.isoformat(),
+            "timeMax": end.isoformat(),
+            "timeZone": "UTC",
+            "items": [{"id": self.calendar_id}],
+        }
+        result = self.service_factory().freebusy().query(body=body).execute()
+        busy = result["calendars"][self.calendar_id].get("busy", [])
+        return [(_parse_time({"dateTime": b["start"]}), _parse_time({"dateTime": b["end"]})) for b in busy]
+
+    def _load(self, start: datetime, end: datetime) -> None:
+        logger.debug("Loading free/busy of %s from %s to %s", self.calendar_id, start, end)
+        busy = self._query(start, end)
+        self.index.clear(start, end)
+        for interval in busy:
+            self.index.add(*interval)
+        for day in _days(start, end):
+            self._stale.discard(day)
+
+    def _ensure(self, start: datetime, end: datetime) -> None:
+        self._sync()
+        if self._loaded is None or start < self._loaded[0] or end > self._loaded[1]:
+            if self._sync_token is None:
+                # Take the sync token first so no change made during the load is missed
+                self._start_sync(self.service_factory())
+                self._last_sync = time.monotonic()
+            window_end = max(end, start + timedelta(days=self.window_days))
+            self.index = IntervalIndex()
+            self._stale.clear()
+            self._load(start, window_end)
+            self._loaded = (start, window_end)
+            return
+
+        stale = sorted(day for day in _days(start, end) if day in self._stale)
+        if stale:
+            self._load(_day_start(stale[0]), _day_start(stale[-1] + timedelta(days=1)))
+
+    def _start_sync(self, service) -> None:
+        # Recurring events are listed once, not once per instance, so the
+        # pages only cover the calendar's events and not every occurrence
+        request = service.events().list(
+            calendarId=self.calendar_id,
+            showDeleted=True,
+            maxResults=2500,
+            fields="nextPageToken,nextSyncToken",
+        )
+        while request is not None:
+            response = request.execute()
+            self._sync_token = response.get("nextSyncToken", self._sync_token)
+            request = service.events().list_next(request, response)
+
+    def _sync(self) -> None:
+        """Mark the days touched by remote changes as stale."""
+        if self._loaded is None or self._sync_token is None or time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = time.monotonic()
+        service = self.service_factory()
+        # A sync token only answers the parameters of the listing it came from
+        request = service.events().list(calendarId=self.calendar_id, showDeleted=True, syncToken=self._sync_token)
+        try:
+            while request is not None:
+                response = request.execute()
+                for event in response.get("items", []):
+                    self._invalidate_event(event)
+                self._sync_token = response.get("nextSyncToken", self._sync_token)
+                request = service.events().list_next(request, response)
+        except HttpError as e:
+            if e.resp.status != 410:
+                raise
+            # The sync token expired, start over
+            logger.info("Calendar sync token expired, reloading availability")
+            self._sync_token = None
+            self.invalidate()
+
+    def _invalidate_event(self, event: dict) -> None:
+        if "recurrence" in event or "start" not in event or "end" not in event:
+            # The instances of a changed series, or a cancelled event without
+            # times, could be anywhere
+            self.invalidate()
+            return
+        start, end = _parse_time(event["start"]), _parse_time(event["end"])
+        self.invalidate(start, end)
+        if "originalStartTime" in event:
+            # An instance of a series moved away from its original time
+            original = _parse_time(event["originalStartTime"])
+            self.invalidate(original, original + (end - start))
+
+    def invalidate(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> None:
+        """Reload the days between start and end (everything if omitted) on next use."""
+        with self._lock:
+            if start is None or end is None:
+                self._loaded = None
+                return
+            self._stale.update(_days(start, end))
+
+    def add_busy(self, start: datetime, end: datetime) -> None:
+        """Record an event created by the agent without reloading the calendar."""
+        with self._lock:
+            self.index.add(start, end)
+
+    def free_slots(
+        self,
+        start: datetime,
+        end: datetime,
+        min_minutes: int = 30,
+        workday: tuple[int, int] = (9, 18),
+    ) -> list[Interval]:
+        """Free slots of at least `min_minutes` within working hours.
+
+        Args:
+            start (datetime): Start of the range.
+            end (datetime): End of the range.
+            min_minutes (int): Minimum length of a slot.
+            workday (tuple[int, int]): Working hours (UTC) of each day.
+        """
+        with self._lock:
+            self._ensure(start, end)
+            slots = []
+            for day in _days(start, end):
+                day_start = max(start, _day_start(day) + timedelta(hours=workday[0]))
+                day_end = min(end, _day_start(day) + timedelta(hours=workday[1]))
+                if day_start < day_end:
+                    slots.extend(self.index.free(day_start, day_end, timedelta(minutes=min_minutes)))
+            return slots
+
+    def busy(self, start: datetime, end: datetime) -> list[Interval]:
+        with self._lock:
+            self._ensure(start, end)
+            return self.index.busy(start, end)
+
+
+def format_slots(slots: list[Interval]) -> str:
+    """Render free slots grouped by day, e.g. '2025-03-29: 09:00-10:30, 11:00-18:00'."""
+    by_day: dict[date, list[str]] = {}
+    for start, end in slots:
+        by_day.setdefault(start.date(), []).append(f"{start:%H:%M}-{end:%H:%M}")
+    return "\n".join(f"{day.isoformat()}: {', '.join(times)}" for day, times in by_day.items())
+
+
+@lru_cache(maxsize=256)
+def get_availability_engine(window_days: int = 28, user_id: Optional[str] = None) -> AvailabilityEngine:
+    """Return the process-wide availability engine of a user's primary calendar."""
+    return AvailabilityEngine(lambda: get_calendar_service(user_id), window_days=window_days)
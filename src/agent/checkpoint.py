@@ -0,0 +1,482 @@
+"""Durable SQLite checkpointer for resumable email processing.
+
+`SqliteCheckpointer` saves the graph state after every step to a local SQLite
+database in WAL mode, so a worker that dies mid-run resumes from its last step
+instead of processing the email again:
+
+- Channel values are stored once per version, so a step only writes the
+  channels it changed. Values are serialized with msgpack and compressed with
+  zlib above `compress_min_bytes` (a message history shrinks about 10x).
+- Writes are buffered and committed together by a background thread every
+  `flush_interval_ms`, so the steps of concurrent runs share one transaction.
+  Reads flush the buffer first. A crash loses at most the last interval,
+  whose steps run again on resume.
+- Side-effecting tools claim their tool call in a ledger kept in the same
+  database (`ToolCallLedger`) before acting. A step that runs again after a
+  crash returns the recorded result instead of sending the same email or
+  creating the same meeting twice.
+"""
+
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from langgraph.constants import CONFIG_KEY_CHECKPOINTER
+
+from agent.io_pool import run_io
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT, type TEXT NOT NULL, checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL, metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL,
+    type TEXT NOT NULL, blob BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT NOT NULL, value BLOB NOT NULL, task_path TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS tool_calls (
+    key TEXT PRIMARY KEY, tool TEXT NOT NULL, result TEXT, created_at REAL NOT NULL
+);
+"""
+
+COMPRESSED = "+zlib"
+
+
+class ToolCallLedger:
+    """Results of side-effecting tool calls, keyed by thread and tool call id.
+
+    A call is claimed before the tool acts and completed with its result. A
+    claimed call that never completed was interrupted by a crash after it may
+    have acted, so it is not repeated either.
+
+    Args:
+        conn (sqlite3.Connection): The database of the checkpointer.
+        lock (threading.Lock): Serializes the use of the connection.
+        flush (Callable): Commits the buffered checkpoints before a call is
+            claimed, so the tool call being made is durable before it acts.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock, flush: Callable[[], None] = lambda: None):
+        self._conn = conn
+        self._lock = lock
+        self._flush = flush
+
+    @staticmethod
+    def key(config: RunnableConfig, tool_call_id: str) -> str:
+        thread_id = (config.get("configurable") or {}).get("thread_id", "")
+        return f"{thread_id}:{tool_call_id}"
+
+    def claim(self, key: str, tool: str) -> tuple[bool, Optional[str]]:
+        """Claim a call; returns (claimed, recorded result of an earlier claim)."""
+        self._flush()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO tool_calls (key, tool, result, created_at) VALUES (?, ?, NULL, ?)",
+                (key, tool, time.time()),
+            )
+            if cursor.rowcount == 1:
+                return True, None
+            (result,) = self._conn.execute("SELECT result FROM tool_calls WHERE key = ?", (key,)).fetchone()
+            return False, result
+
+    def complete(self, key: str, result: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE tool_calls SET result = ? WHERE key = ?", (result, key))
+
+    def release(self, key: str) -> None:
+        """Drop the claim of a call that failed, so it can be tried again."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tool_calls WHERE key = ? AND result IS NULL", (key,))
+
+    @staticmethod
+    def _replayed(tool: str, result: Optional[str]) -> str:
+        logger.info("Not repeating %s call already made before a restart", tool)
+        if result is not None:
+            return result
+        return f"{tool} was already started for this request before a restart; it was not repeated."
+
+    def run(self, key: str, tool: str, action: Callable[[], str]) -> str:
+        """Run `action` unless the call was already made; return its result."""
+        claimed, result = self.claim(key, tool)
+        if not claimed:
+            return self._replayed(tool, result)
+        try:
+            result = action()
+        except Exception:
+            self.release(key)
+            raise
+        self.complete(key, result)
+        return result
+
+    async def arun(self, key: str, tool: str, action: Callable[[], Awaitable[str]], max_workers: int = 16) -> str:
+        """Async version of `run`; the ledger is updated on the I/O pool."""
+        claimed, result = await run_io(self.claim, key, tool, max_workers=max_workers)
+        if not claimed:
+            return self._replayed(tool, result)
+        try:
+            result = await action()
+        except Exception:
+            await run_io(self.release, key, max_workers=max_workers)
+            raise
+        await run_io(self.complete, key, result, max_workers=max_workers)
+        return result
+
+
+def get_ledger(config: RunnableConfig) -> Optional[ToolCallLedger]:
+    """The tool call ledger of the checkpointer of the current run, if durable."""
+    checkpointer = (config.get("configurable") or {}).get(CONFIG_KEY_CHECKPOINTER)
+    return getattr(checkpointer, "ledger", None)
+
+
+class SqliteCheckpointer(BaseCheckpointSaver[str]):
+    """LangGraph checkpointer on a local SQLite database in WAL mode.
+
+    Args:
+        path (str): Path of the database file.
+        flush_interval_ms (int): How long writes are buffered before being
+            committed together. 0 commits every write immediately.
+        max_pending (int): Commit as soon as this many writes are buffered.
+        compress_min_bytes (int): Compress serialized values at least this big.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval_ms: int = 20,
+        max_pending: int = 500,
+        compress_min_bytes: int = 512,
+    ):
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.compress_min_bytes = compress_min_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode, NORMAL survives a crash of the process (not of the OS)
+        # without an fsync per commit
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending: list[tuple[str, tuple]] = []
+        self._closed = False
+        self.commits = 0
+        self.ledger = ToolCallLedger(self._conn, self._db_lock, self.flush)
+        self._writer = None
+        if self.flush_interval > 0:
+            self._writer = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+            self._writer.start()
+
+    # Serialization
+
+    def _dumps(self, value: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) >= self.compress_min_bytes:
+            return type_ + COMPRESSED, zlib.compress(data, 1)
+        return type_, data
+
+    def _loads(self, type_: str, data: bytes) -> Any:
+        if type_.endswith(COMPRESSED):
+            type_, data = type_[: -len(COMPRESSED)], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    # Batched writes
+
+    def _enqueue(self, statements: list[tuple[str, tuple]]) -> None:
+        if self._writer is None:
+            with self._db_lock, self._conn:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self.commits += 1
+            return
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The checkpointer is closed")
+            was_empty = not self._pending
+            self._pending.extend(statements)
+            if was_empty or len(self._pending) >= self.max_pending:
+                self._cond.notify_all()
+
+    def flush(self) -> None:
+        """Commit the buffered writes."""
+        with self._db_lock:
+            with self._cond:
+                statements, self._pending = self._pending, []
+            if not statements:
+                return
+            with self._conn:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+            self.commits += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                # Let the other runs of this interval add their writes
+                if len(self._pending) < self.max_pending and not self._closed:
+                    self._cond.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to commit checkpoints to %s", self.path)
+
+    def close(self) -> None:
+        """Commit the buffered writes and stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+
+    # Reads
+
+    def _query(self, sql: str, params: tuple) -> list[tuple]:
+        self.flush()
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint_data, metadata_type, metadata_data = row
+        checkpoint: Checkpoint = self._loads(type_, checkpoint_data)
+        versions = checkpoint["channel_versions"]
+        values = {}
+        if versions:
+            blobs = self._query(
+                "SELECT channel, type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                f"AND (channel, version) IN (VALUES {','.join(['(?, ?)'] * len(versions))})",
+                (thread_id, checkpoint_ns, *(str(part) for item in versions.items() for part in item)),
+            )
+            for channel, blob_type, blob in blobs:
+                if blob_type != "empty":
+                    values[channel] = self._loads(blob_type, blob)
+        writes = self._query(
+            "SELECT task_id, channel, type, value, task_path, idx FROM writes WHERE thread_id = ? "
+            "AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        writes.sort(key=lambda write: writes_sort_key(write[4], write[0], write[5]))
+        return CheckpointTuple(
+            config={
+                "configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}
+            },
+            checkpoint={**checkpoint, "channel_values": values},
+            metadata=self._loads(metadata_type, metadata_data),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, self._loads(t, value)) for task_id, channel, t, value, *_ in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        if checkpoint_id := get_checkpoint_id(config):
+            rows = self._query(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+        else:
+            rows = self._query(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            )
+        if not rows:
+            return None
+        return self._tuple(thread_id, checkpoint_ns, rows[0])
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        where, params = [], []
+        if config is not None:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        rows = self._query(
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            f"FROM checkpoints {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY checkpoint_id DESC",
+            tuple(params),
+        )
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            item = self._tuple(thread_id, checkpoint_ns, tuple(row))
+            if filter and not all(item.metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    # Writes
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        statements = []
+        for channel, version in new_versions.items():
+            type_, blob = self._dumps(values[channel]) if channel in values else ("empty", b"")
+            statements.append((
+                "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, blob) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, channel, str(version), type_, blob),
+            ))
+        type_, data = self._dumps(checkpoint)
+        metadata_type, metadata_data = self._dumps(get_checkpoint_metadata(config, metadata))
+        statements.append((
+            "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "type, checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                type_, data, metadata_type, metadata_data,
+            ),
+        ))
+        self._enqueue(statements)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"])
+        statements = []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            # Special writes (errors, interrupts) replace the previous ones; a
+            # regular write is kept from its first save
+            verb = "INSERT OR REPLACE" if idx < 0 else "INSERT OR IGNORE"
+            type_, data = self._dumps(value)
+            statements.append((
+                f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, "
+                "task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, task_id, idx, channel, type_, data, task_path),
+            ))
+        self._enqueue(statements)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.flush()
+        with self._db_lock, self._conn:
+            for table in ("checkpoints", "blobs", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM tool_calls WHERE key LIKE ?", (f"{thread_id}:%",))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # Async versions: buffering a write is cheap, reads run on the I/O pool
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await run_io(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await run_io(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await run_io(self.delete_thread, thread_id)
+
+
+def create_checkpointer(path: str, **kwargs: Any) -> SqliteCheckpointer:
+    """Open (or create) the checkpoint database at `path`."""
+    return SqliteCheckpointer(path, **kwargs)
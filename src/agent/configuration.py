@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, fields, field
-from typing import Optional
+from typing import Literal, Optional
 
 from langchain_core.runnables import RunnableConfig
 
@@ -22,6 +22,237 @@ class Configuration:
             "description": "The user ID for the LangGraph user. This is used to identify the user in the system."
         },
     )
+    tenants_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "description": "Directory of per-user profile and instructions files (<user_id>.json). "
+            "Every user gets the default profile if unset."
+        },
+    )
+    max_cached_tenants: int = field(
+        default=256,
+        metadata={"description": "Number of recently active users whose profile is kept in memory."},
+    )
+    intake_mode: Literal["fused", "staged"] = field(
+        default="staged",
+        metadata={
+            "description": "How received messages are processed before the response agent. "
+            "'fused' detects, parses and triages the email in a single model call, "
+            "'staged' uses the separate detect_email and triage_router nodes."
+        },
+    )
+
+    deterministic_parsing: bool = field(
+        default=True,
+        metadata={
+            "description": "Parse well-formed raw emails (From/To/Subject headers) with the standard library "
+            "and only fall back to the LLM parser when that fails."
+        },
+    )
+
+    thread_preprocessing: bool = field(
+        default=True,
+        metadata={
+            "description": "Strip quoted history and signatures from email bodies before triage, "
+            "and summarize the history of long threads."
+        },
+    )
+    thread_summarize_min_tokens: int = field(
+        default=1500,
+        metadata={"description": "Thread histories longer than this are summarized; shorter ones are kept verbatim."},
+    )
+    thread_chunk_tokens: int = field(
+        default=1500,
+        metadata={"description": "Size of the history chunks summarized in parallel."},
+    )
+    thread_summary_max_tokens: int = field(
+        default=600,
+        metadata={"description": "Maximum size of the summary of a thread's history."},
+    )
+    thread_summary_cache_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "description": "Path of a SQLite cache of thread summaries keyed by Message-ID. "
+            "Summaries are cached in memory if unset."
+        },
+    )
+
+    classification_cache: Literal["memory", "sqlite", "none"] = field(
+        default="memory",
+        metadata={
+            "description": "Where triage classifications are cached: 'memory' for a process-local LRU cache, "
+            "'sqlite' for an on-disk cache that survives restarts, 'none' to disable caching."
+        },
+    )
+    classification_cache_path: str = field(
+        default=".cache/classification_cache.sqlite",
+        metadata={"description": "Path of the SQLite classification cache."},
+    )
+    classification_cache_max_entries: int = field(
+        default=10_000,
+        metadata={"description": "Maximum number of cached classifications before the least recently used are evicted."},
+    )
+    classification_cache_ttl_seconds: Optional[float] = field(
+        default=7 * 24 * 3600,
+        metadata={"description": "How long a cached classification stays valid. None keeps entries until evicted."},
+    )
+
+    preclassifier: bool = field(
+        default=True,
+        metadata={
+            "description": "Classify obvious emails (mailing lists, no-reply senders, CI notifications) "
+            "with header rules and a small local model before calling the triage model."
+        },
+    )
+    preclassifier_threshold: float = field(
+        default=0.9,
+        metadata={"description": "Minimum confidence for a pre-classifier result to skip the triage model."},
+    )
+    preclassifier_model_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "description": "Path of a trained pre-classifier model (JSON), or of a directory of per-user models "
+            "(<user_id>.json). Only header rules are used if unset, or if the user has no model in the directory."
+        },
+    )
+
+    triage_examples_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "description": "Directory of the store of the user's triage corrections. When set, the most similar "
+            "corrections are shown to the triage model as few-shot examples."
+        },
+    )
+    triage_examples_k: int = field(
+        default=3,
+        metadata={"description": "Number of similar corrections shown to the triage model."},
+    )
+
+    detection_model: str = field(
+        default="ollama:gemma3:27b",
+        metadata={"description": "Model deciding whether the input is a received email (provider:model)."},
+    )
+    parsing_model: str = field(
+        default="ollama:gemma3:27b",
+        metadata={"description": "Model extracting the email details when deterministic parsing fails."},
+    )
+    triage_model: str = field(
+        default="ollama:gemma3:27b",
+        metadata={"description": "Model classifying emails."},
+    )
+    intake_model: str = field(
+        default="ollama:gemma3:27b",
+        metadata={"description": "Model of the fused intake call."},
+    )
+    response_model: str = field(
+        default="openai:gpt-4o-mini",
+        metadata={"description": "Model of the response agent."},
+    )
+    summary_model: str = field(
+        default="ollama:gemma3:27b",
+        metadata={"description": "Model summarizing the history of long email threads."},
+    )
+    cascade_model: Optional[str] = field(
+        default=None,
+        metadata={
+            "description": "Small model tried first by the structured stages (e.g. 'ollama:gemma3:4b'). "
+            "The stage model is only called when its output does not validate or its confidence is too low."
+        },
+    )
+    cascade_min_confidence: float = field(
+        default=0.7,
+        metadata={"description": "Minimum self-reported confidence for a cascade model answer to be kept."},
+    )
+    structured_output_retries: int = field(
+        default=2,
+        metadata={
+            "description": "Times a structured stage asks its model again when the answer is not valid JSON "
+            "of the schema and cannot be repaired locally."
+        },
+    )
+
+    speculative_memory_search: bool = field(
+        default=True,
+        metadata={
+            "description": "Search the user's memories for the sender and subject of an email while it is being "
+            "triaged, and give the results to the response agent if the email needs an answer."
+        },
+    )
+    speculative_memory_limit: int = field(
+        default=5,
+        metadata={"description": "Number of memories searched during triage."},
+    )
+
+    history_max_tokens: Optional[int] = field(
+        default=6000,
+        metadata={
+            "description": "Token budget of the conversation history sent to the response model. Older turns are "
+            "moved to semantic memory and replaced by a short summary. None keeps the whole history."
+        },
+    )
+    tool_output_max_tokens: int = field(
+        default=1000,
+        metadata={"description": "Tool outputs longer than this (e.g. long availability listings) are cut to their first lines."},
+    )
+
+    google_batch_window_ms: int = field(
+        default=50,
+        metadata={
+            "description": "How long Gmail/Calendar mutations wait for other tool calls of the same step "
+            "before being sent together as one batch request."
+        },
+    )
+
+    outbox_path: str = field(
+        default=".cache/outbox.sqlite",
+        metadata={
+            "description": "Path of the SQLite queue of outgoing emails, so queued emails survive a restart "
+            "and are sent by the next worker."
+        },
+    )
+    outbox_rate_per_second: float = field(
+        default=2.0,
+        metadata={"description": "Emails sent per second and account by the outbox worker, under Gmail's sending quota."},
+    )
+    outbox_burst: int = field(
+        default=10,
+        metadata={"description": "Emails an account can send at once after being idle."},
+    )
+    outbox_dedup_seconds: float = field(
+        default=600.0,
+        metadata={
+            "description": "The same email (recipient, subject and body) queued again within this many seconds "
+            "is not sent twice. 0 disables deduplication."
+        },
+    )
+    outbox_wait_seconds: float = field(
+        default=0.0,
+        metadata={
+            "description": "How long write_email waits for the email to be sent before returning. "
+            "0 returns the queued id at once."
+        },
+    )
+
+    io_max_workers: int = field(
+        default=16,
+        metadata={
+            "description": "Size of the thread pool running blocking Google API and cache calls "
+            "when the graph is invoked asynchronously."
+        },
+    )
+
+    calendar_window_days: int = field(
+        default=28,
+        metadata={"description": "Number of days of free/busy information loaded at once for availability checks."},
+    )
+    workday_start_hour: int = field(
+        default=9,
+        metadata={"description": "Start of the working day (UTC hour) used when looking for free slots."},
+    )
+    workday_end_hour: int = field(
+        default=18,
+        metadata={"description": "End of the working day (UTC hour) used when looking for free slots."},
+    )
 
     @classmethod
     def from_runnable_config(
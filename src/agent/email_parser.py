@@ -0,0 +1,145 @@
+"""Deterministic parsing of raw RFC 822 / MIME emails.
+
+Most received messages are pasted as well-formed raw emails. For those, the
+sender, recipient, subject and body can be read straight from the headers with
+the standard library instead of asking the model to extract them.
+"""
+
+import re
+from email import policy
+from email.message import EmailMessage
+from email.parser import Parser
+from email.utils import getaddresses
+from html.parser import HTMLParser
+from typing import Optional
+
+from agent.state import EmailInput
+
+# A header line at the very start of the input, e.g. "From: Alice <alice@x.com>"
+HEADER_LINE = re.compile(r"^[A-Za-z][A-Za-z0-9-]*:[ \t]*\S")
+
+REQUIRED_HEADERS = ("from", "to", "subject")
+
+
+class _HTMLText(HTMLParser):
+    """Collect the visible text of an HTML body."""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+        elif tag in ("br", "p", "div", "tr", "li"):
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def _html_to_text(html: str) -> str:
+    parser = _HTMLText()
+    parser.feed(html)
+    text = "".join(parser.parts)
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+
+def parse_headers(text: str) -> Optional[EmailMessage]:
+    """Parse the input as a raw email if it starts with a header block.
+
+    Args:
+        text (str): The received message.
+
+    Returns:
+        Optional[EmailMessage]: The parsed message, or None if the input does not
+            look like a raw email with From, To and Subject headers.
+    """
+    text = text.lstrip()
+    if not HEADER_LINE.match(text):
+        return None
+
+    try:
+        message = Parser(policy=policy.default).parsestr(text)
+    except Exception:
+        return None
+
+    for name in REQUIRED_HEADERS:
+        # Missing and repeated headers are both ambiguous
+        if len(message.get_all(name, [])) != 1:
+            return None
+    return message
+
+
+def _single_address(value: str, allow_many: bool = False) -> Optional[tuple[str, str]]:
+    addresses = [(name, addr) for name, addr in getaddresses([value]) if "@" in addr]
+    if not addresses or (len(addresses) > 1 and not allow_many):
+        return None
+    return addresses[0]
+
+
+def _body(message: EmailMessage) -> Optional[str]:
+    part = message.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return None
+    try:
+        content = part.get_content()
+    except Exception:
+        return None
+    if not isinstance(content, str):
+        return None
+    if part.get_content_subtype() == "html":
+        content = _html_to_text(content)
+    return content.strip()
+
+
+def email_from_message(message: EmailMessage) -> Optional[EmailInput]:
+    """Fill an EmailInput from an already parsed raw email.
+
+    Args:
+        message (EmailMessage): A message returned by `parse_headers`.
+
+    Returns:
+        Optional[EmailInput]: The parsed email, or None when the headers are
+            ambiguous (several senders, no address, no readable body).
+    """
+    author = _single_address(str(message["from"]))
+    # The first address is the primary recipient
+    to = _single_address(str(message["to"]), allow_many=True)
+    email_thread = _body(message)
+    if author is None or to is None or email_thread is None:
+        return None
+
+    author_name, author_email = author
+    to_name, to_email = to
+    return EmailInput(
+        author_name=author_name or author_email,
+        author_email=author_email,
+        to_name=to_name or to_email,
+        to_email=to_email,
+        subject=str(message["subject"]).strip(),
+        email_thread=email_thread,
+    )
+
+
+def parse_raw_email(text: str) -> Optional[EmailInput]:
+    """Fill an EmailInput from a raw email without calling a model.
+
+    Args:
+        text (str): The received message.
+
+    Returns:
+        Optional[EmailInput]: The parsed email, or None when the input is not a raw
+            email or its headers are ambiguous. Callers should fall back to the
+            LLM parser in that case.
+    """
+    message = parse_headers(text)
+    if message is None:
+        return None
+    return email_from_message(message)
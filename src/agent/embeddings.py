@@ -0,0 +1,265 @@
+"""Embedding service for the memory store.
+
+One process-wide `EmbeddingService` keeps the sentence-transformers model
+loaded across graph runs. Concurrent embed requests are gathered for a few
+milliseconds and run through the model in a single forward pass. Embeddings
+are cached on disk by content hash, so short-lived processes and repeated
+memories don't recompute them.
+
+The model runs on PyTorch by default. `backend="onnx"` runs it with ONNX
+Runtime, and `backend="onnx-int8"` with the int8 quantized export, which is
+the fastest on CPU. Both need `sentence-transformers[onnx]`.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Literal, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from agent.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+CACHE_PATH = ".cache/embeddings.sqlite"
+# int8 export of the model, dynamically quantized for AVX2 CPUs
+ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+
+Backend = Literal["torch", "onnx", "onnx-int8"]
+Encoder = Callable[[list[str]], np.ndarray]
+
+
+def load_encoder(model_name: str = DEFAULT_MODEL, backend: Backend = "torch") -> Encoder:
+    """Load a sentence-transformers model and return its batch encode function."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        model = SentenceTransformer(model_name, device="cpu")
+    elif backend == "onnx":
+        model = SentenceTransformer(model_name, backend="onnx")
+    else:
+        model = SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE})
+
+    def encode(texts: list[str]) -> np.ndarray:
+        return model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+    return encode
+
+
+class EmbeddingCache:
+    """SQLite cache of embeddings keyed by model and content hash."""
+
+    def __init__(self, path: str, namespace: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.namespace = namespace
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x00{text}".encode()).hexdigest()
+
+    def get_many(self, texts: list[str]) -> dict[str, np.ndarray]:
+        keys = {self.key(text): text for text in texts}
+        found = {}
+        with self._lock:
+            items = list(keys)
+            for start in range(0, len(items), 500):
+                chunk = items[start : start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[keys[key]] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def set_many(self, embeddings: dict[str, np.ndarray]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(self.key(text), np.asarray(vector, dtype=np.float32).tobytes()) for text, vector in embeddings.items()],
+            )
+
+
+@dataclass
+class EmbeddingStats:
+    """Counters of an embedding service."""
+
+    texts: int = 0
+    cache_hits: int = 0
+    encoded: int = 0
+    forward_passes: int = 0
+    encode_seconds: float = 0.0
+
+    @property
+    def embeddings_per_second(self) -> float:
+        """Model throughput, excluding cache hits."""
+        return self.encoded / self.encode_seconds if self.encode_seconds else 0.0
+
+
+@dataclass
+class _Request:
+    texts: list[str]
+    future: Future = field(default_factory=Future)
+
+
+class EmbeddingService(Embeddings):
+    """Micro-batched, disk-cached embeddings (a LangChain `Embeddings`).
+
+    Args:
+        model_name (str): sentence-transformers model.
+        backend (str): 'torch', 'onnx' or 'onnx-int8'.
+        cache_path (str, optional): SQLite file of the embedding cache, or None
+            to disable it.
+        max_batch_size (int): Maximum texts per forward pass.
+        max_wait_ms (float): How long the first request of a batch waits for
+            others.
+        encoder (Callable, optional): Batch encode function replacing the
+            model, e.g. in tests.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        backend: Backend = "torch",
+        cache_path: Optional[str] = CACHE_PATH,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        encoder: Optional[Encoder] = None,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache = EmbeddingCache(cache_path, f"{model_name}:{backend}") if cache_path else None
+        self._stats = EmbeddingStats()
+        self._encoder = encoder
+        self._encoder_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._queue: queue.Queue[_Request] = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self._worker.start()
+
+    @property
+    def encoder(self) -> Encoder:
+        with self._encoder_lock:
+            if self._encoder is None:
+                start = time.perf_counter()
+                self._encoder = load_encoder(self.model_name, self.backend)
+                logger.info("Loaded %s (%s) in %.1fs", self.model_name, self.backend, time.perf_counter() - start)
+            return self._encoder
+
+    def warm(self) -> None:
+        """Load the model and run one forward pass, e.g. at server start."""
+        self.encoder(["warm up"])
+
+    def stats(self) -> EmbeddingStats:
+        with self._stats_lock:
+            return EmbeddingStats(**vars(self._stats))
+
+    def submit(self, texts: list[str]) -> Future:
+        """Queue texts and return a future of their embeddings."""
+        request = _Request(list(texts))
+        if not request.texts:
+            request.future.set_result([])
+        else:
+            self._queue.put(request)
+        return request.future
+
+    def _collect(self) -> list[_Request]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                self._embed_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _embed_batch(self, batch: list[_Request]) -> None:
+        texts = list(dict.fromkeys(text for request in batch for text in request.texts))
+        embeddings = self.cache.get_many(texts) if self.cache is not None else {}
+        missing = [text for text in texts if text not in embeddings]
+        encode_seconds = 0.0
+        forward_passes = 0
+        if missing:
+            computed = {}
+            for start in range(0, len(missing), self.max_batch_size):
+                chunk = missing[start : start + self.max_batch_size]
+                started = time.perf_counter()
+                vectors = self.encoder(chunk)
+                encode_seconds += time.perf_counter() - started
+                forward_passes += 1
+                computed.update(zip(chunk, np.asarray(vectors, dtype=np.float32)))
+            if self.cache is not None:
+                self.cache.set_many(computed)
+            embeddings.update(computed)
+
+        with self._stats_lock:
+            total = sum(len(request.texts) for request in batch)
+            self._stats.texts += total
+            self._stats.cache_hits += len(texts) - len(missing)
+            self._stats.encoded += len(missing)
+            self._stats.forward_passes += forward_passes
+            self._stats.encode_seconds += encode_seconds
+        telemetry.count("agent_cache_requests_total", len(texts) - len(missing), cache="embedding", result="hit")
+        telemetry.count("agent_cache_requests_total", len(missing), cache="embedding", result="miss")
+        for request in batch:
+            request.future.set_result([embeddings[text].tolist() for text in request.texts])
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.submit(texts).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+@lru_cache
+def get_embedding_service(model_name: str = DEFAULT_MODEL, backend: Optional[Backend] = None) -> EmbeddingService:
+    """Return the process-wide embedding service.
+
+    The backend defaults to the `EMBEDDING_BACKEND` environment variable, or
+    'torch'.
+    """
+    return EmbeddingService(model_name, backend or os.environ.get("EMBEDDING_BACKEND", "torch"))
+
+
+async def aembed_texts(texts: list[str]) -> list[list[float]]:
+    """Embedding function of the memory store (see `langgraph.json`)."""
+    return await get_embedding_service().aembed_documents(texts)
@@ -0,0 +1,256 @@
+"""Few-shot triage examples retrieved from the user's corrections.
+
+When a user corrects a classification, the email and its correct routing are
+stored as a `TriageExample` record (not a string to parse again). Each record
+is embedded once into an `IVFIndex` (see `agent/memory_index.py`), namespaced
+per user. Before the triage model is called, `ExampleStore.nearest` finds the
+`k` most similar corrections of the user and `examples_message` renders them
+as a short message placed after the static system prompt, so the prompt
+prefix stays cacheable. Rendered snippets are cached per example.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Literal, Optional
+
+import numpy as np
+
+from agent.memory_index import IVFIndex
+from agent.state import EmailInput
+
+Classification = Literal["ignore", "respond", "notify"]
+Embed = Callable[[list[str]], np.ndarray]
+
+EXAMPLES_HEADER = "Corrected classifications of similar emails, follow them where they apply:"
+# Characters of the body kept in the embedded text and in the snippets
+EMBED_BODY_CHARACTERS = 1000
+SNIPPET_BODY_CHARACTERS = 240
+
+_TOKEN = re.compile(r"[a-z0-9@.]+")
+
+
+def hash_embed(texts: list[str], dims: int = 256) -> np.ndarray:
+    """Feature-hashed bag of words, an embedding that needs no model (tests, benchmarks)."""
+    vectors = np.zeros((len(texts), dims), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for token in _TOKEN.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=4).digest(), "little")
+            vectors[i, digest % dims] += 1.0 if digest & (1 << 31) else -1.0
+    return vectors
+
+
+def _default_embed(texts: list[str]) -> np.ndarray:
+    from agent.embeddings import get_embedding_service
+
+    return np.asarray(get_embedding_service().embed_documents(texts), dtype=np.float32)
+
+
+def _one_line(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+@dataclass(frozen=True)
+class TriageExample:
+    """A triage correction of the user.
+
+    Attributes:
+        email (EmailInput): The email that was misclassified.
+        correct (str): The classification the user wanted.
+        original (str, optional): The classification the assistant made.
+        id (str): Key of the example in the store.
+    """
+
+    email: EmailInput
+    correct: Classification
+    original: Optional[Classification] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def embedding_text(self) -> str:
+        return email_text(self.email)
+
+    def snippet(self) -> str:
+        body = _one_line(self.email.email_thread, SNIPPET_BODY_CHARACTERS)
+        correction = f" (not {self.original})" if self.original and self.original != self.correct else ""
+        return (
+            f"From: {self.email.author_name} <{self.email.author_email}>\n"
+            f"Subject: {self.email.subject}\n"
+            f"{body}\n"
+            f"Classification: {self.correct}{correction}"
+        )
+
+
+def email_text(email: EmailInput) -> str:
+    """The text of an email that is embedded to find similar examples."""
+    return f"{email.author_email} {email.subject}\n{email.email_thread[:EMBED_BODY_CHARACTERS]}"
+
+
+def _example(id: str, email: str, correct: str, original: Optional[str]) -> TriageExample:
+    return TriageExample(email=EmailInput.model_validate_json(email), correct=correct, original=original, id=id)
+
+
+class ExampleStore:
+    """Triage examples of every user, with a vector index over them.
+
+    Args:
+        path (str, optional): Directory of the records database and of the
+            vector index. A temporary directory is used if omitted.
+        embed (Callable, optional): Embeds a batch of texts; the shared
+            embedding service (`agent/embeddings.py`) by default.
+        dims (int): Dimension of the embeddings.
+        nprobe (int): Inverted lists scored by a search. Vectors are kept in
+            float32: converting float16 rows dominates the search time, and
+            there are far fewer corrections than memories.
+        min_score (float): Cosine similarity below which an example is not
+            similar enough to be shown.
+        max_snippets (int): Rendered snippets kept in memory.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        embed: Optional[Embed] = None,
+        dims: int = 384,
+        nprobe: int = 8,
+        min_score: float = 0.3,
+        max_snippets: int = 10_000,
+    ):
+        self.path = path or tempfile.mkdtemp(prefix="triage-examples-")
+        os.makedirs(self.path, exist_ok=True)
+        self.embed = embed or _default_embed
+        self.min_score = min_score
+        self.max_snippets = max_snippets
+        self.index = IVFIndex(dims, path=os.path.join(self.path, "index"), nprobe=nprobe)
+        self._lock = threading.Lock()
+        self._snippets: OrderedDict[str, str] = OrderedDict()
+        self._conn = sqlite3.connect(os.path.join(self.path, "examples.sqlite"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS examples ("
+                "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, email TEXT NOT NULL, "
+                "correct TEXT NOT NULL, original TEXT, created_at REAL NOT NULL)"
+            )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @staticmethod
+    def _namespace(user_id: str) -> tuple[str, ...]:
+        return ("examples", user_id)
+
+    def add(
+        self,
+        email: EmailInput,
+        correct: Classification,
+        original: Optional[Classification] = None,
+        user_id: str = "default",
+    ) -> TriageExample:
+        """Store a correction of the user."""
+        example = TriageExample(email=email, correct=correct, original=original)
+        self.add_many([example], user_id)
+        return example
+
+    def add_many(self, examples: list[TriageExample], user_id: str = "default") -> None:
+        """Store several examples, embedded in one batch."""
+        if not examples:
+            return
+        vectors = self.embed([example.embedding_text() for example in examples])
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO examples (id, user_id, email, correct, original, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (e.id, user_id, e.email.model_dump_json(), e.correct, e.original, now)
+                    for e in examples
+                ],
+            )
+            for example in examples:
+                self._snippets.pop(example.id, None)
+        namespace = self._namespace(user_id)
+        self.index.add_batch([(namespace, e.id, vector) for e, vector in zip(examples, vectors)])
+
+    def delete(self, example_id: str, user_id: str = "default") -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM examples WHERE id = ?", (example_id,))
+            self._snippets.pop(example_id, None)
+        self.index.delete(self._namespace(user_id), example_id)
+
+    def get(self, ids: list[str]) -> list[TriageExample]:
+        """The examples with these ids, in the same order."""
+        if not ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, email, correct, original FROM examples WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        examples = {row[0]: _example(*row) for row in rows}
+        return [examples[id] for id in ids if id in examples]
+
+    def nearest_ids(self, email: EmailInput, k: int = 3, user_id: str = "default") -> list[str]:
+        """Ids of the `k` examples of the user most similar to `email`."""
+        if k <= 0 or len(self.index) == 0:
+            return []
+        query = np.asarray(self.embed([email_text(email)]), dtype=np.float32)[0]
+        hits = self.index.search(query, self._namespace(user_id), k)
+        return [key for _, key, score in hits if score >= self.min_score]
+
+    def nearest(self, email: EmailInput, k: int = 3, user_id: str = "default") -> list[TriageExample]:
+        return self.get(self.nearest_ids(email, k, user_id))
+
+    def _snippet_texts(self, ids: list[str]) -> list[str]:
+        with self._lock:
+            cached = {id: self._snippets[id] for id in ids if id in self._snippets}
+            for id in cached:
+                self._snippets.move_to_end(id)
+        missing = [id for id in ids if id not in cached]
+        if missing:
+            rendered = {example.id: example.snippet() for example in self.get(missing)}
+            with self._lock:
+                self._snippets.update(rendered)
+                while len(self._snippets) > self.max_snippets:
+                    self._snippets.popitem(last=False)
+            cached.update(rendered)
+        return [cached[id] for id in ids if id in cached]
+
+    def examples_message(self, email: EmailInput, k: int = 3, user_id: str = "default") -> Optional[str]:
+        """The few-shot message for `email`, or None if no example is similar enough."""
+        snippets = self._snippet_texts(self.nearest_ids(email, k, user_id))
+        if not snippets:
+            return None
+        return "\n".join([EXAMPLES_HEADER, *(f"Example:\n{snippet}\n---" for snippet in snippets)])
+
+    def all(self, user_id: str = "default") -> list[TriageExample]:
+        """Every example of a user, oldest first (e.g. to train the pre-classifier)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, email, correct, original FROM examples WHERE user_id = ? ORDER BY created_at", (user_id,)
+            ).fetchall()
+        return [_example(*row) for row in rows]
+
+
+# Stores registered for a path, e.g. with a cheap embedding in benchmarks
+_registered: dict[str, ExampleStore] = {}
+
+
+def register_example_store(path: str, store: ExampleStore) -> None:
+    """Serve `triage_examples_path=path` with an already built store."""
+    _registered[path] = store
+    get_example_store.cache_clear()
+
+
+@lru_cache
+def get_example_store(path: str) -> ExampleStore:
+    """Return the process-wide example store kept in `path`."""
+    if path in _registered:
+        return _registered[path]
+    return ExampleStore(path)
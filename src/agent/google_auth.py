@@ -1,62 +1,284 @@
 import base64
+import logging
 import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import google.auth.credentials
+import google_auth_httplib2
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
 from email.mime.text import MIMEText
 from datetime import datetime, timedelta
 
+from agent.telemetry import telemetry
+from agent.tenants import safe_user_id
+
+logger = logging.getLogger(__name__)
+
 # If modifying these SCOPES, delete the token.json file.
 SCOPES = ["https://www.googleapis.com/auth/gmail.send",  "https://www.googleapis.com/auth/calendar"]
+# Mailbox ingestion (agent/ingestion.py) has a token of its own, so that the
+# tokens granted SCOPES keep refreshing without the read scope
+INGESTION_SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
 
 # Define the directory where token.json and credentials.json are stored
 CREDENTIALS_DIR = os.path.join(os.path.dirname(__file__), "agent", "credentials")
 TOKEN_PATH = "src/agent/credentials/token.json"
+INGESTION_TOKEN_PATH = "src/agent/credentials/ingestion_token.json"
 CREDENTIALS_PATH = "src/agent/credentials/credentials.json"
 
 
-def get_gmail_service():
-    
-    creds = None 
+class _RejectedTokenRequest(google_auth_httplib2.Request):
+    """Transport used by AuthorizedHttp to refresh a token the API rejected."""
 
-    print("Token path:", TOKEN_PATH , "Credentials path:", CREDENTIALS_PATH)
-    print(SCOPES)
 
-    if os.path.exists(TOKEN_PATH):
-        print("Token file exists")
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-        print("Token file loaded")
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-    
-    return build("gmail", "v1", credentials=creds)
-
-def get_calendar_service():
-    creds = None
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+class _SharedCredentials(google.auth.credentials.Credentials):
+    """Credentials view handed to every HTTP transport of a registry.
+
+    Authorization headers and refreshes go through the registry, so concurrent
+    requests share one token and refresh it at most once. Only a token rejected
+    by the API forces a refresh; other refresh calls (e.g. the one batch requests
+    make up front) just make sure the shared token is valid.
+    """
+
+    def __init__(self, registry: "ServiceRegistry"):
+        super().__init__()
+        self._registry = registry
+
+    @property
+    def valid(self):
+        creds = self._registry._creds
+        return creds is not None and creds.valid
+
+    def apply(self, headers, token=None):
+        self._registry.credentials().apply(headers, token=token)
+
+    def before_request(self, request, method, url, headers):
+        self.apply(headers)
+
+    def refresh(self, request):
+        self._registry.refresh(force=isinstance(request, _RejectedTokenRequest))
+
+
+class _AuthorizedHttp(AuthorizedHttp):
+    def __init__(self, credentials, http):
+        super().__init__(credentials, http=http)
+        self._request = _RejectedTokenRequest(self.http)
+
+    def request(self, uri, *args, **kwargs):
+        telemetry.count("agent_google_http_requests_total")
+        return super().request(uri, *args, **kwargs)
+
+
+class _ThreadLocalHttp:
+    """Transport of the API requests of a registry, resolved when a request runs.
+
+    `HttpRequest` and `BatchHttpRequest` keep the transport they were built
+    with, but requests are often built on one thread and executed on another
+    (e.g. by the mutation batcher). httplib2 transports are not thread-safe,
+    so every call goes to the transport of the thread making it.
+    """
+
+    def __init__(self, registry: "ServiceRegistry"):
+        self._registry = registry
+
+    def request(self, *args, **kwargs):
+        return self._registry.http().request(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._registry.http(), name)
+
+
+class ServiceRegistry:
+    """Process-wide Google credentials and API clients of one user.
+
+    The token is read from disk once, refreshed under a lock and written back
+    only when it changes. Built API clients are memoized per (API, version), and
+    each thread reuses its own pooled HTTP connections.
+
+    Args:
+        token_path (str): Path of the user's token.json.
+        credentials_path (str): Path of the OAuth client credentials.json.
+        scopes (list[str]): OAuth scopes requested for the token.
+        credentials (Credentials, optional): Already loaded credentials.
+        http_factory (Callable, optional): Creates the underlying httplib2
+            transport of each thread, e.g. a local fake of the Google APIs.
+    """
+
+    def __init__(
+        self,
+        token_path: str = TOKEN_PATH,
+        credentials_path: str = CREDENTIALS_PATH,
+        scopes=SCOPES,
+        credentials: Optional[Credentials] = None,
+        http_factory: Optional[Callable[[], httplib2.Http]] = None,
+    ):
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.scopes = scopes
+        self.http_factory = http_factory or (lambda: httplib2.Http(timeout=60))
+        self._creds = credentials
+        self._persisted_token = None
+        self._services = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._thread_http = _ThreadLocalHttp(self)
+
+    def _auth_request(self) -> Request:
+        if not hasattr(self._local, "auth_request"):
+            self._local.auth_request = Request()
+        return self._local.auth_request
+
+    def _persist(self) -> None:
+        token = self._creds.to_json()
+        if token == self._persisted_token:
+            return
+        logger.info("Writing refreshed Google token to %s", self.token_path)
+        if os.path.dirname(self.token_path):
+            os.makedirs(os.path.dirname(self.token_path), exist_ok=True)
+        with open(self.token_path, "w") as f:
+            f.write(token)
+        self._persisted_token = token
+
+    def credentials(self) -> Credentials:
+        """Return valid credentials, refreshing or authorizing them if needed."""
+        creds = self._creds
+        if creds is not None and creds.valid:
+            return creds
+
+        with self._lock:
+            if self._creds is None and os.path.exists(self.token_path):
+                logger.debug("Loading Google token from %s", self.token_path)
+                with open(self.token_path) as f:
+                    self._persisted_token = f.read()
+                self._creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+
+            if not self._creds or not self._creds.valid:
+                if self._creds and self._creds.expired and self._creds.refresh_token:
+                    logger.info("Refreshing expired Google token")
+                    self._creds.refresh(self._auth_request())
+                else:
+                    from google_auth_oauthlib.flow import InstalledAppFlow
+
+                    logger.warning("No valid Google token, starting the OAuth flow with %s", self.credentials_path)
+                    flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
+                    self._creds = flow.run_local_server(port=0)
+                self._persist()
+            return self._creds
+
+    def refresh(self, force: bool = False) -> None:
+        """Make sure the token is valid, refreshing it if the API rejected it.
+
+        Args:
+            force (bool): Refresh the token even if it has not expired.
+        """
+        stale_token = self._creds.token if self._creds else None
+        with self._lock:
+            # Another thread may have refreshed the token while we waited
+            if force and self._creds is not None and self._creds.token == stale_token and self._creds.refresh_token:
+                logger.info("Refreshing rejected Google token")
+                self._creds.refresh(self._auth_request())
+                self._persist()
+            else:
+                self.credentials()
+
+    def http(self) -> AuthorizedHttp:
+        """The authorized HTTP transport of the calling thread."""
+        if not hasattr(self._local, "http"):
+            self._local.http = _AuthorizedHttp(_SharedCredentials(self), http=self.http_factory())
+        return self._local.http
+
+    def _build_request(self, http, *args, **kwargs):
+        # The transport of the executing thread, not of the building one
+        from googleapiclient.http import HttpRequest
+
+        telemetry.count("agent_google_api_requests_total", method=kwargs.get("methodId") or "unknown")
+        return HttpRequest(self._thread_http, *args, **kwargs)
+
+    def service(self, api: str, version: str):
+        """Return the memoized client of a Google API."""
+        key = (api, version)
+        service = self._services.get(key)
+        if service is not None:
+            return service
+        self.credentials()
+        with self._lock:
+            if key not in self._services:
+                # The discovery client is only imported once an API is used
+                from googleapiclient.discovery import build
+
+                logger.debug("Building %s %s client", api, version)
+                self._services[key] = build(
+                    api,
+                    version,
+                    http=self._thread_http,
+                    requestBuilder=self._build_request,
+                    cache_discovery=False,
+                )
+            return self._services[key]
+
+
+# Per-user tokens (<user_id>.json, and ingestion/<user_id>.json for ingestion).
+# Without this directory the deployment has a single user, authorized by
+# TOKEN_PATH and INGESTION_TOKEN_PATH.
+TOKENS_DIR = "src/agent/credentials/tokens"
+MAX_REGISTRIES = 256
+
+_registries: OrderedDict[str, ServiceRegistry] = OrderedDict()
+_registries_lock = threading.Lock()
+
+
+def token_path_for(user_id: Optional[str] = None) -> str:
+    """Return the token file authorizing the mailbox of a user."""
+    if user_id is None or not os.path.isdir(TOKENS_DIR):
+        return TOKEN_PATH
+    return os.path.join(TOKENS_DIR, f"{safe_user_id(user_id)}.json")
+
+
+def ingestion_token_path_for(user_id: Optional[str] = None) -> str:
+    """Return the token file authorizing the ingestion of a user's mailbox."""
+    if user_id is None or not os.path.isdir(TOKENS_DIR):
+        return INGESTION_TOKEN_PATH
+    return os.path.join(TOKENS_DIR, "ingestion", f"{safe_user_id(user_id)}.json")
+
+
+def get_service_registry(token_path: str = TOKEN_PATH, scopes: list[str] = SCOPES) -> ServiceRegistry:
+    """Return the process-wide service registry of the user owning `token_path`.
+
+    The registries of the most recently active users are kept (at most
+    MAX_REGISTRIES), so idle mailboxes don't hold clients and connections.
+    `scopes` are requested when the registry is created for `token_path`.
+    """
+    with _registries_lock:
+        if token_path in _registries:
+            _registries.move_to_end(token_path)
         else:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
-    
-    return build("calendar", "v3", credentials=creds)
+            _registries[token_path] = ServiceRegistry(token_path=token_path, scopes=scopes)
+            while len(_registries) > MAX_REGISTRIES:
+                _registries.popitem(last=False)
+        return _registries[token_path]
+
+
+def set_service_registry(registry: ServiceRegistry, user_id: Optional[str] = None) -> None:
+    """Serve a user's Google APIs from `registry`, e.g. a local fake."""
+    with _registries_lock:
+        _registries[token_path_for(user_id)] = registry
+
+
+def get_gmail_service(user_id: Optional[str] = None):
+    return get_service_registry(token_path_for(user_id)).service("gmail", "v1")
+
+def get_ingestion_gmail_service(user_id: Optional[str] = None):
+    """The Gmail client of mailbox ingestion, authorized with INGESTION_SCOPES."""
+    return get_service_registry(ingestion_token_path_for(user_id), INGESTION_SCOPES).service("gmail", "v1")
+
+def get_calendar_service(user_id: Optional[str] = None):
+    return get_service_registry(token_path_for(user_id)).service("calendar", "v3")
 
 def create_message(to, subject, content):
     message = MIMEText(content)
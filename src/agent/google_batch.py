@@ -0,0 +1,205 @@
+"""Coalescing of Gmail and Calendar mutations into batch HTTP requests.
+
+When the agent sends several emails or creates several events in one step, the
+tool calls run concurrently and each would be its own `.execute()` round trip.
+`MutationBatcher` collects the requests issued within a short window and sends
+them together to the API's batch endpoint, fanning the results back to each
+caller. Rate-limited (429) and server (5xx) failures are retried with
+exponential backoff.
+
+Network errors are retried only for idempotent requests (GET, PUT, DELETE).
+A send whose connection failed may have been delivered, and sending it again
+could deliver it twice, so it fails instead; the outbox records it as failed
+rather than sending it again.
+"""
+
+import logging
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlparse
+
+import httplib2
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest, HttpRequest
+
+from agent.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Methods whose requests can be sent again after a network error without effect
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+
+# Gmail and Calendar both accept up to 50 requests per batch
+MAX_BATCH_SIZE = 50
+
+
+@dataclass
+class _Pending:
+    request: HttpRequest
+    future: Future
+    attempt: int = 0
+    group: Optional[str] = None
+
+
+def batch_uri(request: HttpRequest) -> str:
+    """The batch endpoint of the API a request belongs to.
+
+    `https://gmail.googleapis.com/gmail/v1/users/me/messages/send` is batched
+    through `https://gmail.googleapis.com/batch/gmail/v1`.
+    """
+    parsed = urlparse(request.uri)
+    api, version = parsed.path.strip("/").split("/")[:2]
+    return f"{parsed.scheme}://{parsed.netloc}/batch/{api}/{version}"
+
+
+def _is_retryable(error: Exception, idempotent: bool = True) -> bool:
+    """Whether a request failing with `error` can be sent again.
+
+    Args:
+        error (Exception): The error of the request.
+        idempotent (bool): Whether sending the request twice has the effect of
+            sending it once. Network errors are only retried if it is.
+    """
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES
+    return idempotent and isinstance(error, (httplib2.HttpLib2Error, OSError))
+
+
+def is_idempotent(request: HttpRequest) -> bool:
+    return request.method.upper() in IDEMPOTENT_METHODS
+
+
+class MutationBatcher:
+    """Send API requests issued within a short window as one batch request.
+
+    Args:
+        window (float): Seconds to wait for more requests after the first one.
+        max_batch_size (int): Requests per batch; a full batch is sent at once.
+        max_retries (int): Retries of a request failing with 429 or 5xx, or
+            of an idempotent request failing with a network error.
+        backoff_base (float): Delay before the first retry, doubled on each retry.
+        backoff_max (float): Upper bound of the retry delay.
+    """
+
+    def __init__(
+        self,
+        window: float = 0.05,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 16.0,
+    ):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batches_sent = 0
+        self.retries = 0
+        self._queues: dict[tuple[str, Optional[str]], list[_Pending]] = defaultdict(list)
+        self._timers: dict[tuple[str, Optional[str]], threading.Timer] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, request: HttpRequest, group: Optional[str] = None) -> Future:
+        """Queue a request and return a future of its response.
+
+        Only requests of the same group (e.g. the same user) share a batch.
+        """
+        item = _Pending(request=request, future=Future(), group=group)
+        self._enqueue(item)
+        return item.future
+
+    def execute(self, request: HttpRequest, timeout: Optional[float] = None, group: Optional[str] = None) -> dict:
+        """Queue a request and wait for its response, like `request.execute()`."""
+        return self.submit(request, group).result(timeout=timeout)
+
+    def flush(self) -> None:
+        """Send all queued requests now."""
+        with self._lock:
+            keys = list(self._queues)
+        for key in keys:
+            self._flush(key)
+
+    def _enqueue(self, item: _Pending) -> None:
+        key = (batch_uri(item.request), item.group)
+        with self._lock:
+            queue = self._queues[key]
+            queue.append(item)
+            if len(queue) >= self.max_batch_size:
+                flush_now = True
+            else:
+                flush_now = False
+                if key not in self._timers:
+                    timer = threading.Timer(self.window, self._flush, args=(key,))
+                    timer.daemon = True
+                    self._timers[key] = timer
+                    timer.start()
+        if flush_now:
+            threading.Thread(target=self._flush, args=(key,), daemon=True).start()
+
+    def _flush(self, key: tuple[str, Optional[str]]) -> None:
+        with self._lock:
+            timer = self._timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+            items = self._queues.pop(key, [])
+        for start in range(0, len(items), self.max_batch_size):
+            self._send(key[0], items[start:start + self.max_batch_size])
+
+    def _send(self, uri: str, items: list[_Pending]) -> None:
+        if not items:
+            return
+        self.batches_sent += 1
+
+        if len(items) == 1:
+            item = items[0]
+            try:
+                item.future.set_result(item.request.execute())
+            except Exception as e:
+                self._retry_or_fail(item, e)
+            return
+
+        def callback(request_id, response, exception):
+            item = items[int(request_id)]
+            if exception is None:
+                item.future.set_result(response)
+            else:
+                self._retry_or_fail(item, exception)
+
+        batch = BatchHttpRequest(callback=callback, batch_uri=uri)
+        for index, item in enumerate(items):
+            batch.add(item.request, request_id=str(index))
+        logger.debug("Sending %d requests to %s", len(items), uri)
+        try:
+            batch.execute()
+        except Exception as e:
+            # Requests of a batch that failed as a whole are retried under
+            # the rules of each: a network error may come after the sends
+            for item in items:
+                if not item.future.done():
+                    self._retry_or_fail(item, e)
+
+    def _retry_or_fail(self, item: _Pending, error: Exception) -> None:
+        if not _is_retryable(error, is_idempotent(item.request)) or item.attempt >= self.max_retries:
+            item.future.set_exception(error)
+            return
+        delay = min(self.backoff_max, self.backoff_base * 2 ** item.attempt) * random.uniform(0.5, 1.0)
+        item.attempt += 1
+        self.retries += 1
+        telemetry.count("agent_google_api_retries_total", method=item.request.methodId)
+        logger.warning("Retrying %s in %.2fs after: %s", item.request.methodId, delay, error)
+        timer = threading.Timer(delay, self._enqueue, args=(item,))
+        timer.daemon = True
+        timer.start()
+
+
+@lru_cache
+def get_mutation_batcher(window_ms: int = 50) -> MutationBatcher:
+    """Return the process-wide batcher for a batching window."""
+    return MutationBatcher(window=window_ms / 1000)
@@ -1,224 +1,615 @@
-"""Define a simple chatbot agent.
+"""The email assistant graph.
 
-This agent returns a predefined response without using an actual LLM.
+`build_email_agent` compiles the pipeline a message goes through:
+
+- intake: decide whether the message is a received email or a request from
+  the user, and parse the email. This is either one fused model call
+  (`intake`) or the staged `detect_email` and parsing calls, with raw
+  RFC 822 emails parsed without a model.
+- triage (`triage_router`): classify the email as ignore, notify or respond.
+  It uses the classification cache, the pre-classifier, the user's past
+  corrections as examples, and a summary of long threads.
+- response (`response_agent`): a ReAct agent with the Gmail, Calendar and
+  memory tools that answers emails and requests.
+
+Every node and tool has a sync and an async implementation.
 """
-from datetime import datetime, timedelta
-from typing import Literal
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from functools import lru_cache, wraps
+from typing import Annotated, Awaitable, Callable, Literal, Optional
 
 from langgraph.graph import StateGraph, END, START
 from langgraph.types import Command
 
-from langchain.chat_models import init_chat_model
-from agent.utils import load_chatollama_model
-from langgraph.prebuilt import create_react_agent
-from agent.state import State, Router, email_detection, EmailInput
-from agent.google_auth import get_gmail_service, get_calendar_service, create_message
-from agent.prompts import triage_system_prompt, triage_user_prompt, prompt_instructions, profile, agent_system_prompt_memory
-from langmem import create_manage_memory_tool, create_search_memory_tool # type: ignore
-from langchain_core.tools import tool
+from agent.cache import get_classification_cache
+from agent.checkpoint import ToolCallLedger, create_checkpointer, get_ledger
+from agent.configuration import Configuration
+from agent.email_parser import email_from_message, parse_headers
+from agent.history import amanage_history, manage_history, propagate
+from agent.preclassifier import get_preclassifier
+from agent.speculation import astart_memory_search, atake_memories, start_memory_search, take_memories
+from agent.state import State, Router, email_detection, EmailInput, EmailIntake
+from agent.io_pool import run_io
+from agent.models import get_chat_model, get_stage_model, model_stats
+from agent.prompt_cache import prompt_cache
+from agent.prompts import triage_user_prompt
+from agent.telemetry import traced
+from agent.tenants import Tenant, get_tenant
+from agent.threads import get_thread_preprocessor
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import var_child_runnable_config
+from langchain_core.tools import InjectedToolCallId, StructuredTool
 from dotenv import load_dotenv
 
 
 
 _ = load_dotenv()
 
-llm = init_chat_model("openai:gpt-4o-mini")
+logger = logging.getLogger(__name__)
 
-#llm = load_chatollama_model()
-gemma3 = load_chatollama_model()
-llm_router = gemma3.with_structured_output(Router)
-llm_detection = gemma3.with_structured_output(email_detection)
-llm_parser = gemma3.with_structured_output(EmailInput)
+# The Google client libraries are imported by the first tool call rather than
+# with the graph, so workers that never touch Gmail or Calendar start faster.
+def _mutation_batcher(configuration: Configuration):
+    from agent.google_batch import get_mutation_batcher
 
+    return get_mutation_batcher(configuration.google_batch_window_ms)
 
-@tool
-def write_email(to: str, subject: str, content: str) -> str:
-    """Write and send an email using Gmail API."""
-    service = get_gmail_service()
-    message = create_message(to, subject, content)
-    send_message = service.users().messages().send(userId="me", body=message).execute()
-    return f"Email sent to {to} with subject '{subject}'. Message ID: {send_message['id']}"
 
-@tool
-def schedule_meeting(attendees: list[str], subject: str, duration_minutes: int, preferred_day: str) -> str:
-    """Schedule a calendar meeting."""
-    service = get_calendar_service()
-    
+def _availability_engine(configuration: Configuration):
+    from agent.calendar_availability import get_availability_engine
+
+    return get_availability_engine(configuration.calendar_window_days, configuration.langgraph_user_id)
+
+
+def _outbox(configuration: Configuration):
+    from agent.outbox import get_outbox
+
+    return get_outbox(configuration)
+
+
+def _meeting_request(attendees: list[str], subject: str, duration_minutes: int, preferred_day: str, user_id: Optional[str] = None):
+    from agent.google_auth import get_calendar_service
+
+    service = get_calendar_service(user_id)
+
     start_time = datetime.strptime(preferred_day, "%Y-%m-%d")
     end_time = start_time + timedelta(minutes=duration_minutes)
-    
+
     event = {
         "summary": subject,
         "start": {"dateTime": start_time.isoformat(), "timeZone": "UTC"},
         "end": {"dateTime": end_time.isoformat(), "timeZone": "UTC"},
         "attendees": [{"email": email} for email in attendees],
     }
-    
-    event_result = service.events().insert(calendarId="primary", body=event).execute()
-    return f"Meeting '{subject}' scheduled on {preferred_day} with {len(attendees)} attendees. Event ID: {event_result['id']}"
-
-@tool
-def check_calendar_availability(day: str) -> str:
-    """Check calendar availability for a given day."""
-    service = get_calendar_service()
-    
-    start_time = datetime.strptime(day, "%Y-%m-%d").isoformat() + "Z"
-    end_time = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).isoformat() + "Z"
-    
-    events_result = service.events().list(
-        calendarId="primary",
-        timeMin=start_time,
-        timeMax=end_time,
-        singleEvents=True,
-        orderBy="startTime"
-    ).execute()
-    
-    events = events_result.get("items", [])
-    if not events:
-        return f"No events found for {day}. You are available all day."
-    
-    available_times = []
-    busy_times = [(event["start"].get("dateTime", event["start"].get("date"))) for event in events]
-    
-    return f"Busy times on {day}: {', '.join(busy_times)}" if busy_times else f"No busy times on {day}."
-
-
-
-manage_memory_tool = create_manage_memory_tool(
-    namespace=(
-        "email_assistant", 
-        "lance",
-        "collection"
-    )
-)
 
+    request = service.events().insert(calendarId="primary", body=event)
+    return request, start_time.replace(tzinfo=timezone.utc), end_time.replace(tzinfo=timezone.utc)
 
-search_memory_tool = create_search_memory_tool(
-    namespace=(
-        "email_assistant",
-        "lance",
-        "collection"
-    )
 
-)
+def _availability_range(day: str, end_day: Optional[str]) -> tuple[datetime, datetime]:
+    start_time = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    end_time = datetime.strptime(end_day or day, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+    return start_time, end_time
 
-def create_prompt(state):
-    return [
-        {
-            "role": "system", 
-            "content": agent_system_prompt_memory.format(
-                instructions=prompt_instructions["agent_instructions"], 
-                **profile
-            )
-        }
-    ] + state['messages']
 
+def _format_availability(slots: list, day: str, end_day: Optional[str], min_duration_minutes: int) -> str:
+    from agent.calendar_availability import format_slots
 
-tools= [
-    write_email, 
-    schedule_meeting,
-    check_calendar_availability,
-    manage_memory_tool,
-    search_memory_tool
-]
-response_agent = create_react_agent(
-    llm,
-    tools=tools,
-    prompt=create_prompt)
+    period = day if end_day is None else f"{day} to {end_day}"
+    if not slots:
+        return f"No free slots of {min_duration_minutes} minutes or more on {period}."
+    return f"Free slots (UTC) on {period}:\n{format_slots(slots)}"
 
 
+def _once(config: RunnableConfig, tool_call_id: str, tool: str, action: Callable[[], str]) -> str:
+    """Run a side-effecting tool call at most once per thread, if the run is checkpointed."""
+    ledger = get_ledger(config)
+    if ledger is None:
+        return action()
+    return ledger.run(ToolCallLedger.key(config, tool_call_id), tool, action)
 
-def detect_email(state: State) -> Command[Literal["triage_router", "response_agent"]]:
 
-    last_message = state["messages"][-1].content
+async def _aonce(
+    config: RunnableConfig, tool_call_id: str, tool: str, action: Callable[[], Awaitable[str]], max_workers: int
+) -> str:
+    """Async version of `_once`."""
+    ledger = get_ledger(config)
+    if ledger is None:
+        return await action()
+    return await ledger.arun(ToolCallLedger.key(config, tool_call_id), tool, action, max_workers=max_workers)
 
 
-    result = llm_detection.invoke(
-        [
-            {"role": "system", "content": "Your job is to decide if the user have recieved an email and wanted to managed, or the user have another request(question, demand to sent an email, ..ect)."},
-            {"role": "user", "content": last_message},
-        ]
+def _email_status(entry) -> str:
+    if entry.status == "sent":
+        return f"Email sent to {entry.to} with subject '{entry.subject}'. Message ID: {entry.message_id}"
+    if entry.status == "failed":
+        return f"Email to {entry.to} with subject '{entry.subject}' could not be sent: {entry.error}"
+    already = " It was already queued earlier and will not be sent twice." if entry.duplicate else ""
+    return f"Email to {entry.to} with subject '{entry.subject}' queued for sending. Queued ID: {entry.id}.{already}"
+
+
+@traced("tool", "write_email")
+def _write_email(
+    to: str, subject: str, content: str, config: RunnableConfig, tool_call_id: Annotated[str, InjectedToolCallId]
+) -> str:
+    """Write and send an email using Gmail API."""
+    configuration = Configuration.from_runnable_config(config)
+    user_id = configuration.langgraph_user_id
+
+    def send() -> str:
+        outbox = _outbox(configuration)
+        entry = outbox.enqueue(user_id, to, subject, content, configuration.outbox_dedup_seconds)
+        if configuration.outbox_wait_seconds > 0 and not entry.done:
+            entry = outbox.wait(entry.id, configuration.outbox_wait_seconds)
+        return _email_status(entry)
+
+    return _once(config, tool_call_id, "write_email", send)
+
+
+@traced("tool", "write_email")
+async def _awrite_email(
+    to: str, subject: str, content: str, config: RunnableConfig, tool_call_id: Annotated[str, InjectedToolCallId]
+) -> str:
+    """Write and send an email using Gmail API."""
+    configuration = Configuration.from_runnable_config(config)
+    user_id = configuration.langgraph_user_id
+    max_workers = configuration.io_max_workers
+
+    async def send() -> str:
+        outbox = _outbox(configuration)
+        entry = await run_io(
+            outbox.enqueue, user_id, to, subject, content, configuration.outbox_dedup_seconds, max_workers=max_workers
+        )
+        if configuration.outbox_wait_seconds > 0 and not entry.done:
+            future = await run_io(outbox.future, entry.id, max_workers=max_workers)
+            try:
+                entry = await asyncio.wait_for(asyncio.wrap_future(future), configuration.outbox_wait_seconds)
+            except asyncio.TimeoutError:
+                entry = await run_io(outbox.get, entry.id, max_workers=max_workers)
+        return _email_status(entry)
+
+    return await _aonce(config, tool_call_id, "write_email", send, max_workers)
+
+
+@traced("tool", "schedule_meeting")
+def _schedule_meeting(
+    attendees: list[str], subject: str, duration_minutes: int, preferred_day: str, config: RunnableConfig,
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> str:
+    """Schedule a calendar meeting."""
+    configuration = Configuration.from_runnable_config(config)
+    user_id = configuration.langgraph_user_id
+
+    def schedule() -> str:
+        request, start_time, end_time = _meeting_request(attendees, subject, duration_minutes, preferred_day, user_id)
+        event_result = _mutation_batcher(configuration).execute(request, group=user_id)
+        _availability_engine(configuration).add_busy(start_time, end_time)
+        return f"Meeting '{subject}' scheduled on {preferred_day} with {len(attendees)} attendees. Event ID: {event_result['id']}"
+
+    return _once(config, tool_call_id, "schedule_meeting", schedule)
+
+
+@traced("tool", "schedule_meeting")
+async def _aschedule_meeting(
+    attendees: list[str], subject: str, duration_minutes: int, preferred_day: str, config: RunnableConfig,
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> str:
+    """Schedule a calendar meeting."""
+    configuration = Configuration.from_runnable_config(config)
+    user_id = configuration.langgraph_user_id
+
+    async def schedule() -> str:
+        request, start_time, end_time = await run_io(
+            _meeting_request, attendees, subject, duration_minutes, preferred_day, user_id,
+            max_workers=configuration.io_max_workers,
+        )
+        batcher = _mutation_batcher(configuration)
+        event_result = await asyncio.wrap_future(batcher.submit(request, user_id))
+        engine = _availability_engine(configuration)
+        await run_io(engine.add_busy, start_time, end_time, max_workers=configuration.io_max_workers)
+        return f"Meeting '{subject}' scheduled on {preferred_day} with {len(attendees)} attendees. Event ID: {event_result['id']}"
+
+    return await _aonce(config, tool_call_id, "schedule_meeting", schedule, configuration.io_max_workers)
+
+
+@traced("tool", "check_calendar_availability")
+def _check_calendar_availability(day: str, config: RunnableConfig, min_duration_minutes: int = 30, end_day: Optional[str] = None) -> str:
+    """Check calendar availability for a given day, or from day to end_day (inclusive).
+
+    Returns the free slots of at least min_duration_minutes within working hours.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    engine = _availability_engine(configuration)
+    slots = engine.free_slots(
+        *_availability_range(day, end_day),
+        min_minutes=min_duration_minutes,
+        workday=(configuration.workday_start_hour, configuration.workday_end_hour),
     )
+    return _format_availability(slots, day, end_day, min_duration_minutes)
+
+
+@traced("tool", "check_calendar_availability")
+async def _acheck_calendar_availability(day: str, config: RunnableConfig, min_duration_minutes: int = 30, end_day: Optional[str] = None) -> str:
+    """Check calendar availability for a given day, or from day to end_day (inclusive).
+
+    Returns the free slots of at least min_duration_minutes within working hours.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    engine = _availability_engine(configuration)
+    slots = await run_io(
+        engine.free_slots,
+        *_availability_range(day, end_day),
+        min_minutes=min_duration_minutes,
+        workday=(configuration.workday_start_hour, configuration.workday_end_hour),
+        max_workers=configuration.io_max_workers,
+    )
+    return _format_availability(slots, day, end_day, min_duration_minutes)
 
-    if result.email_found == True:
-        print("📧 Email recieved in the input.")
-        goto = "triage_router"
-        update = None
-    else:
-        print("🚫 Other request.")
-        goto = "response_agent"
-        update = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"{last_message}",
-                }
-            ]
-        }
-    
-    return Command(goto=goto, update=update)
 
+# Each tool has a sync and a native async implementation, so `ainvoke` never
+# blocks the event loop on a Google round trip. Tools that send or create
+# something take the id of the model's tool call, which makes them idempotent
+# across a resumed run (see `agent/checkpoint.py`). Emails are queued in the
+# outbox, which rate limits and deduplicates them (see `agent/outbox.py`).
+write_email = StructuredTool.from_function(func=_write_email, coroutine=_awrite_email, name="write_email")
+schedule_meeting = StructuredTool.from_function(
+    func=_schedule_meeting, coroutine=_aschedule_meeting, name="schedule_meeting"
+)
+check_calendar_availability = StructuredTool.from_function(
+    func=_check_calendar_availability, coroutine=_acheck_calendar_availability, name="check_calendar_availability"
+)
 
 
-def triage_router(state: State) -> Command[
-    Literal["response_agent"]
-]:
 
-    last_message = state["messages"][-1].content
+
+def _with_user_id(func: Callable) -> Callable:
+    """Run a langmem tool function with the configured user id in its config.
+
+    langmem formats the namespace template from the `configurable` of the
+    call, and fails if it has no `langgraph_user_id`. The rest of the graph
+    then uses the default user of `Configuration`, so the tools get it too.
+    """
+
+    def config_with_user_id() -> Optional[RunnableConfig]:
+        config = var_child_runnable_config.get() or {}
+        configurable = config.get("configurable") or {}
+        if configurable.get("langgraph_user_id"):
+            return None
+        user_id = Configuration.from_runnable_config(config).langgraph_user_id
+        return {**config, "configurable": {**configurable, "langgraph_user_id": user_id}}
+
+    if asyncio.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def awrapper(*args, **kwargs):
+            config = config_with_user_id()
+            if config is None:
+                return await func(*args, **kwargs)
+            token = var_child_runnable_config.set(config)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                var_child_runnable_config.reset(token)
+
+        return awrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        config = config_with_user_id()
+        if config is None:
+            return func(*args, **kwargs)
+        token = var_child_runnable_config.set(config)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            var_child_runnable_config.reset(token)
+
+    return wrapper
 
 
-    email_info = llm_parser.invoke(
-        [
-            {"role": "system", "content": "You are an email parser. Your job is to extract the email details."},
-            {"role": "user", "content": last_message},
+@lru_cache
+def get_tools() -> list:
+    """Return the tools of the response agent, built on first use."""
+    from langmem import create_manage_memory_tool, create_search_memory_tool  # type: ignore
+
+    # `Tenant.memory_namespace`: langmem fills in the user id of each run's config
+    namespace = ("email_assistant", "{langgraph_user_id}", "collection")
+    memory_tools = [create_manage_memory_tool(namespace=namespace), create_search_memory_tool(namespace=namespace)]
+    return [
+        write_email,
+        schedule_meeting,
+        check_calendar_availability,
+        *[
+            tool.model_copy(update={"func": _with_user_id(tool.func), "coroutine": _with_user_id(tool.coroutine)})
+            for tool in memory_tools
+        ],
+    ]
+
+
+def create_prompt(state, config: RunnableConfig):
+    # The system message is rendered once per user and stays byte-identical
+    # across steps, so the provider can reuse the cached prefix
+    tenant = get_tenant(Configuration.from_runnable_config(config))
+    return [prompt_cache.agent_system_message(tenant.profile, tenant.prompt_instructions)] + state['messages']
+
+
+_response_agents: dict[str, tuple] = {}
+
+
+def get_response_agent(model: str = Configuration.response_model):
+    """Return the response agent running on a `provider:model` spec.
+
+    Agents are built once per spec, and again if the spec is served by another
+    model (see `register_chat_model`).
+    """
+    from langgraph.prebuilt import create_react_agent
+
+    chat_model = get_chat_model(model)
+    cached = _response_agents.get(model)
+    if cached is None or cached[0] is not chat_model:
+        agent = create_react_agent(
+            chat_model,
+            tools=get_tools(),
+            prompt=create_prompt,
+            pre_model_hook=RunnableLambda(manage_history, afunc=amanage_history, name="manage_history"),
+        )
+        cached = _response_agents[model] = (chat_model, agent)
+    return cached[1]
+
+
+@traced("node", "response_agent")
+def _response_agent(state: State, config: RunnableConfig):
+    configuration = Configuration.from_runnable_config(config)
+    start = time.perf_counter()
+    result = get_response_agent(configuration.response_model).invoke(state, config)
+    model_stats.record("response", time.perf_counter() - start)
+    return propagate(state["messages"], result)
+
+
+@traced("node", "response_agent")
+async def _aresponse_agent(state: State, config: RunnableConfig):
+    configuration = Configuration.from_runnable_config(config)
+    start = time.perf_counter()
+    result = await get_response_agent(configuration.response_model).ainvoke(state, config)
+    model_stats.record("response", time.perf_counter() - start)
+    return propagate(state["messages"], result)
+
+
+
+def _request_update(last_message: str) -> dict:
+    """Forward a message that is not a received email to the response agent."""
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": f"{last_message}",
+            }
         ]
-    )
+    }
 
 
+def _format_email(email_info: EmailInput) -> str:
+    """Render parsed email details into the triage user prompt."""
     author = email_info.author_name+ " <" + email_info.author_email + ">"
     to = email_info.to_name + " <" + email_info.to_email + ">"
-    subject = email_info.subject
-    email_thread = email_info.email_thread
-    
-
-    system_prompt = triage_system_prompt.format(
-        full_name=profile["full_name"],
-        name=profile["name"],
-        user_profile_background=profile["user_profile_background"],
-        triage_no=prompt_instructions["triage_rules"]["ignore"],
-        triage_notify=prompt_instructions["triage_rules"]["notify"],
-        triage_email=prompt_instructions["triage_rules"]["respond"],
-        examples=None
-    )
-    user_prompt = triage_user_prompt.format(
+    return triage_user_prompt.format(
         author=author, 
         to=to, 
-        subject=subject, 
-        email_thread=email_thread
-    )
-    result = llm_router.invoke(
-        [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
+        subject=email_info.subject, 
+        email_thread=email_info.email_thread
     )
-    if result.classification == "respond":
-        print("📧 Classification: RESPOND - This email requires a response")
+
+
+def _triage_system_prompt(tenant: Tenant) -> str:
+    return prompt_cache.triage_system_prompt(tenant.profile, tenant.prompt_instructions)
+
+
+def _parse_email(text: str, configuration: Configuration) -> tuple[Optional[EmailInput], Optional[EmailMessage]]:
+    """Parse a raw email deterministically, returning its details and headers."""
+    if not configuration.deterministic_parsing:
+        return None, None
+    headers = parse_headers(text)
+    if headers is None:
+        return None, None
+    return email_from_message(headers), headers
+
+
+def _prepare_email(email_info: EmailInput, headers: Optional[EmailMessage], configuration: Configuration) -> EmailInput:
+    """Strip the quoted history and signatures of an email, summarizing a long thread."""
+    preprocessor = get_thread_preprocessor(configuration)
+    if preprocessor is None:
+        return email_info
+    return preprocessor.prepare(email_info, headers, get_chat_model(configuration.summary_model))
+
+
+async def _aprepare_email(
+    email_info: EmailInput, headers: Optional[EmailMessage], configuration: Configuration
+) -> EmailInput:
+    """Async version of `_prepare_email`; summary cache lookups run on the I/O pool."""
+    preprocessor = get_thread_preprocessor(configuration)
+    if preprocessor is None:
+        return email_info
+    plan = await run_io(preprocessor.plan, email_info, headers, max_workers=configuration.io_max_workers)
+    summaries = await preprocessor.asummarize(plan, get_chat_model(configuration.summary_model))
+    return await run_io(preprocessor.finish, email_info, plan, summaries, max_workers=configuration.io_max_workers)
+
+
+def _triage_context(tenant: Tenant) -> tuple[dict, dict]:
+    """The triage rules and profile a classification depends on."""
+    return tenant.prompt_instructions["triage_rules"], tenant.profile
+
+
+def _get_example_store(configuration: Configuration):
+    # numpy and the vector index are only imported when examples are enabled
+    if not configuration.triage_examples_path or configuration.triage_examples_k <= 0:
+        return None
+    from agent.examples import get_example_store
+
+    return get_example_store(configuration.triage_examples_path)
+
+
+def _triage_examples(email_info: EmailInput, configuration: Configuration, tenant: Tenant) -> Optional[str]:
+    """The user's corrections of emails similar to this one, as a few-shot message."""
+    store = _get_example_store(configuration)
+    if store is None:
+        return None
+    return store.examples_message(email_info, configuration.triage_examples_k, tenant.user_id)
+
+
+def _router_messages(email_info: EmailInput, tenant: Tenant, examples: Optional[str] = None) -> list[dict]:
+    # The examples follow the static system prompt so that its prefix stays cacheable
+    messages = [{"role": "system", "content": _triage_system_prompt(tenant)}]
+    if examples:
+        messages.append({"role": "user", "content": examples})
+    messages.append({"role": "user", "content": _format_email(email_info)})
+    return messages
+
+
+def record_triage_correction(
+    email_info: EmailInput,
+    correct: Literal["ignore", "respond", "notify"],
+    original: Optional[Literal["ignore", "respond", "notify"]] = None,
+    config: Optional[RunnableConfig] = None,
+) -> None:
+    """Store a user's correction of a classification as a few-shot example.
+
+    The cached classification of the email is replaced by the correct one.
+    Requires `triage_examples_path` in the configuration.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    store = _get_example_store(configuration)
+    if store is None:
+        raise ValueError("Set triage_examples_path in the configuration to record triage corrections")
+    tenant = get_tenant(configuration)
+    store.add(email_info, correct, original, tenant.user_id)
+    cache = get_classification_cache(configuration)
+    if cache is not None:
+        router = Router(reasoning="Corrected by the user.", classification=correct)
+        cache.set(email_info, *_triage_context(tenant), router, tenant.user_id)
+
+
+def _classify(
+    email_info: EmailInput, configuration: Configuration, headers: Optional[EmailMessage] = None
+) -> Router:
+    """Classify an email, trying the cache and the pre-classifier before the model."""
+    tenant = get_tenant(configuration)
+    cache = get_classification_cache(configuration)
+    if cache is not None:
+        result = cache.get(email_info, *_triage_context(tenant), tenant.user_id)
+        if result is not None:
+            return result
+
+    preclassifier = get_preclassifier(configuration)
+    if preclassifier is not None:
+        prediction = preclassifier.predict(email_info, headers)
+        if prediction is not None:
+            return Router(reasoning=prediction.reasoning, classification=prediction.classification)
+
+    examples = _triage_examples(email_info, configuration, tenant)
+    result = get_stage_model(configuration, "triage", Router).invoke(_router_messages(email_info, tenant, examples))
+    if cache is not None:
+        cache.set(email_info, *_triage_context(tenant), result, tenant.user_id)
+    return result
+
+
+async def _aclassify(
+    email_info: EmailInput, configuration: Configuration, headers: Optional[EmailMessage] = None
+) -> Router:
+    """Async version of `_classify`; cache lookups run on the I/O pool."""
+    tenant = get_tenant(configuration)
+    cache = get_classification_cache(configuration)
+    if cache is not None:
+        result = await run_io(
+            cache.get, email_info, *_triage_context(tenant), tenant.user_id,
+            max_workers=configuration.io_max_workers,
+        )
+        if result is not None:
+            return result
+
+    preclassifier = get_preclassifier(configuration)
+    if preclassifier is not None:
+        prediction = preclassifier.predict(email_info, headers)
+        if prediction is not None:
+            return Router(reasoning=prediction.reasoning, classification=prediction.classification)
+
+    examples = None
+    if _get_example_store(configuration) is not None:
+        examples = await run_io(
+            _triage_examples, email_info, configuration, tenant, max_workers=configuration.io_max_workers
+        )
+    result = await get_stage_model(configuration, "triage", Router).ainvoke(_router_messages(email_info, tenant, examples))
+    if cache is not None:
+        await run_io(
+            cache.set, email_info, *_triage_context(tenant), result, tenant.user_id,
+            max_workers=configuration.io_max_workers,
+        )
+    return result
+
+
+def _classify_and_search(
+    email_info: EmailInput, config: RunnableConfig, configuration: Configuration, headers: Optional[EmailMessage] = None
+) -> tuple[Router, Optional[str]]:
+    """Classify an email while its sender's memories are searched (see `agent/speculation.py`)."""
+    search = start_memory_search(email_info, config, configuration)
+    try:
+        result = _classify(email_info, configuration, headers)
+    except BaseException:
+        if search is not None:
+            search.cancel()
+        raise
+    return result, take_memories(search, result.classification)
+
+
+async def _aclassify_and_search(
+    email_info: EmailInput, config: RunnableConfig, configuration: Configuration, headers: Optional[EmailMessage] = None
+) -> tuple[Router, Optional[str]]:
+    """Async version of `_classify_and_search`."""
+    search = astart_memory_search(email_info, config, configuration)
+    try:
+        result = await _aclassify(email_info, configuration, headers)
+    except BaseException:
+        if search is not None:
+            search.cancel()
+        raise
+    return result, await atake_memories(search, result.classification)
+
+
+def _route_email(
+    classification: str, user_prompt: str, memories: Optional[str] = None
+) -> Command[Literal["response_agent"]]:
+    """Hand a classified email over to the response agent.
+
+    Args:
+        classification (str): The triage classification.
+        user_prompt (str): The formatted email.
+        memories (str, optional): Memories searched during triage, given to
+            the response agent with a `respond` email.
+    """
+    if classification == "respond":
+        logger.info("Classification: respond - this email requires a response")
         goto = "response_agent"
-        update = {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""Use search memory tool if necessary and then Respond to this email :
+        if memories is None:
+            content = f"""Use search memory tool if necessary and then Respond to this email :
 
                     {user_prompt} 
                     
-                    and don't forget to update the memory in the end if neccessary.""",
-                }
-            ]
-        }
-    elif result.classification == "ignore":
-        print("🚫 Classification: IGNORE - This email can be safely ignored")
+                    and don't forget to update the memory in the end if neccessary."""
+        else:
+            content = f"""Respond to this email :
+
+                    {user_prompt}
+
+                    {memories}
+
+                    and don't forget to update the memory in the end if neccessary."""
+        update = {"messages": [{"role": "user", "content": content}]}
+    elif classification == "ignore":
+        logger.info("Classification: ignore - this email can be safely ignored")
         update = {
             "messages": [
                 {
@@ -228,9 +619,9 @@ def triage_router(state: State) -> Command[
             ]
         }
         goto = "response_agent"
-    elif result.classification == "notify":
+    elif classification == "notify":
         # If real life, this would do something else
-        print("🔔 Classification: NOTIFY - This email contains important information")
+        logger.info("Classification: notify - this email contains important information")
         update = {
             "messages": [
                 {
@@ -241,13 +632,233 @@ def triage_router(state: State) -> Command[
         }
         goto = "response_agent"
     else:
-        raise ValueError(f"Invalid classification: {result.classification}")
+        raise ValueError(f"Invalid classification: {classification}")
     return Command(goto=goto, update=update)
 
 
-email_agent = StateGraph(State)
-email_agent = email_agent.add_node(triage_router)
-email_agent = email_agent.add_node(detect_email)
-email_agent = email_agent.add_node("response_agent", response_agent)
-email_agent = email_agent.add_edge(START, "detect_email")
-email_agent = email_agent.compile()
+def select_intake(state: State, config: RunnableConfig) -> Literal["intake", "detect_email"]:
+    """Pick the fused or the staged intake path from the configuration."""
+    configuration = Configuration.from_runnable_config(config)
+    if configuration.intake_mode == "staged":
+        return "detect_email"
+    return "intake"
+
+
+def _intake_messages(last_message: str, tenant: Tenant) -> list[dict]:
+    return [
+        {"role": "system", "content": prompt_cache.intake_system_prompt(tenant.profile, tenant.prompt_instructions)},
+        {"role": "user", "content": last_message},
+    ]
+
+
+def _intake_router(result: EmailIntake) -> Router:
+    return Router(reasoning=result.reasoning, classification=result.classification)
+
+
+def _detection_messages(last_message: str) -> list[dict]:
+    return [
+        {"role": "system", "content": "Your job is to decide if the user have recieved an email and wanted to managed, or the user have another request(question, demand to sent an email, ..ect)."},
+        {"role": "user", "content": last_message},
+    ]
+
+
+def _detection_command(result: email_detection, last_message: str) -> Command[Literal["triage_router", "response_agent"]]:
+    if result.email_found == True:
+        logger.info("Email received in the input")
+        goto = "triage_router"
+        update = None
+    else:
+        logger.info("Other request")
+        goto = "response_agent"
+        update = _request_update(last_message)
+
+    return Command(goto=goto, update=update)
+
+
+def _parser_messages(last_message: str) -> list[dict]:
+    return [
+        {"role": "system", "content": "You are an email parser. Your job is to extract the email details."},
+        {"role": "user", "content": last_message},
+    ]
+
+
+@traced("node", "intake")
+def intake(state: State, config: RunnableConfig) -> Command[Literal["response_agent"]]:
+    """Detect, parse and triage the last message with a single model call."""
+    configuration = Configuration.from_runnable_config(config)
+
+    last_message = state["messages"][-1].content
+
+    email_info, headers = _parse_email(last_message, configuration)
+    if email_info is not None:
+        # A well-formed raw email only needs to be classified
+        logger.info("Email received in the input")
+        email_info = _prepare_email(email_info, headers, configuration)
+        result, memories = _classify_and_search(email_info, config, configuration, headers)
+        return _route_email(result.classification, _format_email(email_info), memories)
+
+    result = get_stage_model(configuration, "intake", EmailIntake).invoke(_intake_messages(last_message, get_tenant(configuration)))
+
+    if not result.email_found or result.email is None or result.classification is None:
+        logger.info("Other request")
+        return Command(goto="response_agent", update=_request_update(last_message))
+
+    logger.info("Email received in the input")
+    cache = get_classification_cache(configuration)
+    if cache is not None:
+        tenant = get_tenant(configuration)
+        cache.set(result.email, *_triage_context(tenant), _intake_router(result), tenant.user_id)
+    # The email was only known after the model call: the search can't overlap
+    # with it, but still saves the response agent a round trip
+    email_info = _prepare_email(result.email, None, configuration)
+    search = start_memory_search(email_info, config, configuration) if result.classification == "respond" else None
+    return _route_email(result.classification, _format_email(email_info), take_memories(search, "respond"))
+
+
+@traced("node", "intake")
+async def aintake(state: State, config: RunnableConfig) -> Command[Literal["response_agent"]]:
+    """Async version of `intake`."""
+    configuration = Configuration.from_runnable_config(config)
+
+    last_message = state["messages"][-1].content
+
+    email_info, headers = _parse_email(last_message, configuration)
+    if email_info is not None:
+        logger.info("Email received in the input")
+        email_info = await _aprepare_email(email_info, headers, configuration)
+        result, memories = await _aclassify_and_search(email_info, config, configuration, headers)
+        return _route_email(result.classification, _format_email(email_info), memories)
+
+    result = await get_stage_model(configuration, "intake", EmailIntake).ainvoke(_intake_messages(last_message, get_tenant(configuration)))
+
+    if not result.email_found or result.email is None or result.classification is None:
+        logger.info("Other request")
+        return Command(goto="response_agent", update=_request_update(last_message))
+
+    logger.info("Email received in the input")
+    cache = get_classification_cache(configuration)
+    if cache is not None:
+        tenant = get_tenant(configuration)
+        await run_io(
+            cache.set, result.email, *_triage_context(tenant), _intake_router(result), tenant.user_id,
+            max_workers=configuration.io_max_workers,
+        )
+    email_info = await _aprepare_email(result.email, None, configuration)
+    search = astart_memory_search(email_info, config, configuration) if result.classification == "respond" else None
+    return _route_email(result.classification, _format_email(email_info), await atake_memories(search, "respond"))
+
+
+@traced("node", "detect_email")
+def detect_email(state: State, config: RunnableConfig) -> Command[Literal["triage_router", "response_agent"]]:
+    configuration = Configuration.from_runnable_config(config)
+
+    last_message = state["messages"][-1].content
+
+    result = get_stage_model(configuration, "detection", email_detection).invoke(_detection_messages(last_message))
+    return _detection_command(result, last_message)
+
+
+@traced("node", "detect_email")
+async def adetect_email(state: State, config: RunnableConfig) -> Command[Literal["triage_router", "response_agent"]]:
+    """Async version of `detect_email`."""
+    configuration = Configuration.from_runnable_config(config)
+
+    last_message = state["messages"][-1].content
+
+    result = await get_stage_model(configuration, "detection", email_detection).ainvoke(_detection_messages(last_message))
+    return _detection_command(result, last_message)
+
+
+
+@traced("node", "triage_router")
+def triage_router(state: State, config: RunnableConfig) -> Command[
+    Literal["response_agent"]
+]:
+    configuration = Configuration.from_runnable_config(config)
+
+    last_message = state["messages"][-1].content
+
+    email_info, headers = _parse_email(last_message, configuration)
+    if email_info is None:
+        email_info = get_stage_model(configuration, "parsing", EmailInput).invoke(_parser_messages(last_message))
+    email_info = _prepare_email(email_info, headers, configuration)
+
+    result, memories = _classify_and_search(email_info, config, configuration, headers)
+    return _route_email(result.classification, _format_email(email_info), memories)
+
+
+@traced("node", "triage_router")
+async def atriage_router(state: State, config: RunnableConfig) -> Command[Literal["response_agent"]]:
+    """Async version of `triage_router`."""
+    configuration = Configuration.from_runnable_config(config)
+
+    last_message = state["messages"][-1].content
+
+    email_info, headers = _parse_email(last_message, configuration)
+    if email_info is None:
+        email_info = await get_stage_model(configuration, "parsing", EmailInput).ainvoke(_parser_messages(last_message))
+    email_info = await _aprepare_email(email_info, headers, configuration)
+
+    result, memories = await _aclassify_and_search(email_info, config, configuration, headers)
+    return _route_email(result.classification, _format_email(email_info), memories)
+
+
+def build_email_agent(config: Optional[RunnableConfig] = None, store=None, checkpointer=None):
+    """Build and compile the email agent graph.
+
+    Models, tools and Google clients are created by the runs that use them, not
+    here, so building the graph is cheap. It can serve as a LangGraph graph
+    factory, which passes the `config` of the run.
+
+    Args:
+        config (RunnableConfig, optional): Configuration of the caller, unused.
+        store (BaseStore, optional): Long-term memory store. The LangGraph
+            server provides its own; elsewhere, setting MEMORY_INDEX_PATH
+            serves semantic memory from the local ANN index.
+        checkpointer (BaseCheckpointSaver, optional): Saves the state after
+            every step. The LangGraph server provides its own; elsewhere,
+            setting CHECKPOINT_PATH checkpoints to a local SQLite database, so
+            runs of a restarted worker resume where they stopped.
+    """
+    # Nodes carry both implementations: `invoke` runs the sync one, `ainvoke`
+    # the async one, so concurrent runs in one server process don't block
+    # each other.
+    builder = StateGraph(State, config_schema=Configuration)
+    builder.add_node(
+        "intake", RunnableLambda(intake, afunc=aintake, name="intake"), destinations=("response_agent",)
+    )
+    builder.add_node(
+        "triage_router",
+        RunnableLambda(triage_router, afunc=atriage_router, name="triage_router"),
+        destinations=("response_agent",),
+    )
+    builder.add_node(
+        "detect_email",
+        RunnableLambda(detect_email, afunc=adetect_email, name="detect_email"),
+        destinations=("triage_router", "response_agent"),
+    )
+    builder.add_node(
+        "response_agent", RunnableLambda(_response_agent, afunc=_aresponse_agent, name="response_agent")
+    )
+    builder.add_conditional_edges(START, select_intake)
+
+    memory_index_path = os.environ.get("MEMORY_INDEX_PATH")
+    if store is None and memory_index_path:
+        from agent.memory_index import create_memory_store
+
+        store = create_memory_store(memory_index_path)
+    checkpoint_path = os.environ.get("CHECKPOINT_PATH")
+    if checkpointer is None and checkpoint_path:
+        checkpointer = create_checkpointer(checkpoint_path)
+    return builder.compile(store=store, checkpointer=checkpointer)
+
+
+def __getattr__(name: str):
+    # `email_agent` (the graph of langgraph.json) and `response_agent` are
+    # built when first accessed, not when the module is imported
+    if name == "email_agent":
+        globals()[name] = build_email_agent()
+        return globals()[name]
+    if name == "response_agent":
+        return get_response_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
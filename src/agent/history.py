@@ -0,0 +1,214 @@
+"""Token-budgeted conversation history of the response agent.
+
+`manage_history` runs before every call of the response model (the
+`pre_model_hook` of the ReAct agent). It keeps the history under
+`history_max_tokens`:
+
+- Tool outputs longer than `tool_output_max_tokens` (e.g. availability
+  listings over several weeks) are cut to their first lines.
+- Once the history is over budget, the oldest turns (a user message and every
+  message up to the next one) are written to the user's semantic memory, where
+  `search_memory` can find them, and removed from the thread. A short summary
+  message listing the evicted requests takes their place.
+
+The number of tokens sent per call therefore stays flat however long the
+thread gets. Token counts are approximate (about 4 characters per token).
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.messages import AnyMessage, HumanMessage, RemoveMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from langgraph.store.base import BaseStore, PutOp
+
+from agent.configuration import Configuration
+from agent.tenants import get_tenant
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ID = "history-summary"
+SUMMARY_HEADER = "Summary of the earlier conversation, moved to memory (use search_memory for details):"
+SUMMARY_MAX_TOKENS = 400
+SUMMARY_LINE_CHARACTERS = 160
+TRIMMED_SUFFIX = "\n... ({omitted} more lines trimmed, narrow the request to see them)"
+TRIMMED = re.compile(r"\n\.\.\. \(\d+ more lines trimmed, narrow the request to see them\)$")
+
+
+def count_tokens(messages: list[AnyMessage]) -> int:
+    return count_tokens_approximately(messages)
+
+
+def trim_tool_output(message: AnyMessage, max_tokens: int) -> AnyMessage:
+    """Cut a tool message to its first lines if it is over `max_tokens`.
+
+    The note of the lines left out counts in the budget, and a message that
+    was already cut is left as is, so trimming again changes nothing.
+    """
+    if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+        return message
+    if TRIMMED.search(message.content) or count_tokens([message]) <= max_tokens:
+        return message
+
+    lines = message.content.splitlines()
+    budget = max_tokens * 4 - len(TRIMMED_SUFFIX.format(omitted=len(lines)))
+    kept, size = [], 0
+    for line in lines:
+        size += len(line) + 1
+        if size > budget:
+            break
+        kept.append(line)
+    while True:
+        trimmed = message.model_copy(
+            update={"content": "\n".join(kept) + TRIMMED_SUFFIX.format(omitted=len(lines) - len(kept))}
+        )
+        # The per-message overhead of the count is not in the character budget
+        if not kept or count_tokens([trimmed]) <= max_tokens:
+            return trimmed
+        kept.pop()
+
+
+def _turns(messages: list[AnyMessage]) -> list[list[AnyMessage]]:
+    # A turn starts at a user message, so a tool call is never separated from
+    # its result
+    turns: list[list[AnyMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _one_line(text, limit: int = SUMMARY_LINE_CHARACTERS) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def _transcript(turn: list[AnyMessage]) -> str:
+    lines = []
+    for message in turn:
+        if isinstance(message, ToolMessage):
+            lines.append(f"Tool {message.name}: {message.content}")
+        elif message.content:
+            lines.append(f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {message.content}")
+    return "\n".join(lines)
+
+
+def _summary(previous: Optional[AnyMessage], evicted: list[list[AnyMessage]]) -> HumanMessage:
+    lines = previous.content.splitlines()[1:] if previous is not None else []
+    for turn in evicted:
+        request = _one_line(turn[0].content)
+        replies = [message for message in turn[1:] if message.type == "ai" and message.content]
+        lines.append(f"- {request}" + (f" -> {_one_line(replies[-1].content)}" if replies else ""))
+    # The oldest lines go first; the turns themselves stay in memory
+    while len(lines) > 1 and count_tokens_approximately([SUMMARY_HEADER, *lines]) > SUMMARY_MAX_TOKENS:
+        lines.pop(0)
+    return HumanMessage(content="\n".join([SUMMARY_HEADER, *lines]), id=SUMMARY_ID)
+
+
+@dataclass
+class Compaction:
+    """The history sent to the model and the turns evicted from it."""
+
+    messages: list[AnyMessage]
+    evicted: list[list[AnyMessage]]
+    changed: bool
+
+
+def compact(messages: list[AnyMessage], max_tokens: Optional[int], tool_output_max_tokens: int) -> Compaction:
+    """Trim tool outputs, then evict the oldest turns until under `max_tokens`.
+
+    The latest turn is always kept, even if it is over budget on its own.
+    """
+    trimmed = [trim_tool_output(message, tool_output_max_tokens) for message in messages]
+    changed = any(new is not old for new, old in zip(trimmed, messages))
+    if max_tokens is None:
+        return Compaction(trimmed, [], changed)
+
+    summary = trimmed[0] if trimmed and trimmed[0].id == SUMMARY_ID else None
+    turns = _turns(trimmed[1:] if summary is not None else trimmed)
+    sizes = [count_tokens(turn) for turn in turns]
+    total = sum(sizes) + (count_tokens([summary]) if summary is not None else 0)
+    evicted, new_summary = [], summary
+    while len(turns) > 1 and total > max_tokens:
+        evicted.append(turns.pop(0))
+        sizes.pop(0)
+        # The summary grows with the evicted turns and counts in the budget,
+        # so that compacting the result again changes nothing
+        new_summary = _summary(summary, evicted)
+        total = sum(sizes) + count_tokens([new_summary])
+    if not evicted:
+        return Compaction(trimmed, [], changed)
+
+    return Compaction([new_summary, *(message for turn in turns for message in turn)], evicted, True)
+
+
+def _memory_puts(compaction: Compaction, config: RunnableConfig) -> list[PutOp]:
+    namespace = get_tenant(Configuration.from_runnable_config(config)).memory_namespace
+    # Keyed by the first message of the turn, so a retried step does not
+    # store it twice
+    return [
+        PutOp(namespace, f"history-{turn[0].id}", {"content": _transcript(turn)})
+        for turn in compaction.evicted
+    ]
+
+
+def _store() -> Optional[BaseStore]:
+    from langgraph.config import get_store
+
+    try:
+        return get_store()
+    except (KeyError, RuntimeError):
+        return None
+
+
+def _update(compaction: Compaction) -> dict:
+    # The model input is always replaced, as the one of the previous step
+    # would otherwise be used again
+    update = {"llm_input_messages": compaction.messages}
+    if compaction.changed:
+        update["messages"] = [RemoveMessage(id=REMOVE_ALL_MESSAGES), *compaction.messages]
+    return update
+
+
+def _compact_state(state: dict, config: RunnableConfig) -> Compaction:
+    configuration = Configuration.from_runnable_config(config)
+    compaction = compact(state["messages"], configuration.history_max_tokens, configuration.tool_output_max_tokens)
+    if compaction.evicted:
+        logger.info("Moved %d turns of the conversation to memory", len(compaction.evicted))
+    return compaction
+
+
+def manage_history(state: dict, config: RunnableConfig) -> dict:
+    """Pre-model hook keeping the agent history within its token budget."""
+    compaction = _compact_state(state, config)
+    store = _store()
+    if compaction.evicted and store is not None:
+        store.batch(_memory_puts(compaction, config))
+    return _update(compaction)
+
+
+async def amanage_history(state: dict, config: RunnableConfig) -> dict:
+    """Async version of `manage_history`."""
+    compaction = _compact_state(state, config)
+    store = _store()
+    if compaction.evicted and store is not None:
+        await store.abatch(_memory_puts(compaction, config))
+    return _update(compaction)
+
+
+def propagate(messages: list[AnyMessage], result: dict) -> dict:
+    """Carry the agent's compaction over to the parent graph's messages.
+
+    The parent merges returned messages by id, so messages the agent removed
+    would otherwise stay in its state.
+    """
+    kept = {message.id for message in result["messages"]}
+    if all(message.id in kept for message in messages):
+        return result
+    return {**result, "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *result["messages"]]}
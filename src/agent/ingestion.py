@@ -0,0 +1,333 @@
+"""Streaming ingestion of a Gmail mailbox into the email agent.
+
+`GmailIngestor` backfills the mailbox with `messages.list`, then follows new
+mail incrementally with `users.history.list` from the last stored historyId.
+Messages are yielded by an async generator; at most `max_in_flight` of them are
+fetched but not yet acknowledged, so a slow consumer throttles the producer.
+Processed message ids and the history cursor are checkpointed in SQLite, and
+the cursor only advances past messages that were acknowledged, so a restarted
+worker resumes without losing or re-processing emails.
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Optional
+
+from googleapiclient.errors import HttpError
+from langchain_core.runnables import RunnableConfig
+
+from agent.email_parser import parse_raw_email
+from agent.state import EmailInput
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionCheckpoint:
+    """SQLite record of the sync cursor and of the processed messages."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed ("
+                "message_id TEXT PRIMARY KEY, status TEXT NOT NULL, processed_at REAL NOT NULL)"
+            )
+
+    def get(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, name: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (name, value))
+
+    def is_processed(self, message_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM processed WHERE message_id = ?", (message_id,)).fetchone()
+        return row is not None
+
+    def mark_processed(self, message_id: str, status: str = "done") -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processed (message_id, status, processed_at) VALUES (?, ?, ?)",
+                (message_id, status, time.time()),
+            )
+
+
+@dataclass
+class IngestedEmail:
+    """A message fetched from the mailbox."""
+
+    message_id: str
+    thread_id: str
+    raw: str
+    email_info: Optional[EmailInput] = None
+
+
+@dataclass
+class _Cursor:
+    """A sync round; its history id is stored once all its messages are acknowledged."""
+
+    history_id: Optional[str] = None
+    backfill: bool = False
+    sealed: bool = False
+    remaining: set = field(default_factory=set)
+
+
+_DONE = object()
+
+
+class GmailIngestor:
+    """Backfill and follow a Gmail label as an async stream of emails.
+
+    Args:
+        service_factory (Callable): Returns the Gmail API client, with a read
+            scope, e.g. `google_auth.get_ingestion_gmail_service`.
+        checkpoint (IngestionCheckpoint): Where progress is stored.
+        label_id (str): The label to ingest.
+        query (str, optional): Gmail search query restricting the backfill.
+        max_in_flight (int): Maximum fetched messages not yet acknowledged.
+        poll_interval (float): Seconds between two history syncs when following.
+        page_size (int): Messages or history records per list call.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable,
+        checkpoint: IngestionCheckpoint,
+        label_id: str = "INBOX",
+        query: Optional[str] = None,
+        max_in_flight: int = 16,
+        poll_interval: float = 30.0,
+        page_size: int = 100,
+    ):
+        self.service_factory = service_factory
+        self.checkpoint = checkpoint
+        self.label_id = label_id
+        self.query = query
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        self._cursors: deque[_Cursor] = deque()
+        self._seen: set[str] = set()
+        self._history_id: Optional[str] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+
+    async def stream(self, follow: bool = True) -> AsyncIterator[IngestedEmail]:
+        """Yield emails until the mailbox is drained, or forever if `follow`.
+
+        Every yielded email must be passed to `ack` once processed.
+        """
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_in_flight)
+        producer = asyncio.create_task(self._produce(queue, follow))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+
+    async def ack(self, email: IngestedEmail, status: str = "done") -> None:
+        """Record an email as processed (or failed) and free its in-flight slot."""
+        await asyncio.to_thread(self.checkpoint.mark_processed, email.message_id, status)
+        self._finish(email.message_id)
+        self._in_flight.release()
+
+    def _finish(self, message_id: str) -> None:
+        for cursor in self._cursors:
+            cursor.remaining.discard(message_id)
+        self._commit()
+
+    def _commit(self) -> None:
+        while self._cursors and self._cursors[0].sealed and not self._cursors[0].remaining:
+            cursor = self._cursors.popleft()
+            self.checkpoint.set("history_id", cursor.history_id)
+            if cursor.backfill:
+                self.checkpoint.set("backfill_complete", "1")
+            logger.debug("Checkpointed history id %s", cursor.history_id)
+
+    async def _produce(self, queue: asyncio.Queue, follow: bool) -> None:
+        try:
+            self._history_id = self.checkpoint.get("history_id")
+            if self.checkpoint.get("backfill_complete") != "1" or self._history_id is None:
+                await self._backfill(queue)
+            while True:
+                await self._sync_history(queue)
+                if not follow:
+                    break
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            # Surface the error to the consumer instead of leaving it waiting
+            await queue.put(e)
+            return
+        await queue.put(_DONE)
+
+    def _fetch(self, message_id: str) -> IngestedEmail:
+        service = self.service_factory()
+        message = service.users().messages().get(userId="me", id=message_id, format="raw").execute()
+        raw = base64.urlsafe_b64decode(message["raw"]).decode("utf-8", errors="replace")
+        return IngestedEmail(
+            message_id=message_id,
+            thread_id=message.get("threadId", ""),
+            raw=raw,
+            email_info=parse_raw_email(raw),
+        )
+
+    async def _enqueue(self, queue: asyncio.Queue, message_ids: list[str], cursor: _Cursor) -> None:
+        new_ids = []
+        for message_id in message_ids:
+            if message_id in self._seen or await asyncio.to_thread(self.checkpoint.is_processed, message_id):
+                continue
+            self._seen.add(message_id)
+            cursor.remaining.add(message_id)
+            new_ids.append(message_id)
+
+        async def fetch(message_id: str) -> None:
+            await self._in_flight.acquire()
+            try:
+                email = await asyncio.to_thread(self._fetch, message_id)
+            except HttpError as e:
+                self._in_flight.release()
+                if e.resp.status != 404:
+                    raise
+                # Deleted before we could read it
+                self._finish(message_id)
+                return
+            except BaseException:
+                self._in_flight.release()
+                raise
+            await queue.put(email)
+
+        await asyncio.gather(*(fetch(message_id) for message_id in new_ids))
+
+    async def _backfill(self, queue: asyncio.Queue) -> None:
+        service = self.service_factory()
+        # Changes after this point are picked up by the first history sync
+        profile = await asyncio.to_thread(service.users().getProfile(userId="me").execute)
+        cursor = _Cursor(history_id=profile["historyId"], backfill=True)
+        self._cursors.append(cursor)
+        logger.info("Backfilling %s from history id %s", self.label_id, cursor.history_id)
+
+        request = service.users().messages().list(
+            userId="me", labelIds=[self.label_id], q=self.query, maxResults=self.page_size
+        )
+        while request is not None:
+            response = await asyncio.to_thread(request.execute)
+            await self._enqueue(queue, [message["id"] for message in response.get("messages", [])], cursor)
+            request = service.users().messages().list_next(request, response)
+
+        cursor.sealed = True
+        self._history_id = cursor.history_id
+        self._commit()
+
+    async def _sync_history(self, queue: asyncio.Queue) -> None:
+        service = self.service_factory()
+        cursor = _Cursor()
+        self._cursors.append(cursor)
+        request = service.users().history().list(
+            userId="me",
+            startHistoryId=self._history_id,
+            historyTypes="messageAdded",
+            labelId=self.label_id,
+            maxResults=self.page_size,
+        )
+        latest = self._history_id
+        try:
+            while request is not None:
+                response = await asyncio.to_thread(request.execute)
+                message_ids = [
+                    added["message"]["id"]
+                    for record in response.get("history", [])
+                    for added in record.get("messagesAdded", [])
+                ]
+                await self._enqueue(queue, message_ids, cursor)
+                latest = response.get("historyId", latest)
+                request = service.users().history().list_next(request, response)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # The stored history id is too old, fall back to a full backfill
+            logger.warning("History id %s expired, backfilling again", self._history_id)
+            self._cursors.remove(cursor)
+            self.checkpoint.set("backfill_complete", "0")
+            await self._backfill(queue)
+            return
+
+        cursor.history_id = latest
+        cursor.sealed = True
+        self._history_id = latest
+        self._commit()
+
+
+async def _run_email(graph, email: IngestedEmail, config: Optional[RunnableConfig]) -> None:
+    input = {"messages": [{"role": "user", "content": email.raw}]}
+    if getattr(graph, "checkpointer", None) is None:
+        await graph.ainvoke(input, config)
+        return
+    # One thread per message: the run of an email that was in flight when the
+    # worker stopped resumes from its last step instead of starting over
+    config = config or {}
+    config = {**config, "configurable": {**(config.get("configurable") or {}), "thread_id": f"gmail-{email.message_id}"}}
+    snapshot = await graph.aget_state(config)
+    if snapshot.next:
+        logger.info("Resuming the interrupted run of message %s", email.message_id)
+        await graph.ainvoke(None, config)
+    elif not snapshot.values:
+        await graph.ainvoke(input, config)
+
+
+async def run_ingestion(
+    ingestor: GmailIngestor,
+    graph=None,
+    config: Optional[RunnableConfig] = None,
+    concurrency: int = 4,
+    follow: bool = True,
+) -> None:
+    """Feed ingested emails into the email agent.
+
+    Args:
+        ingestor (GmailIngestor): The mailbox stream.
+        graph (CompiledGraph, optional): The graph to run, `email_agent` by default.
+            With a checkpointer, each message runs in its own thread and an
+            interrupted run is resumed rather than started again.
+        config (RunnableConfig, optional): Configuration of the graph runs.
+        concurrency (int): Maximum number of concurrent graph runs.
+        follow (bool): Keep following new mail after the backlog is drained.
+    """
+    if graph is None:
+        from agent.graph import email_agent as graph
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def process(email: IngestedEmail) -> None:
+        status = "done"
+        try:
+            async with semaphore:
+                await _run_email(graph, email, config)
+        except Exception:
+            logger.exception("Failed to process message %s", email.message_id)
+            status = "failed"
+        await ingestor.ack(email, status)
+
+    async for email in ingestor.stream(follow=follow):
+        task = asyncio.create_task(process(email))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
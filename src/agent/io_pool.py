@@ -0,0 +1,34 @@
+"""Bounded thread pool for blocking I/O called from async code.
+
+googleapiclient and the SQLite caches are synchronous. Async nodes and tools
+run them on a dedicated pool rather than on the event loop (or the loop's
+default executor, which is shared with everything else), so one server process
+can serve many concurrent threads while the number of parallel Google
+connections stays bounded.
+"""
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+@lru_cache
+def get_io_executor(max_workers: int = 16) -> ThreadPoolExecutor:
+    """Return the process-wide I/O pool of the given size."""
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-io")
+
+
+async def run_io(func: Callable[..., T], *args, max_workers: int = 16, **kwargs) -> T:
+    """Run a blocking call on the I/O pool and await its result.
+
+    The caller's context variables (e.g. the tracing callbacks of the current
+    run) are propagated to the worker thread.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_io_executor(max_workers), call)
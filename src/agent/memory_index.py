@@ -0,0 +1,603 @@
+"""Approximate nearest neighbour index for the semantic memory store.
+
+`IVFIndex` keeps normalized embeddings in a memory-mapped float32 or float16
+file and partitions them with spherical k-means into inverted lists. A search
+only scores the vectors of the `nprobe` lists closest to the query instead of
+the whole collection. New vectors are assigned to their list on insert, and
+the lists are retrained once the collection has grown fourfold.
+
+`AnnMemoryStore` is a LangGraph `BaseStore` that keeps items in another store
+and answers semantic searches, such as the langmem `search_memory` tool, from
+the index. With a `path`, the items are kept in a SQLite table next to the
+index (`SqliteItemStore`), so that both survive a restart; without one, both
+live only as long as the process. Query embeddings are cached (LRU), so a
+repeated search does not call the embedding model again.
+"""
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+import numpy as np
+from langgraph.store.base import (
+    BaseStore,
+    GetOp,
+    IndexConfig,
+    Item,
+    ListNamespacesOp,
+    Op,
+    PutOp,
+    Result,
+    SearchItem,
+    SearchOp,
+)
+from langgraph.store.base.embed import ensure_embeddings, get_text_at_path, tokenize_path
+from langgraph.store.memory import InMemoryStore, _compare_values, _does_match
+
+from agent.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+Namespace = tuple[str, ...]
+
+INITIAL_CAPACITY = 1024
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 65_536
+ASSIGN_CHUNK = 65_536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    """Inverted-file index over a memory-mapped vector file.
+
+    Args:
+        dims (int): Dimension of the embeddings.
+        path (str, optional): Directory of the vector file and of its row
+            table. A temporary directory is used if omitted.
+        dtype (str): 'float32', or 'float16' to halve the file size.
+        nprobe (int): Number of inverted lists scored by a search.
+        train_threshold (int): Below this many vectors searches are exact.
+    """
+
+    def __init__(
+        self,
+        dims: int,
+        path: Optional[str] = None,
+        dtype: str = "float32",
+        nprobe: int = 16,
+        train_threshold: int = 4096,
+    ):
+        self.dims = dims
+        self.dtype = np.dtype(dtype)
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.path = path or tempfile.mkdtemp(prefix="memory-index-")
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self.path, "rows.sqlite"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                "row INTEGER PRIMARY KEY, namespace TEXT NOT NULL, key TEXT NOT NULL, live INTEGER NOT NULL)"
+            )
+
+        self._namespaces: dict[Namespace, int] = {}
+        self._rows_by_ns: list[array] = []
+        self._keys: list[tuple[Namespace, str]] = []
+        self._rows_by_key: dict[tuple[Namespace, str], list[int]] = {}
+        rows = self._conn.execute("SELECT namespace, key, live FROM rows ORDER BY row").fetchall()
+        self._size = len(rows)
+        capacity = max(INITIAL_CAPACITY, 1 << math.ceil(math.log2(max(self._size, 1))))
+        self._live = np.zeros(capacity, dtype=bool)
+        self._ns_ids = np.zeros(capacity, dtype=np.int32)
+        for row, (namespace, key, live) in enumerate(rows):
+            namespace = tuple(namespace.split("\x1f"))
+            self._register(row, namespace, key)
+            self._live[row] = bool(live)
+
+        self._file = os.path.join(self.path, f"vectors.{self.dtype.name}")
+        self._vectors = self._open(capacity)
+
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: list[array] = []
+        self._trained_size = 0
+        if self.live_count >= self.train_threshold:
+            self.train()
+
+    @property
+    def live_count(self) -> int:
+        return int(self._live[: self._size].sum())
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    def _open(self, capacity: int) -> np.memmap:
+        size = capacity * self.dims * self.dtype.itemsize
+        with open(self._file, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(self._file, dtype=self.dtype, mode="r+", shape=(capacity, self.dims))
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._live)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._vectors.flush()
+        self._vectors = self._open(capacity)
+        self._live = np.concatenate([self._live, np.zeros(capacity - len(self._live), dtype=bool)])
+        self._ns_ids = np.concatenate([self._ns_ids, np.zeros(capacity - len(self._ns_ids), dtype=np.int32)])
+
+    def _register(self, row: int, namespace: Namespace, key: str) -> None:
+        ns_id = self._namespaces.setdefault(namespace, len(self._namespaces))
+        if ns_id == len(self._rows_by_ns):
+            self._rows_by_ns.append(array("i"))
+        self._rows_by_ns[ns_id].append(row)
+        self._ns_ids[row] = ns_id
+        self._keys.append((namespace, key))
+        self._rows_by_key.setdefault((namespace, key), []).append(row)
+
+    def add(self, namespace: Namespace, key: str, vectors: np.ndarray) -> None:
+        """Index the embeddings of an item, replacing its previous ones."""
+        self.add_batch([(namespace, key, vectors)])
+
+    def add_batch(self, items: list[tuple[Namespace, str, np.ndarray]]) -> None:
+        """Index several items at once, with a single write of the row table."""
+        with self._lock:
+            start = self._size
+            records = []
+            for namespace, key, vectors in items:
+                vectors = _normalize(np.atleast_2d(vectors))
+                self.delete(namespace, key)
+                row = self._size
+                self._grow(row + len(vectors))
+                self._vectors[row : row + len(vectors)] = vectors.astype(self.dtype)
+                for i in range(row, row + len(vectors)):
+                    self._register(i, namespace, key)
+                    records.append((i, "\x1f".join(namespace), key))
+                self._live[row : row + len(vectors)] = True
+                self._size += len(vectors)
+            with self._conn:
+                self._conn.executemany("INSERT INTO rows (row, namespace, key, live) VALUES (?, ?, ?, 1)", records)
+
+            if self._centroids is not None:
+                self._assign(np.arange(start, self._size))
+            if self.live_count >= max(self.train_threshold, 4 * self._trained_size):
+                self.train()
+
+    def delete(self, namespace: Namespace, key: str) -> None:
+        with self._lock:
+            rows = self._rows_by_key.pop((namespace, key), [])
+            if not rows:
+                return
+            self._live[rows] = False
+            with self._conn:
+                self._conn.executemany("UPDATE rows SET live = 0 WHERE row = ?", [(row,) for row in rows])
+
+    def train(self) -> None:
+        """(Re)build the inverted lists with spherical k-means over the live vectors."""
+        with self._lock:
+            live = np.flatnonzero(self._live[: self._size])
+            if len(live) == 0:
+                return
+            nlist = max(1, int(math.sqrt(len(live))))
+            rng = np.random.default_rng(0)
+            sample = rng.choice(live, size=min(len(live), max(KMEANS_SAMPLE, 32 * nlist)), replace=False)
+            data = np.asarray(self._vectors[np.sort(sample)], dtype=np.float32)
+            centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+            for _ in range(KMEANS_ITERATIONS):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                counts = np.bincount(labels, minlength=nlist)
+                starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+                empty = counts == 0
+                sums = np.zeros_like(centroids)
+                sums[~empty] = np.add.reduceat(data[np.argsort(labels, kind="stable")], starts[~empty])
+                # Re-seed empty lists with random points
+                sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+                centroids = _normalize(sums)
+            self._centroids = centroids
+            self._lists = [array("i") for _ in range(nlist)]
+            self._assign(live)
+            self._trained_size = len(live)
+            logger.debug("Trained %d inverted lists over %d vectors", nlist, len(live))
+
+    def _assign(self, rows: np.ndarray) -> None:
+        for start in range(0, len(rows), ASSIGN_CHUNK):
+            chunk = rows[start : start + ASSIGN_CHUNK]
+            vectors = np.asarray(self._vectors[chunk], dtype=np.float32)
+            for row, label in zip(chunk.tolist(), np.argmax(vectors @ self._centroids.T, axis=1).tolist()):
+                self._lists[label].append(row)
+
+    def _namespace_ids(self, prefix: Namespace) -> Optional[np.ndarray]:
+        if not prefix:
+            return None
+        return np.array(
+            [ns_id for namespace, ns_id in self._namespaces.items() if namespace[: len(prefix)] == prefix],
+            dtype=np.int32,
+        )
+
+    def _top(self, rows: np.ndarray, query: np.ndarray, k: int) -> list[tuple[Namespace, str, float]]:
+        if len(rows) == 0:
+            return []
+        # Score in chunks so that a scan never copies the whole file into memory
+        scores = np.concatenate(
+            [
+                np.asarray(self._vectors[rows[start : start + ASSIGN_CHUNK]], dtype=np.float32) @ query
+                for start in range(0, len(rows), ASSIGN_CHUNK)
+            ]
+        )
+        # Several rows can belong to one item: keep its best score
+        order = np.argsort(-scores)
+        results, seen = [], set()
+        for i in order.tolist():
+            item = self._keys[rows[i]]
+            if item in seen:
+                continue
+            seen.add(item)
+            results.append((item[0], item[1], float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+    def _filter(self, rows: np.ndarray, allowed: Optional[np.ndarray]) -> np.ndarray:
+        rows = rows[self._live[rows]]
+        if allowed is not None:
+            rows = rows[np.isin(self._ns_ids[rows], allowed)]
+        return rows
+
+    def search(
+        self, query: np.ndarray, namespace_prefix: Namespace = (), k: int = 10, nprobe: Optional[int] = None
+    ) -> list[tuple[Namespace, str, float]]:
+        """Approximate top-k items by cosine similarity, as (namespace, key, score)."""
+        query = _normalize(query)
+        with self._lock:
+            allowed = self._namespace_ids(namespace_prefix)
+            if self._centroids is None:
+                return self.exact_search(query, namespace_prefix, k)
+            nprobe = min(nprobe or self.nprobe, len(self._lists))
+            probed = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.concatenate([np.frombuffer(self._lists[c], dtype=np.int32) for c in probed.tolist()])
+            rows = self._filter(rows, allowed)
+            if len(rows) < k:
+                # A small namespace may not reach the probed lists, scan it instead
+                return self.exact_search(query, namespace_prefix, k)
+            return self._top(rows, query, k)
+
+    def _namespace_rows(self, prefix: Namespace) -> np.ndarray:
+        """Rows of the namespaces under a prefix, live or not, without scanning the others."""
+        allowed = self._namespace_ids(prefix)
+        if allowed is None:
+            return np.arange(self._size)
+        return np.concatenate(
+            [np.frombuffer(self._rows_by_ns[ns_id], dtype=np.int32) for ns_id in allowed.tolist()]
+            or [np.zeros(0, dtype=np.int32)]
+        )
+
+    def exact_search(self, query: np.ndarray, namespace_prefix: Namespace = (), k: int = 10) -> list[tuple[Namespace, str, float]]:
+        """Brute-force top-k, the reference for recall measurements."""
+        query = _normalize(query)
+        with self._lock:
+            rows = self._namespace_rows(namespace_prefix)
+            return self._top(rows[self._live[rows]], query, k)
+
+    def flush(self) -> None:
+        self._vectors.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._vectors.flush()
+            self._conn.close()
+
+
+class SqliteItemStore(BaseStore):
+    """Store of items in a SQLite file, without semantic search.
+
+    Serves the non-semantic operations of an `AnnMemoryStore` whose index is
+    on disk: gets, puts, deletes, filtered listings and namespace listings.
+
+    Args:
+        path (str): The SQLite file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "created_at TEXT NOT NULL, updated_at TEXT NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+
+    @staticmethod
+    def _item(row: tuple) -> Item:
+        namespace, key, value, created_at, updated_at = row
+        return Item(
+            namespace=tuple(namespace.split("\x1f")),
+            key=key,
+            value=json.loads(value),
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+
+    def _get(self, op: GetOp) -> Optional[Item]:
+        row = self._conn.execute(
+            "SELECT namespace, key, value, created_at, updated_at FROM items WHERE namespace = ? AND key = ?",
+            ("\x1f".join(op.namespace), op.key),
+        ).fetchone()
+        return self._item(row) if row else None
+
+    def _put(self, op: PutOp) -> None:
+        namespace = "\x1f".join(op.namespace)
+        if op.value is None:
+            self._conn.execute("DELETE FROM items WHERE namespace = ? AND key = ?", (namespace, op.key))
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        self._conn.execute(
+            "INSERT INTO items (namespace, key, value, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (namespace, op.key, json.dumps(op.value), now, now),
+        )
+
+    def _rows(self, prefix: Namespace) -> list[tuple]:
+        query = "SELECT namespace, key, value, created_at, updated_at FROM items"
+        if not prefix:
+            return self._conn.execute(query + " ORDER BY updated_at DESC").fetchall()
+        joined = "\x1f".join(prefix)
+        return self._conn.execute(
+            query + " WHERE namespace = ? OR substr(namespace, 1, ?) = ? ORDER BY updated_at DESC",
+            (joined, len(joined) + 1, joined + "\x1f"),
+        ).fetchall()
+
+    def _search(self, op: SearchOp) -> list[SearchItem]:
+        results = []
+        for row in self._rows(op.namespace_prefix):
+            item = self._item(row)
+            if op.filter and not all(_compare_values(item.value.get(k), v) for k, v in op.filter.items()):
+                continue
+            results.append(
+                SearchItem(
+                    namespace=item.namespace,
+                    key=item.key,
+                    value=item.value,
+                    created_at=item.created_at,
+                    updated_at=item.updated_at,
+                )
+            )
+        return results[op.offset : op.offset + op.limit]
+
+    def _list_namespaces(self, op: ListNamespacesOp) -> list[Namespace]:
+        rows = self._conn.execute("SELECT DISTINCT namespace FROM items").fetchall()
+        namespaces = [tuple(namespace.split("\x1f")) for (namespace,) in rows]
+        namespaces = [ns for ns in namespaces if all(_does_match(c, ns) for c in op.match_conditions or ())]
+        if op.max_depth is not None:
+            namespaces = list({ns[: op.max_depth] for ns in namespaces})
+        return sorted(namespaces)[op.offset : op.offset + op.limit]
+
+    def batch(self, ops: Iterable[Op]) -> list[Result]:
+        results: list[Result] = []
+        with self._lock, self._conn:
+            for op in ops:
+                if isinstance(op, GetOp):
+                    results.append(self._get(op))
+                elif isinstance(op, PutOp):
+                    results.append(self._put(op))
+                elif isinstance(op, SearchOp):
+                    results.append(self._search(op))
+                elif isinstance(op, ListNamespacesOp):
+                    results.append(self._list_namespaces(op))
+                else:
+                    raise ValueError(f"Unknown operation type: {type(op)}")
+        return results
+
+    async def abatch(self, ops: Iterable[Op]) -> list[Result]:
+        return self.batch(ops)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class AnnMemoryStore(BaseStore):
+    """Store whose semantic search is served by an `IVFIndex`.
+
+    Args:
+        index (IndexConfig): Embedding configuration, as for `InMemoryStore`.
+        path (str, optional): Directory of the vector index.
+        dtype (str): Storage type of the vectors ('float32' or 'float16').
+        nprobe (int): Inverted lists scored per search.
+        items (BaseStore, optional): Where the items themselves are stored. A
+            `SqliteItemStore` in `path` by default, or an `InMemoryStore`
+            without a path.
+        query_cache_size (int): Number of query embeddings kept.
+    """
+
+    def __init__(
+        self,
+        *,
+        index: IndexConfig,
+        path: Optional[str] = None,
+        dtype: str = "float32",
+        nprobe: int = 16,
+        items: Optional[BaseStore] = None,
+        query_cache_size: int = 1024,
+    ):
+        self.index_config = dict(index)
+        self.embeddings = ensure_embeddings(index.get("embed"))
+        self._fields = [(p, tokenize_path(p)) if p != "$" else (p, p) for p in (index.get("fields") or ["$"])]
+        self.vectors = IVFIndex(index["dims"], path=path, dtype=dtype, nprobe=nprobe)
+        if items is None:
+            items = SqliteItemStore(os.path.join(path, "items.sqlite")) if path else InMemoryStore()
+        self.items = items
+        self.query_cache_size = query_cache_size
+        self._query_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.query_cache_hits = 0
+
+    def _texts(self, op: PutOp) -> list[str]:
+        if op.value is None or op.index is False:
+            return []
+        paths = self._fields if op.index is None else [(p, tokenize_path(p)) for p in op.index]
+        return [text for _, path in paths for text in get_text_at_path(op.value, path)]
+
+    def _cached_query(self, query: str) -> Optional[np.ndarray]:
+        with self._cache_lock:
+            if query in self._query_cache:
+                self._query_cache.move_to_end(query)
+                self.query_cache_hits += 1
+                telemetry.count("agent_cache_requests_total", cache="query_embedding", result="hit")
+                return self._query_cache[query]
+        telemetry.count("agent_cache_requests_total", cache="query_embedding", result="miss")
+        return None
+
+    def _cache_query(self, query: str, embedding: list[float]) -> None:
+        with self._cache_lock:
+            self._query_cache[query] = np.asarray(embedding, dtype=np.float32)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+
+    def _split(self, ops: list[Op]) -> tuple[list[int], list[int], dict[tuple[Namespace, str], PutOp]]:
+        """Indices of the ops forwarded to the item store, of the semantic searches, and the puts."""
+        forwarded, searches, puts = [], [], {}
+        for i, op in enumerate(ops):
+            if isinstance(op, SearchOp) and op.query:
+                searches.append(i)
+            else:
+                forwarded.append(i)
+                if isinstance(op, PutOp):
+                    puts[(op.namespace, op.key)] = op
+        return forwarded, searches, puts
+
+    def _index_puts(self, puts: dict[tuple[Namespace, str], PutOp], texts: list[list[str]], embeddings: list) -> None:
+        added, offset = [], 0
+        for (namespace, key), item_texts in zip(puts, texts):
+            if not item_texts:
+                self.vectors.delete(namespace, key)
+                continue
+            added.append((namespace, key, np.asarray(embeddings[offset : offset + len(item_texts)])))
+            offset += len(item_texts)
+        if added:
+            self.vectors.add_batch(added)
+
+    def _search_item(self, op: SearchOp, hits: list, items: list) -> list[SearchItem]:
+        results = []
+        for (_, _, score), item in zip(hits, items):
+            if item is None:
+                continue
+            if op.filter and any(item.value.get(name) != value for name, value in op.filter.items()):
+                continue
+            results.append(
+                SearchItem(
+                    namespace=item.namespace,
+                    key=item.key,
+                    value=item.value,
+                    created_at=item.created_at,
+                    updated_at=item.updated_at,
+                    score=score,
+                )
+            )
+        return results[op.offset : op.offset + op.limit]
+
+    def _lookup(self, ops: list[Op], searches: list[int], queries: dict[str, np.ndarray]) -> list[list]:
+        hits = []
+        for i in searches:
+            op = ops[i]
+            # Over-fetch when a filter may drop some of the hits
+            k = (op.offset + op.limit) * (4 if op.filter else 1)
+            hits.append(self.vectors.search(queries[op.query], op.namespace_prefix, k))
+        return hits
+
+    def _results(
+        self,
+        ops: list[Op],
+        forwarded: list[int],
+        forwarded_results: list,
+        searches: list[int],
+        hits: list[list],
+        items: list,
+    ) -> list[Result]:
+        results: list[Result] = [None] * len(ops)
+        for i, result in zip(forwarded, forwarded_results):
+            results[i] = result
+        offset = 0
+        for i, search_hits in zip(searches, hits):
+            results[i] = self._search_item(ops[i], search_hits, items[offset : offset + len(search_hits)])
+            offset += len(search_hits)
+        return results
+
+    def _embed_texts(self, puts: dict[tuple[Namespace, str], PutOp]) -> tuple[list[list[str]], list[str]]:
+        texts = [self._texts(op) for op in puts.values()]
+        return texts, [text for item_texts in texts for text in item_texts]
+
+    def batch(self, ops: Iterable[Op]) -> list[Result]:
+        ops = list(ops)
+        forwarded, searches, puts = self._split(ops)
+        forwarded_results = self.items.batch([ops[i] for i in forwarded]) if forwarded else []
+
+        texts, flat = self._embed_texts(puts)
+        if puts:
+            self._index_puts(puts, texts, self.embeddings.embed_documents(flat) if flat else [])
+
+        queries = {}
+        for query in {ops[i].query for i in searches}:
+            embedding = self._cached_query(query)
+            if embedding is None:
+                embedding = self.embeddings.embed_query(query)
+                self._cache_query(query, embedding)
+            queries[query] = np.asarray(embedding, dtype=np.float32)
+        hits = self._lookup(ops, searches, queries)
+        get_ops = [GetOp(namespace, key) for search_hits in hits for namespace, key, _ in search_hits]
+        items = self.items.batch(get_ops) if get_ops else []
+        return self._results(ops, forwarded, forwarded_results, searches, hits, items)
+
+    async def abatch(self, ops: Iterable[Op]) -> list[Result]:
+        ops = list(ops)
+        forwarded, searches, puts = self._split(ops)
+        forwarded_results = await self.items.abatch([ops[i] for i in forwarded]) if forwarded else []
+
+        texts, flat = self._embed_texts(puts)
+        if puts:
+            self._index_puts(puts, texts, await self.embeddings.aembed_documents(flat) if flat else [])
+
+        queries = {}
+        for query in {ops[i].query for i in searches}:
+            embedding = self._cached_query(query)
+            if embedding is None:
+                embedding = await self.embeddings.aembed_query(query)
+                self._cache_query(query, embedding)
+            queries[query] = np.asarray(embedding, dtype=np.float32)
+        hits = self._lookup(ops, searches, queries)
+        get_ops = [GetOp(namespace, key) for search_hits in hits for namespace, key, _ in search_hits]
+        items = await self.items.abatch(get_ops) if get_ops else []
+        return self._results(ops, forwarded, forwarded_results, searches, hits, items)
+
+
+    def close(self) -> None:
+        """Flush the index and close the files of the index and of the items."""
+        self.vectors.close()
+        if isinstance(self.items, SqliteItemStore):
+            self.items.close()
+
+
+def create_memory_store(path: str, dtype: str = "float16") -> AnnMemoryStore:
+    """Create the memory store of the agent, with its items and vector index under `path`.
+
+    Embeddings come from the shared embedding service, like in `langgraph.json`.
+    """
+    from agent.embeddings import get_embedding_service
+
+    return AnnMemoryStore(index={"dims": 384, "embed": get_embedding_service()}, path=path, dtype=dtype)
@@ -0,0 +1,221 @@
+"""Chat model registry and small-to-large model cascade.
+
+Models are named by a `provider:model` spec, e.g. `openai:gpt-4o-mini`,
+`ollama:gemma3:27b`, or `local:<model>` for the OpenAI-compatible inference
+server of `load_model`. Each pipeline stage (detection, parsing, triage,
+intake, response, and the summary of long threads) picks its model from the
+`Configuration`.
+
+Structured stages go through `StructuredOutput` (`agent/structured.py`), which
+repairs malformed answers locally and asks again within a retry budget.
+When a cascade model is configured, structured stages try that small model
+first and escalate to the stage model only when its output does not validate
+or its self-reported confidence is below the threshold. Latency and escalation
+counts are recorded per stage in `model_stats`.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import BaseModel
+
+from agent.prompt_cache import prompt_usage
+from agent.structured import StructuredOutput
+from agent.telemetry import telemetry, telemetry_handler
+from agent.utils import load_chatollama_model, load_model
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("detection", "parsing", "triage", "intake", "response", "summary")
+
+# Models registered under a spec of their own, e.g. fakes in benchmarks
+_registered: dict[str, "BaseChatModel"] = {}
+
+
+def register_chat_model(spec: str, model: "BaseChatModel") -> None:
+    """Serve `spec` with an already built chat model."""
+    _registered[spec] = model
+    get_chat_model.cache_clear()
+    _stage_model.cache_clear()
+
+
+@lru_cache
+def get_chat_model(spec: str) -> "BaseChatModel":
+    """Return the (process-wide) chat model of a `provider:model` spec."""
+    if spec in _registered:
+        return _registered[spec]
+    # Provider packages are imported on first use to keep startup fast
+    from langchain.chat_models import init_chat_model
+
+    provider, _, name = spec.partition(":")
+    if provider == "ollama":
+        return load_chatollama_model(model=name, callbacks=[prompt_usage, telemetry_handler])
+    if provider == "local":
+        model = load_model(name)
+        model.callbacks = [prompt_usage, telemetry_handler]
+        return model
+    return init_chat_model(spec, callbacks=[prompt_usage, telemetry_handler])
+
+
+def _confidence(output: BaseModel) -> Optional[float]:
+    return getattr(output, "confidence", None)
+
+
+@dataclass
+class StageStats:
+    """Latency and escalation counters of one stage."""
+
+    calls: int
+    escalations: int
+    p50_latency: float
+    p95_latency: float
+
+    @property
+    def escalation_rate(self) -> float:
+        return self.escalations / self.calls if self.calls else 0.0
+
+
+class ModelStats:
+    """Per-stage latency samples (the most recent `window`) and escalation counts."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies: dict[str, deque] = {}
+        self._calls: dict[str, int] = {}
+        self._escalations: dict[str, int] = {}
+
+    def record(self, stage: str, latency: float, escalated: bool = False) -> None:
+        with self._lock:
+            self._latencies.setdefault(stage, deque(maxlen=self.window)).append(latency)
+            self._calls[stage] = self._calls.get(stage, 0) + 1
+            self._escalations[stage] = self._escalations.get(stage, 0) + int(escalated)
+
+    def report(self) -> dict[str, StageStats]:
+        with self._lock:
+            report = {}
+            for stage, samples in self._latencies.items():
+                ordered = sorted(samples)
+                report[stage] = StageStats(
+                    calls=self._calls[stage],
+                    escalations=self._escalations[stage],
+                    p50_latency=ordered[int(0.5 * (len(ordered) - 1))],
+                    p95_latency=ordered[int(0.95 * (len(ordered) - 1))],
+                )
+            return report
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latencies.clear()
+            self._calls.clear()
+            self._escalations.clear()
+
+
+model_stats = ModelStats()
+
+
+class StageModel:
+    """Structured-output model of a stage, optionally behind a cheaper cascade model.
+
+    Args:
+        stage (str): Stage name used in the statistics.
+        model (Runnable): The stage model, with structured output.
+        cascade (Runnable, optional): Small model tried first, with structured
+            output and `include_raw=True`.
+        min_confidence (float): Escalate when the small model reports a lower
+            confidence.
+        confidence (Callable): Extracts the confidence of an output, or None if
+            the schema has none.
+        stats (ModelStats): Where latencies and escalations are recorded.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        model: Runnable,
+        cascade: Optional[Runnable] = None,
+        min_confidence: float = 0.0,
+        confidence: Callable[[Any], Optional[float]] = _confidence,
+        stats: ModelStats = model_stats,
+    ):
+        self.stage = stage
+        self.model = model
+        self.cascade = cascade
+        self.min_confidence = min_confidence
+        self.confidence = confidence
+        self.stats = stats
+
+    def _accept(self, result: Optional[dict]) -> Any:
+        """The small model's output, or None if it must be escalated."""
+        if result is None or result.get("parsing_error") is not None or result.get("parsed") is None:
+            return None
+        parsed = result["parsed"]
+        confidence = self.confidence(parsed)
+        if confidence is not None and confidence < self.min_confidence:
+            return None
+        return parsed
+
+    def _cascade_failed(self, error: Exception) -> None:
+        logger.warning("Cascade model of stage %s failed, escalating: %s", self.stage, error)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
+        start = time.perf_counter()
+        output = None
+        if self.cascade is not None:
+            try:
+                output = self._accept(self.cascade.invoke(input, config))
+            except Exception as e:
+                self._cascade_failed(e)
+        escalated = self.cascade is not None and output is None
+        if output is None:
+            output = self.model.invoke(input, config)
+        if escalated:
+            telemetry.count("agent_model_escalations_total", stage=self.stage)
+        self.stats.record(self.stage, time.perf_counter() - start, escalated)
+        return output
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
+        start = time.perf_counter()
+        output = None
+        if self.cascade is not None:
+            try:
+                output = self._accept(await self.cascade.ainvoke(input, config))
+            except Exception as e:
+                self._cascade_failed(e)
+        escalated = self.cascade is not None and output is None
+        if output is None:
+            output = await self.model.ainvoke(input, config)
+        if escalated:
+            telemetry.count("agent_model_escalations_total", stage=self.stage)
+        self.stats.record(self.stage, time.perf_counter() - start, escalated)
+        return output
+
+
+@lru_cache
+def _stage_model(
+    stage: str, schema: type[BaseModel], spec: str, cascade_spec: Optional[str], min_confidence: float, retries: int
+) -> StageModel:
+    model = StructuredOutput(get_chat_model(spec), schema, retries, stage=stage)
+    cascade = None
+    if cascade_spec and cascade_spec != spec:
+        # Escalating is the cascade model's retry
+        cascade = StructuredOutput(get_chat_model(cascade_spec), schema, retries=0, include_raw=True, stage=stage)
+    return StageModel(stage, model, cascade, min_confidence)
+
+
+def get_stage_model(configuration, stage: str, schema: type[BaseModel]) -> StageModel:
+    """Return the structured-output model of a stage for a configuration."""
+    spec = getattr(configuration, f"{stage}_model")
+    return _stage_model(
+        stage, schema, spec, configuration.cascade_model, configuration.cascade_min_confidence,
+        configuration.structured_output_retries,
+    )
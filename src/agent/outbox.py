@@ -0,0 +1,461 @@
+"""Persistent outbound queue of the emails sent by the agent.
+
+`write_email` does not call Gmail itself: it puts the email in an `Outbox` and
+returns its queued id at once. A background worker drains the queue:
+
+- The sends of each account go through a token bucket (`rate` per second, in
+  bursts of up to `burst`) kept under Gmail's per-user sending quota, so the
+  emails of a batch processed at once do not end in 429s. A 429 pauses the
+  account for the retry delay.
+- The same email (account, recipient, subject and body, whitespace
+  normalized) queued again within the deduplication window returns the first
+  one instead of being sent twice, e.g. when the ReAct loop retries a send
+  under a new tool call id.
+- Sends failing with a retryable error (429, 5xx) are retried with
+  exponential backoff; other errors, or the last retry, mark the email failed.
+  A network error marks it failed too: the email may have been sent before
+  the connection failed, and is not sent a second time.
+
+The queue is a SQLite table, so emails queued before a restart are sent by the
+next worker, and several processes can share it. A worker claims an email in
+one write transaction before sending it, so no two workers send the same email.
+The claim is a lease: an email whose worker died while sending it is sent
+again by another worker once the lease expires, so delivery is at least once.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Optional
+
+from agent.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY, account TEXT NOT NULL, digest TEXT NOT NULL,
+    recipient TEXT NOT NULL, subject TEXT NOT NULL, content TEXT NOT NULL,
+    status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL, message_id TEXT, error TEXT, owner TEXT, lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_digest ON outbox (account, digest, created_at);
+"""
+
+COLUMNS = "id, account, recipient, subject, content, status, attempts, message_id, error"
+QUEUED, SENDING, SENT, FAILED = "queued", "sending", "sent", "failed"
+# Longest the worker sleeps without being woken by a new email
+IDLE_SECONDS = 60.0
+# How often the worker checks the emails waited for that another worker sends
+POLL_SECONDS = 0.2
+# Columns added after the first version of the table
+LEASE_COLUMNS = {"owner": "TEXT", "lease_until": "REAL"}
+
+
+@dataclass
+class OutboxEntry:
+    """An email of the outbox and its delivery status.
+
+    Attributes:
+        id (str): Queued id, returned to the caller at once.
+        status (str): `queued`, `sending`, `sent` or `failed`.
+        message_id (str, optional): Gmail id of the sent message.
+        error (str, optional): Last send error.
+        duplicate (bool): The email was already queued within the
+            deduplication window; this is the earlier entry.
+    """
+
+    id: str
+    account: str
+    to: str
+    subject: str
+    content: str
+    status: str = QUEUED
+    attempts: int = 0
+    message_id: Optional[str] = None
+    error: Optional[str] = None
+    duplicate: bool = False
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SENT, FAILED)
+
+
+def content_digest(account: str, to: str, subject: str, content: str) -> str:
+    """Hash identifying the same email queued twice, up to case of the address and whitespace."""
+    normalized = [account, to.strip().lower(), " ".join(subject.split()), " ".join(content.split())]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` events per second in bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Take a token; returns 0, or the seconds until one is available (nothing is taken)."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Give no token for the next `seconds`."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+def _status(error: Exception) -> Optional[int]:
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return int(status) if status is not None else None
+
+
+def _is_retryable(error: Exception) -> bool:
+    from agent.google_batch import _is_retryable as is_retryable_google_error
+
+    # A send is not idempotent
+    return is_retryable_google_error(error, idempotent=False)
+
+
+@lru_cache
+def _send_batcher(window_ms: int):
+    from agent.google_batch import MutationBatcher
+
+    # Retries are left to the outbox, so they go through the rate limiter
+    return MutationBatcher(window=window_ms / 1000, max_retries=0)
+
+
+@dataclass(frozen=True)
+class GmailSender:
+    """Sends an outbox entry with Gmail; the sends started together share a batch request."""
+
+    batch_window_ms: int = 50
+
+    def __call__(self, entry: OutboxEntry) -> Future:
+        from agent.google_auth import create_message, get_gmail_service
+
+        service = get_gmail_service(entry.account)
+        message = create_message(entry.to, entry.subject, entry.content)
+        request = service.users().messages().send(userId="me", body=message)
+        return _send_batcher(self.batch_window_ms).submit(request, group=entry.account)
+
+
+class Outbox:
+    """SQLite queue of outgoing emails drained by a background worker.
+
+    Args:
+        path (str, optional): SQLite database of the queue; in memory if None,
+            in which case queued emails are lost with the process.
+        send (Callable): Sends an entry and returns a future of the Gmail
+            response (a dict with its `id`).
+        rate (float): Sends per second per account.
+        burst (int): Sends an account can make at once after being idle.
+        max_retries (int): Retries of a send failing with a retryable error.
+        backoff_base (float): Delay before the first retry, doubled on each retry.
+        backoff_max (float): Upper bound of the retry delay.
+        retryable (Callable): Whether a send error is transient.
+        lease_seconds (float): How long a worker owns an email it is sending.
+            Another worker sends it again once the lease has expired, so it
+            must exceed the longest send.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        send: Optional[Callable[[OutboxEntry], Future]] = None,
+        rate: float = 2.0,
+        burst: int = 10,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        retryable: Callable[[Exception], bool] = _is_retryable,
+        lease_seconds: float = 300.0,
+    ):
+        self.path = path
+        self.send = send or GmailSender()
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retryable = retryable
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._waiters: dict[str, list[Future]] = defaultdict(list)
+        self._buckets: dict[str, TokenBucket] = {}
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            columns = {name for _, name, *_ in self._conn.execute("PRAGMA table_info(outbox)")}
+            for name, type_ in LEASE_COLUMNS.items():
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {name} {type_}")
+        # Emails other workers are sending are left to them until their lease expires
+        if self.pending():
+            self._start()
+
+    def _entry(self, row: tuple) -> OutboxEntry:
+        id, account, to, subject, content, status, attempts, message_id, error = row
+        return OutboxEntry(id, account, to, subject, content, status, attempts, message_id, error)
+
+    def enqueue(self, account: str, to: str, subject: str, content: str, dedup_seconds: float = 600.0) -> OutboxEntry:
+        """Queue an email and return its entry, or the same email queued within `dedup_seconds`."""
+        digest = content_digest(account, to, subject, content)
+        now = time.time()
+        with self._lock, self._conn:
+            if dedup_seconds > 0:
+                row = self._conn.execute(
+                    f"SELECT {COLUMNS} FROM outbox WHERE account = ? AND digest = ? AND created_at >= ? AND status != ? "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (account, digest, now - dedup_seconds, FAILED),
+                ).fetchone()
+                if row is not None:
+                    entry = self._entry(row)
+                    entry.duplicate = True
+                    telemetry.count("agent_outbox_emails_total", result="duplicate")
+                    return entry
+            entry = OutboxEntry(uuid.uuid4().hex, account, to, subject, content)
+            self._conn.execute(
+                "INSERT INTO outbox (id, account, digest, recipient, subject, content, status, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.id, account, digest, to, subject, content, QUEUED, now, now),
+            )
+        telemetry.count("agent_outbox_emails_total", result="queued")
+        self._start()
+        self._wake.set()
+        return entry
+
+    def get(self, id: str) -> Optional[OutboxEntry]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {COLUMNS} FROM outbox WHERE id = ?", (id,)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def pending(self) -> int:
+        """Number of emails not sent or failed yet."""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN (?, ?)", (QUEUED, SENDING)
+            ).fetchone()
+        return count
+
+    def future(self, id: str) -> Future:
+        """A future of the entry once it is sent or failed."""
+        future: Future = Future()
+        with self._lock:
+            row = self._conn.execute(f"SELECT {COLUMNS} FROM outbox WHERE id = ?", (id,)).fetchone()
+            if row is None:
+                raise KeyError(id)
+            entry = self._entry(row)
+            if entry.done:
+                future.set_result(entry)
+            else:
+                self._waiters[id].append(future)
+        # The email may be sent by the worker of another process
+        self._start()
+        return future
+
+    def wait(self, id: str, timeout: Optional[float] = None) -> OutboxEntry:
+        """Wait until an email is sent or failed; returns it as it is after `timeout` otherwise."""
+        try:
+            return self.future(id).result(timeout=timeout)
+        except TimeoutError:
+            return self.get(id)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued email is sent or failed; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            ids = [id for (id,) in self._conn.execute("SELECT id FROM outbox WHERE status IN (?, ?)", (QUEUED, SENDING))]
+        for id in ids:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                self.future(id).result(timeout=remaining)
+            except TimeoutError:
+                return False
+        return True
+
+    def close(self) -> None:
+        """Stop the worker; queued emails stay in the database."""
+        self._closed = True
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join()
+        self._conn.close()
+
+    # Worker
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._worker is None and not self._closed:
+                self._worker = threading.Thread(target=self._run, name="outbox", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                delay = self._dispatch()
+            except Exception:
+                logger.exception("Outbox worker failed")
+                delay = 1.0
+            self._wake.wait(delay)
+
+    def _bucket(self, account: str) -> TokenBucket:
+        bucket = self._buckets.get(account)
+        if bucket is None:
+            bucket = self._buckets[account] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _dispatch(self) -> float:
+        """Start the sends that are due and allowed; returns the seconds until the next one."""
+        now, delay, started = time.time(), IDLE_SECONDS, []
+        with self._lock, self._conn:
+            # Holds the write lock until the claims are committed, so another
+            # process cannot select the same emails in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            # Emails whose worker died while sending them are sent again
+            recovered = self._conn.execute(
+                "UPDATE outbox SET status = ?, owner = NULL WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, SENDING, now),
+            ).rowcount
+            if recovered:
+                logger.warning("Sending again %d emails whose worker stopped while sending them", recovered)
+            (lease_until,) = self._conn.execute(
+                "SELECT MIN(lease_until) FROM outbox WHERE status = ?", (SENDING,)
+            ).fetchone()
+            if lease_until is not None:
+                delay = min(delay, max(0.0, lease_until - now))
+            rows = self._conn.execute(
+                f"SELECT {COLUMNS}, next_attempt_at FROM outbox WHERE status = ? ORDER BY next_attempt_at, created_at",
+                (QUEUED,),
+            ).fetchall()
+            for *row, next_attempt_at in rows:
+                if next_attempt_at > now:
+                    delay = min(delay, next_attempt_at - now)
+                    break
+                entry = self._entry(tuple(row))
+                wait = self._bucket(entry.account).take()
+                if wait:
+                    delay = min(delay, wait)
+                    continue
+                claimed = self._conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = attempts + 1, owner = ?, lease_until = ? "
+                    "WHERE id = ? AND status = ?",
+                    (SENDING, self.owner, now + self.lease_seconds, entry.id, QUEUED),
+                ).rowcount
+                if not claimed:
+                    continue
+                entry.status, entry.attempts = SENDING, entry.attempts + 1
+                started.append(entry)
+            finished = self._finished_elsewhere()
+            if self._waiters:
+                delay = min(delay, POLL_SECONDS)
+        for entry in finished:
+            self._notify(entry)
+        for entry in started:
+            try:
+                future = self.send(entry)
+            except Exception as e:
+                self._failed(entry, e)
+                continue
+            future.add_done_callback(lambda future, entry=entry: self._sent(entry, future))
+        return delay
+
+    def _finished_elsewhere(self) -> list[OutboxEntry]:
+        """Entries waited for here that are done, e.g. sent by another worker."""
+        ids = list(self._waiters)
+        if not ids:
+            return []
+        rows = self._conn.execute(
+            f"SELECT {COLUMNS} FROM outbox WHERE id IN ({', '.join('?' * len(ids))}) AND status IN (?, ?)",
+            (*ids, SENT, FAILED),
+        ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def _notify(self, entry: OutboxEntry) -> None:
+        with self._lock:
+            waiters = self._waiters.pop(entry.id, [])
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(entry)
+
+    def _sent(self, entry: OutboxEntry, future: Future) -> None:
+        error = future.exception()
+        if error is not None:
+            self._failed(entry, error)
+            return
+        self._finish(entry, SENT, message_id=future.result()["id"])
+
+    def _failed(self, entry: OutboxEntry, error: BaseException) -> None:
+        if not (isinstance(error, Exception) and self.retryable(error)) or entry.attempts > self.max_retries:
+            logger.error("Could not send email %s to %s: %s", entry.id, entry.to, error)
+            self._finish(entry, FAILED, error=str(error))
+            return
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (entry.attempts - 1)) * random.uniform(0.5, 1.0)
+        logger.warning("Sending email %s again in %.2fs after: %s", entry.id, delay, error)
+        with self._lock, self._conn:
+            if _status(error) == 429:
+                self._bucket(entry.account).pause(delay)
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, error = ?, owner = NULL WHERE id = ?",
+                (QUEUED, time.time() + delay, str(error), entry.id),
+            )
+        telemetry.count("agent_outbox_emails_total", result="retried")
+        self._wake.set()
+
+    def _finish(self, entry: OutboxEntry, status: str, message_id: Optional[str] = None, error: Optional[str] = None) -> None:
+        entry.status, entry.message_id, entry.error = status, message_id, error
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, message_id = ?, error = ?, owner = NULL WHERE id = ?",
+                (status, message_id, error, entry.id),
+            )
+        telemetry.count("agent_outbox_emails_total", result=status)
+        self._notify(entry)
+
+
+@lru_cache
+def _outbox_for(path: str, rate: float, burst: int, batch_window_ms: int) -> Outbox:
+    return Outbox(path, GmailSender(batch_window_ms), rate, burst)
+
+
+def get_outbox(configuration) -> Outbox:
+    """Return the process-wide outbox of a configuration."""
+    return _outbox_for(
+        configuration.outbox_path,
+        configuration.outbox_rate_per_second,
+        configuration.outbox_burst,
+        configuration.google_batch_window_ms,
+    )
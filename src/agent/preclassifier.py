@@ -0,0 +1,274 @@
+"""Cheap first-stage classification of obvious emails.
+
+Marketing newsletters and CI notifications make up a large part of the traffic
+and are easy to recognize. Header rules and a small naive Bayes model over
+TF-IDF weighted tokens classify them with a confidence score; only emails below
+the configured confidence threshold are sent to the triage model.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from email.message import EmailMessage
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from agent.state import EmailInput
+from agent.tenants import safe_user_id
+from agent.utils import split_few_shot_example
+
+NOREPLY_SENDER = re.compile(r"^(no-?reply|do-?not-?reply|notifications?|alerts?|mailer-daemon)\b", re.IGNORECASE)
+CI_KEYWORDS = re.compile(
+    r"\b(build|pipeline|deploy(ment)?|ci|workflow|job|run)\b.{0,40}?\b(passed|failed|succeeded|success|failure|fixed|broken|cancelled)\b"
+    r"|\b(github actions|gitlab ci|jenkins|circleci|buildkite)\b",
+    re.IGNORECASE,
+)
+MARKETING_KEYWORDS = re.compile(
+    r"\b(unsubscribe|newsletter|% off|discount|promo(tion)?|special offer|limited time|webinar)\b",
+    re.IGNORECASE,
+)
+TOKEN = re.compile(r"[a-z][a-z0-9']+")
+
+# The model stays disabled until every label has this many training examples
+MIN_EXAMPLES_PER_LABEL = 5
+
+
+@dataclass
+class Prediction:
+    """A first-stage classification and how it was made."""
+
+    classification: str
+    confidence: float
+    stage: str
+    reasoning: str
+
+
+@dataclass
+class PreClassifierStats:
+    """How many emails each stage classified."""
+
+    rules: int = 0
+    model: int = 0
+    passthrough: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.rules + self.model + self.passthrough
+
+    def hit_rate(self, stage: str) -> float:
+        return getattr(self, stage) / self.total if self.total else 0.0
+
+
+def _tokens(text: str) -> list[str]:
+    return TOKEN.findall(text.lower())
+
+
+def email_text(email_info: EmailInput) -> str:
+    """The text the model is trained and evaluated on."""
+    return f"{email_info.author_name} {email_info.author_email} {email_info.subject} {email_info.email_thread}"
+
+
+def classify_by_rules(email_info: EmailInput, headers: Optional[EmailMessage] = None) -> Optional[Prediction]:
+    """Classify an email from its headers and sender, if a rule applies."""
+    headers = headers if headers is not None else {}
+    content = f"{email_info.subject}\n{email_info.email_thread}"
+    sender = email_info.author_email.split("@")[0]
+
+    is_list = any(headers.get(name) for name in ("List-Unsubscribe", "List-Id")) or str(
+        headers.get("Precedence", "")
+    ).lower() in ("bulk", "list", "junk")
+    is_automated = bool(NOREPLY_SENDER.match(sender)) or str(headers.get("Auto-Submitted", "no")).lower() != "no"
+
+    if (is_list or is_automated) and CI_KEYWORDS.search(content):
+        return Prediction("notify", 0.95, "rules", "Automated build system notification.")
+    if is_list and MARKETING_KEYWORDS.search(content):
+        return Prediction("ignore", 0.97, "rules", "Bulk marketing email with an unsubscribe link.")
+    if is_list:
+        return Prediction("ignore", 0.85, "rules", "Bulk email sent to a mailing list.")
+    if is_automated:
+        return Prediction("notify", 0.7, "rules", "Automated email from a no-reply sender.")
+    return None
+
+
+class NaiveBayesModel:
+    """Multinomial naive Bayes over TF-IDF weighted tokens."""
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.idf: dict[str, float] = {}
+        self.priors: dict[str, float] = {}
+        self.weights: dict[str, dict[str, float]] = {}
+        self.totals: dict[str, float] = {}
+
+    @property
+    def trained(self) -> bool:
+        return bool(self.priors)
+
+    def fit(self, texts: list[str], labels: list[str]) -> "NaiveBayesModel":
+        counts = Counter(labels)
+        if len(counts) < 2 or min(counts.values()) < MIN_EXAMPLES_PER_LABEL:
+            return self
+
+        documents = [Counter(_tokens(text)) for text in texts]
+        document_frequency = Counter(token for document in documents for token in document)
+        self.idf = {token: math.log((1 + len(documents)) / (1 + df)) + 1 for token, df in document_frequency.items()}
+        self.priors = {label: math.log(count / len(labels)) for label, count in counts.items()}
+        self.weights = {label: Counter() for label in counts}
+        for document, label in zip(documents, labels):
+            for token, count in document.items():
+                self.weights[label][token] += count * self.idf[token]
+        self.totals = {label: sum(weights.values()) for label, weights in self.weights.items()}
+        return self
+
+    def predict_proba(self, text: str) -> dict[str, float]:
+        tokens = [token for token in _tokens(text) if token in self.idf]
+        vocabulary = len(self.idf)
+        scores = {}
+        for label, prior in self.priors.items():
+            weights, total = self.weights[label], self.totals[label]
+            scores[label] = prior + sum(
+                math.log((weights.get(token, 0.0) + self.alpha) / (total + self.alpha * vocabulary))
+                for token in tokens
+            )
+        top = max(scores.values())
+        exp = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp.values())
+        return {label: value / norm for label, value in exp.items()}
+
+    def to_dict(self) -> dict:
+        return {"alpha": self.alpha, "idf": self.idf, "priors": self.priors, "weights": self.weights}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NaiveBayesModel":
+        model = cls(alpha=data["alpha"])
+        model.idf = data["idf"]
+        model.priors = data["priors"]
+        model.weights = data["weights"]
+        model.totals = {label: sum(weights.values()) for label, weights in model.weights.items()}
+        return model
+
+
+def _label(routing: str) -> Optional[str]:
+    match = re.search(r"\b(ignore|notify|respond)\b", routing, re.IGNORECASE)
+    return match.group(1).lower() if match else None
+
+
+class PreClassifier:
+    """Header rules followed by a small trained model.
+
+    Args:
+        threshold (float): Minimum confidence for a first-stage result to be used.
+        model (NaiveBayesModel, optional): A trained text model.
+    """
+
+    def __init__(self, threshold: float = 0.9, model: Optional[NaiveBayesModel] = None):
+        self.threshold = threshold
+        self.model = model or NaiveBayesModel()
+        self.stats = PreClassifierStats()
+
+    def fit(self, texts: list[str], labels: list[str]) -> "PreClassifier":
+        self.model = NaiveBayesModel().fit(texts, labels)
+        return self
+
+    def fit_from_examples(self, examples: Iterable) -> "PreClassifier":
+        """Train from stored few-shot examples, labeled with their correct routing.
+
+        Args:
+            examples (List[Item | TriageExample]): Records of the example store
+                (`agent/examples.py`), or items whose value has the format used
+                by `format_few_shot_examples`.
+        """
+        texts, labels = [], []
+        for example in examples:
+            if hasattr(example, "correct"):
+                texts.append(email_text(example.email))
+                labels.append(example.correct)
+                continue
+            email_part, _, correct_routing = split_few_shot_example(example.value)
+            label = _label(correct_routing)
+            if label is not None:
+                texts.append(email_part)
+                labels.append(label)
+        return self.fit(texts, labels)
+
+    def predict(self, email_info: EmailInput, headers: Optional[EmailMessage] = None) -> Optional[Prediction]:
+        """Classify an email if one of the stages is confident enough.
+
+        Returns:
+            Optional[Prediction]: The first-stage classification, or None if the
+                email should be classified by the triage model.
+        """
+        prediction = classify_by_rules(email_info, headers)
+        if prediction is not None and prediction.confidence >= self.threshold:
+            self.stats.rules += 1
+            return prediction
+
+        if self.model.trained:
+            probabilities = self.model.predict_proba(email_text(email_info))
+            label, confidence = max(probabilities.items(), key=lambda item: item[1])
+            # The model never short-circuits emails that may need a reply
+            if label != "respond" and confidence >= self.threshold:
+                self.stats.model += 1
+                return Prediction(label, confidence, "model", "Similar to previously triaged emails.")
+
+        self.stats.passthrough += 1
+        return None
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.model.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.9) -> "PreClassifier":
+        with open(path) as f:
+            return cls(threshold=threshold, model=NaiveBayesModel.from_dict(json.load(f)))
+
+
+def train_from_store(store, user_id: str) -> PreClassifier:
+    """Train a pre-classifier from the triage examples of a user kept in a store.
+
+    Args:
+        store (BaseStore): The store holding the examples.
+        user_id (str): The user whose corrections are learned, e.g.
+            `Configuration.langgraph_user_id`.
+    """
+    examples = store.search(("email_assistant", user_id, "examples"), limit=10_000)
+    return PreClassifier().fit_from_examples(examples)
+
+
+def model_path_for(model_path: Optional[str], user_id: str) -> Optional[str]:
+    """Return the model file of a user.
+
+    A directory holds one model per user (`<user_id>.json`); a user without a
+    file there only gets the header rules. A file is the model of every user.
+    """
+    if model_path is None or not os.path.isdir(model_path):
+        return model_path
+    path = os.path.join(model_path, f"{safe_user_id(user_id)}.json")
+    return path if os.path.exists(path) else None
+
+
+@lru_cache(maxsize=256)
+def _preclassifier_for(threshold: float, model_path: Optional[str]) -> PreClassifier:
+    if model_path:
+        return PreClassifier.load(model_path, threshold=threshold)
+    return PreClassifier(threshold=threshold)
+
+
+def get_preclassifier(configuration) -> Optional[PreClassifier]:
+    """Return the process-wide pre-classifier of the user of a configuration.
+
+    Args:
+        configuration (Configuration): The agent configuration.
+
+    Returns:
+        Optional[PreClassifier]: The pre-classifier, shared by the users of the
+            same model file, or None if disabled.
+    """
+    if not configuration.preclassifier:
+        return None
+    model_path = model_path_for(configuration.preclassifier_model_path, configuration.langgraph_user_id)
+    return _preclassifier_for(configuration.preclassifier_threshold, model_path)
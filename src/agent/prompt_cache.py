@@ -0,0 +1,168 @@
+"""Memoized system prompts and provider prompt-cache accounting.
+
+The system prompts only depend on the user profile and the prompt
+instructions of a tenant, which rarely change. `PromptCache` renders each of
+them once per tenant version and returns the exact same string afterwards. Keeping the
+static system prompt first, byte-identical across calls, with the
+per-email content in later messages lets OpenAI prompt caching and the Ollama
+KV cache reuse the prefix.
+
+`PromptUsage` is a callback handler that records the input tokens and the
+provider-reported cached input tokens of every chat model call.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import SystemMessage
+from langchain_core.outputs import LLMResult
+
+from agent.cache import CacheStats
+from agent.prompts import agent_system_prompt_memory, intake_system_prompt, triage_system_prompt
+from agent.telemetry import telemetry
+
+# The retrieved examples change with every email, so they are sent in their
+# own message after the system prompt (see `agent/examples.py`)
+FEW_SHOT_PLACEHOLDER = "Corrected classifications of similar emails, if any, are given before the email."
+
+
+class PromptCache:
+    """LRU cache of rendered prompts keyed by template name and tenant version.
+
+    A tenant's `profile` and `prompt_instructions` are replaced, never
+    mutated, when its file is reloaded, so the identity of the two dicts
+    identifies the version of the prompt inputs without hashing them.
+
+    Args:
+        max_entries (int): Maximum number of rendered prompts kept, i.e. a few
+            per active user.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # (name, id(profile), id(prompt_instructions)) -> (profile, prompt_instructions, prompt).
+        # The dicts are kept so their ids are not reused while the entry exists
+        self._prompts: OrderedDict[tuple[str, int, int], tuple[dict, dict, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _get(self, name: str, profile: dict, prompt_instructions: dict, build) -> Any:
+        key = (name, id(profile), id(prompt_instructions))
+        with self._lock:
+            entry = self._prompts.get(key)
+            if entry is not None and entry[0] is profile and entry[1] is prompt_instructions:
+                self._prompts.move_to_end(key)
+                self._hits += 1
+                telemetry.count("agent_cache_requests_total", cache="prompt", result="hit")
+                return entry[2]
+            self._misses += 1
+        telemetry.count("agent_cache_requests_total", cache="prompt", result="miss")
+        prompt = build()
+        with self._lock:
+            self._prompts[key] = (profile, prompt_instructions, prompt)
+            while len(self._prompts) > self.max_entries:
+                self._prompts.popitem(last=False)
+        return prompt
+
+    def triage_system_prompt(self, profile: dict, prompt_instructions: dict) -> str:
+        def build() -> str:
+            rules = prompt_instructions["triage_rules"]
+            return triage_system_prompt.format(
+                full_name=profile["full_name"],
+                name=profile["name"],
+                user_profile_background=profile["user_profile_background"],
+                triage_no=rules["ignore"],
+                triage_notify=rules["notify"],
+                triage_email=rules["respond"],
+                examples=FEW_SHOT_PLACEHOLDER,
+            )
+
+        return self._get("triage", profile, prompt_instructions, build)
+
+    def intake_system_prompt(self, profile: dict, prompt_instructions: dict) -> str:
+        return self._get(
+            "intake",
+            profile,
+            prompt_instructions,
+            lambda: intake_system_prompt.format(
+                triage_system_prompt=self.triage_system_prompt(profile, prompt_instructions)
+            ),
+        )
+
+    def agent_system_message(self, profile: dict, prompt_instructions: dict) -> SystemMessage:
+        """The response agent's system message, shared by every agent step."""
+        return self._get(
+            "agent",
+            profile,
+            prompt_instructions,
+            lambda: SystemMessage(
+                content=agent_system_prompt_memory.format(instructions=prompt_instructions["agent_instructions"], **profile)
+            ),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._prompts.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(hits=self._hits, misses=self._misses)
+
+
+@dataclass
+class PromptUsageStats:
+    """Token usage of the chat models of one provider model."""
+
+    calls: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def cached_ratio(self) -> float:
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+
+class PromptUsage(BaseCallbackHandler):
+    """Callback handler aggregating input and cached input tokens per model.
+
+    Cached tokens come from `usage_metadata["input_token_details"]["cache_read"]`,
+    which OpenAI reports. Ollama does not report prefix reuse, so its calls only
+    count input tokens.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, PromptUsageStats] = {}
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                metadata = message.response_metadata
+                model = metadata.get("model_name") or metadata.get("model") or "unknown"
+                cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+                with self._lock:
+                    stats = self._stats.setdefault(model, PromptUsageStats())
+                    stats.calls += 1
+                    stats.input_tokens += usage.get("input_tokens", 0)
+                    stats.cached_tokens += cached
+
+    def stats(self) -> dict[str, PromptUsageStats]:
+        """Usage per model name."""
+        with self._lock:
+            return {model: PromptUsageStats(**vars(stats)) for model, stats in self._stats.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+prompt_cache = PromptCache()
+prompt_usage = PromptUsage()
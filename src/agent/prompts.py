@@ -87,6 +87,27 @@ Emails that are worth responding to:
 </ Few shot examples >
 """
 
+# Intake prompt: detection, parsing and triage in a single call
+intake_system_prompt = """{triage_system_prompt}
+< Intake >
+First decide if the user has received an email that they want managed, or if they have another request (question, demand to send an email, etc.).
+
+If there is no received email, set email_found to false and leave the other fields empty.
+
+If there is a received email, set email_found to true, extract the email details (sender, recipient, subject and body) and classify it using the instructions and rules above.
+</ Intake >
+"""
+
+# Memories searched while the email was being triaged (see agent/speculation.py)
+prefetched_memories_header = "Memories about this sender and subject, already searched for you:"
+prefetched_memories_prompt = prefetched_memories_header + """
+{memories}
+Only use the search memory tool if you need other information."""
+
+# Summary of a chunk of the history of a long email thread (see agent/threads.py)
+thread_summary_prompt = """Summarize this part of an email thread in at most {words} words. \
+Keep who wrote what, dates, decisions, requests and open questions. Answer with the summary only."""
+
 triage_user_prompt = """
 Please determine how to handle the below email thread:
 
@@ -106,7 +127,7 @@ You have access to the following tools to help manage {name}'s communications an
 
 1. write_email(to, subject, content) - Send emails to specified recipients
 2. schedule_meeting(attendees, subject, duration_minutes, preferred_day) - Schedule calendar meetings
-3. check_calendar_availability(day) - Check available time slots for a given day
+3. check_calendar_availability(day, min_duration_minutes, end_day) - Check free time slots for a given day or range of days
 4. manage_memory - Store any relevant information about contacts, actions, discussion, etc. in memory for future reference
 5. search_memory - Search for any relevant information that may have been stored in memory
 </ Tools >
@@ -0,0 +1,119 @@
+"""Memory search started speculatively while an email is being triaged.
+
+For emails that need an answer, the response agent nearly always starts by
+searching memory for the sender and the subject, one model round trip after
+triage has finished. Both only depend on the parsed email, so the triage
+nodes start that search as soon as the email is parsed and run it alongside
+the classification. A `respond` email takes the results into the response
+agent's first prompt (see `agent.graph._route_email`); for `ignore` and
+`notify` the search is cancelled, or its result dropped if it already ran.
+When the fused intake call has to extract the email itself, the search can
+only start after it, but it still saves the response agent a round trip.
+"""
+
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import Future
+from typing import Optional, Union
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import CONFIG_KEY_STORE
+
+from agent.configuration import Configuration
+from agent.io_pool import get_io_executor
+from agent.prompts import prefetched_memories_prompt
+from agent.state import EmailInput
+from agent.telemetry import telemetry
+from agent.tenants import get_tenant
+
+logger = logging.getLogger(__name__)
+
+MemorySearch = Union[Future, "asyncio.Task"]
+
+
+def memory_query(email_info: EmailInput) -> str:
+    """The query the response agent would search memory with: sender and subject."""
+    return f"{email_info.author_name} {email_info.author_email} {email_info.subject}"
+
+
+def format_memories(items: list) -> str:
+    """Render search results into the response agent's first prompt."""
+    lines = [
+        f"- {item.value.get('content', item.value) if isinstance(item.value, dict) else item.value}"
+        for item in items
+    ]
+    return prefetched_memories_prompt.format(memories="\n".join(lines) or "No memories found.")
+
+
+def _store(config: RunnableConfig):
+    return (config.get("configurable") or {}).get(CONFIG_KEY_STORE)
+
+
+def _search(store, email_info: EmailInput, configuration: Configuration) -> str:
+    namespace = get_tenant(configuration).memory_namespace
+    items = store.search(namespace, query=memory_query(email_info), limit=configuration.speculative_memory_limit)
+    return format_memories(items)
+
+
+async def _asearch(store, email_info: EmailInput, configuration: Configuration) -> str:
+    namespace = get_tenant(configuration).memory_namespace
+    items = await store.asearch(namespace, query=memory_query(email_info), limit=configuration.speculative_memory_limit)
+    return format_memories(items)
+
+
+def start_memory_search(
+    email_info: EmailInput, config: RunnableConfig, configuration: Configuration
+) -> Optional[MemorySearch]:
+    """Start searching the user's memories on the I/O pool, if enabled and a store is set."""
+    store = _store(config)
+    if not configuration.speculative_memory_search or store is None:
+        return None
+    context = contextvars.copy_context()
+    return get_io_executor(configuration.io_max_workers).submit(context.run, _search, store, email_info, configuration)
+
+
+def astart_memory_search(
+    email_info: EmailInput, config: RunnableConfig, configuration: Configuration
+) -> Optional[MemorySearch]:
+    """Async version of `start_memory_search`, running as a task of the current loop."""
+    store = _store(config)
+    if not configuration.speculative_memory_search or store is None:
+        return None
+    return asyncio.ensure_future(_asearch(store, email_info, configuration))
+
+
+def _failed(error: BaseException) -> None:
+    # The response agent can still search memory itself
+    logger.warning("Speculative memory search failed: %r", error)
+    telemetry.count("agent_speculation_total", result="failed")
+
+
+def take_memories(search: Optional[MemorySearch], classification: str) -> Optional[str]:
+    """The memories for a `respond` email; the search is dropped for other classifications."""
+    if search is None:
+        return None
+    if classification != "respond":
+        search.cancel()
+        telemetry.count("agent_speculation_total", result="dropped")
+        return None
+    try:
+        memories = search.result()
+    except Exception as e:
+        _failed(e)
+        return None
+    telemetry.count("agent_speculation_total", result="used")
+    return memories
+
+
+async def atake_memories(search: Optional[MemorySearch], classification: str) -> Optional[str]:
+    """Async version of `take_memories`."""
+    if search is None or classification != "respond":
+        return take_memories(search, classification)
+    try:
+        memories = await search
+    except Exception as e:
+        _failed(e)
+        return None
+    telemetry.count("agent_speculation_total", result="used")
+    return memories
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import Optional
 from typing_extensions import TypedDict, Literal, Annotated
 from langgraph.graph import add_messages
 
@@ -14,6 +15,12 @@ class Router(BaseModel):
         "'notify' for important information that doesn't need a response, "
         "'respond' for emails that need a reply or for any user request.",
     )
+    confidence: Optional[float] = Field(
+        default=None,
+        ge=0,
+        le=1,
+        description="How confident you are in the classification, between 0 and 1.",
+    )
 
 
 class EmailInput(BaseModel):
@@ -40,6 +47,26 @@ class EmailInput(BaseModel):
 class email_detection(BaseModel):
     email_found: bool = Field(default=False, description="True if the user have recieved an email, False otherwise")
 
+class EmailIntake(BaseModel):
+    """Detect, parse and triage the latest message in a single pass."""
+
+    email_found: bool = Field(default=False, description="True if the user have recieved an email, False otherwise")
+    email: Optional[EmailInput] = Field(
+        default=None,
+        description="The details of the received email. Leave empty if no email was received.",
+    )
+    reasoning: str = Field(
+        default="",
+        description="Step-by-step reasoning behind the classification. Leave empty if no email was received.",
+    )
+    classification: Optional[Literal["ignore", "respond", "notify"]] = Field(
+        default=None,
+        description="The classification of the received email: 'ignore' for irrelevant emails, "
+        "'notify' for important information that doesn't need a response, "
+        "'respond' for emails that need a reply. Leave empty if no email was received.",
+    )
+
+
 class State(TypedDict):
     email_input: str
     messages: Annotated[list, add_messages]
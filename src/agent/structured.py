@@ -0,0 +1,285 @@
+"""Structured output of the pipeline models, with local repair and a retry budget.
+
+Asked for JSON, a local model sometimes answers with something close to it: a
+fenced code block, a sentence around the object, Python literals, a trailing
+comma, or a reply cut off at the token limit. Parsing such an answer raised
+and failed the whole graph run.
+
+`StructuredOutput` wraps a chat model for a schema:
+
+- Ollama models decode under the JSON schema of the schema (Ollama's `format`
+  constrained decoding), so their answers are JSON of the right shape by
+  construction. Other providers keep their native structured output.
+- An answer that does not validate is repaired locally by `repair_json` and
+  validated again, which costs no model call.
+- Only when repair fails is the model asked again, with the validation error,
+  while the retry budget of the call lasts. The last error is raised once it
+  is spent.
+
+Outcomes are counted per stage in `agent_structured_output_total` (`valid`,
+`repaired`, `retried`, `failed`).
+"""
+
+import json
+import logging
+import re
+from typing import Any, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, convert_to_messages
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import BaseModel, ValidationError
+
+from agent.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+WORD = re.compile(r"[A-Za-z_]+")
+LITERALS = {"True": "true", "False": "false", "None": "null"}
+RETRY_PROMPT = (
+    "Your previous answer could not be used: {error}\n"
+    "Answer again with only a JSON object matching the requested schema, without any other text."
+)
+
+
+class StructuredOutputError(ValueError):
+    """The model gave no valid answer within the retry budget of the call."""
+
+
+def _normalize(text: str) -> tuple[list[str], list[str], list[int], list[list[str]]]:
+    """Rewrite near-JSON as JSON tokens, closing a string a truncated reply left open.
+
+    Returns the rewritten tokens, the brackets still open at the end, and the
+    token positions of the commas after each member with the brackets open
+    there, for cutting off an incomplete last member.
+    """
+    out: list[str] = []
+    stack: list[str] = []
+    members: list[int] = []
+    member_stacks: list[list[str]] = []
+    quote: Optional[str] = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote is not None:
+            if char == "\\" and i + 1 < len(text):
+                # \' is not a JSON escape
+                out.append("'" if text[i + 1] == "'" else text[i : i + 2])
+                i += 2
+                continue
+            if char == quote:
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+        elif char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(char)
+        elif char == ",":
+            members.append(len(out))
+            member_stacks.append(list(stack))
+            out.append(char)
+        else:
+            word = WORD.match(text, i)
+            if word:
+                value = LITERALS.get(word.group(), word.group())
+                if word.end() == len(text):
+                    # A literal cut off at the end, e.g. `tr`
+                    value = next((literal for literal in ("true", "false", "null") if literal.startswith(value)), value)
+                out.append(value)
+                i = word.end()
+                continue
+            out.append(char)
+        i += 1
+    if quote is not None:
+        out.append('"')
+    return out, stack, members, member_stacks
+
+
+def _drop_trailing_comma(out: list[str]) -> None:
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
+
+
+def _close(text: str, stack: list[str]) -> str:
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    elif text.endswith(":"):
+        text += " null"
+    return text + "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+
+def _candidates(text: str) -> list[str]:
+    """Parts of an answer that may hold the JSON object."""
+    text = text.strip()
+    candidates = [text]
+    fenced = FENCE.search(text)
+    if fenced:
+        candidates.append(fenced.group(1).strip())
+    start = text.find("{")
+    if start >= 0:
+        end = text.rfind("}")
+        candidates.append(text[start : end + 1] if end > start else text[start:])
+    return candidates
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """Parse the JSON value of a model answer, repairing it if needed; None if it cannot be.
+
+    Handles code fences and text around the object, single quotes and Python
+    literals, trailing commas, raw newlines in strings, and replies truncated
+    in the middle of a value (open strings, literals and brackets are closed,
+    or the incomplete last member is dropped).
+    """
+    for candidate in _candidates(text):
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            pass
+        tokens, stack, members, member_stacks = _normalize(candidate)
+        attempts = [("".join(tokens), stack)] + [
+            ("".join(tokens[:end]), opened) for end, opened in zip(reversed(members[-3:]), reversed(member_stacks[-3:]))
+        ]
+        for prefix, opened in attempts:
+            try:
+                return json.loads(_close(prefix, opened))
+            except ValueError:
+                continue
+    return None
+
+
+def _validate(schema: type[BaseModel], value: Any) -> BaseModel:
+    try:
+        return schema.model_validate(value)
+    except ValidationError:
+        # Some models wrap the object, e.g. {"Router": {...}} or {"properties": {...}}
+        if isinstance(value, dict) and len(value) == 1:
+            (inner,) = value.values()
+            if isinstance(inner, dict):
+                return schema.model_validate(inner)
+        raise
+
+
+def _raw_text(raw: Optional[BaseMessage]) -> str:
+    """The text of an answer that failed to parse, or the arguments of its tool call."""
+    if raw is None:
+        return ""
+    calls = getattr(raw, "tool_calls", None) or []
+    if calls:
+        return json.dumps(calls[0]["args"])
+    invalid = getattr(raw, "invalid_tool_calls", None) or []
+    if invalid and invalid[0].get("args"):
+        return invalid[0]["args"]
+    content = raw.content
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content)
+
+
+def _is_ollama(model) -> bool:
+    return type(model).__name__ == "ChatOllama"
+
+
+class StructuredOutput:
+    """Structured-output model of a schema that repairs and re-asks before failing.
+
+    Args:
+        model (BaseChatModel): The chat model.
+        schema (type[BaseModel]): The schema of the answer.
+        retries (int): Times the model is asked again after an answer that
+            could not be repaired.
+        include_raw (bool): Return `{"raw", "parsed", "parsing_error"}` like
+            `with_structured_output(include_raw=True)` instead of raising.
+        stage (str): Stage name used in the metrics.
+    """
+
+    def __init__(
+        self, model, schema: type[BaseModel], retries: int = 2, include_raw: bool = False, stage: str = "",
+    ):
+        self.schema = schema
+        self.retries = retries
+        self.include_raw = include_raw
+        self.stage = stage
+        self.native = not _is_ollama(model)
+        if self.native:
+            self.model: Runnable = model.with_structured_output(schema, include_raw=True)
+        else:
+            self.model = model.bind(format=schema.model_json_schema())
+
+    def _parse(self, output: Any) -> tuple[Optional[BaseModel], Optional[BaseMessage], Optional[Exception], bool]:
+        """(parsed answer, raw message, error, repaired) of a model output."""
+        if self.native:
+            raw, parsed, error = output.get("raw"), output.get("parsed"), output.get("parsing_error")
+            if parsed is not None and error is None:
+                return parsed, raw, None, False
+        else:
+            raw, error = output, None
+            try:
+                return self.schema.model_validate_json(_raw_text(raw)), raw, None, False
+            except ValueError as e:
+                error = e
+        value = repair_json(_raw_text(raw))
+        if value is not None:
+            try:
+                return _validate(self.schema, value), raw, None, True
+            except ValidationError as e:
+                error = e
+        return None, raw, error or ValueError("The answer is not a JSON object"), False
+
+    def _messages(self, input: Any) -> list[BaseMessage]:
+        if hasattr(input, "to_messages"):
+            return input.to_messages()
+        return convert_to_messages(input if isinstance(input, list) else [input])
+
+    def _retry_messages(self, input: Any, raw: Optional[BaseMessage], error: Exception) -> list[BaseMessage]:
+        answer = AIMessage(content=_raw_text(raw))
+        return [*self._messages(input), answer, HumanMessage(content=RETRY_PROMPT.format(error=error))]
+
+    def _outcome(self, parsed, raw, error, repaired: bool) -> Any:
+        result = "repaired" if repaired else "valid" if parsed is not None else "failed"
+        telemetry.count("agent_structured_output_total", stage=self.stage, result=result)
+        if self.include_raw:
+            return {"raw": raw, "parsed": parsed, "parsing_error": error}
+        if parsed is None:
+            raise StructuredOutputError(f"No valid {self.schema.__name__} after {self.retries + 1} attempts: {error}")
+        return parsed
+
+    def _retrying(self, error: Exception, attempt: int) -> None:
+        telemetry.count("agent_structured_output_total", stage=self.stage, result="retried")
+        logger.warning("Asking again for %s (attempt %d) after: %s", self.schema.__name__, attempt + 2, error)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
+        messages = input
+        for attempt in range(self.retries + 1):
+            parsed, raw, error, repaired = self._parse(self.model.invoke(messages, config))
+            if parsed is not None or attempt == self.retries:
+                break
+            self._retrying(error, attempt)
+            messages = self._retry_messages(input, raw, error)
+        return self._outcome(parsed, raw, error, repaired)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None) -> Any:
+        messages = input
+        for attempt in range(self.retries + 1):
+            parsed, raw, error, repaired = self._parse(await self.model.ainvoke(messages, config))
+            if parsed is not None or attempt == self.retries:
+                break
+            self._retrying(error, attempt)
+            messages = self._retry_messages(input, raw, error)
+        return self._outcome(parsed, raw, error, repaired)
@@ -0,0 +1,457 @@
+"""Metrics and traces of the graph nodes, model calls and tool calls.
+
+`telemetry` records, per node, model and tool, the wall time of every call
+(histograms), token usage, cache hits, retries and Google API requests
+(counters), and a span per call. Metrics are exported in the Prometheus text
+format (`prometheus_text`, or `start_metrics_server` for a `/metrics`
+endpoint) and spans as OTLP/JSON (`otlp_json`), the body an OpenTelemetry
+collector accepts on `/v1/traces`. Span processors can forward finished spans
+elsewhere, e.g. to an OpenTelemetry SDK exporter.
+
+Telemetry is off unless `AGENT_TELEMETRY=1` or `telemetry.enable()` is
+called. When off, every hook returns after checking one attribute, and no
+span or metric is created.
+
+Only the standard library is used, so importing this module is cheap.
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histograms, from cache hits to slow
+# local models
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS_HELP = {
+    "agent_node_duration_seconds": "Wall time of a graph node.",
+    "agent_node_errors_total": "Graph node runs that raised.",
+    "agent_tool_duration_seconds": "Wall time of a tool call.",
+    "agent_tool_errors_total": "Tool calls that raised.",
+    "agent_model_duration_seconds": "Wall time of a chat model call.",
+    "agent_model_errors_total": "Chat model calls that raised.",
+    "agent_model_tokens_total": "Tokens of the chat model calls, by type (input, output, cache_read).",
+    "agent_structured_output_total": "Structured-output answers, by stage and result (valid, repaired, retried, failed).",
+    "agent_model_escalations_total": "Structured-output calls escalated from the cascade model to the stage model.",
+    "agent_cache_requests_total": "Cache lookups, by cache and result (hit, miss).",
+    "agent_google_api_requests_total": "Google API requests built, by method; each one counts against the quota.",
+    "agent_google_http_requests_total": "HTTP round trips to Google APIs (a batch is one round trip).",
+    "agent_google_api_retries_total": "Google API requests retried after a transient error, by method.",
+    "agent_outbox_emails_total": "Emails of the outbox, by result (queued, duplicate, retried, sent, failed).",
+    "agent_speculation_total": "Memory searches started during triage, by outcome (used, dropped, failed).",
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _enabled_from_env() -> bool:
+    return os.environ.get("AGENT_TELEMETRY", "").lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class Span:
+    """A timed operation, in the OpenTelemetry data model."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            # STATUS_CODE_ERROR or STATUS_CODE_UNSET
+            "status": {"code": 2, "message": self.error} if self.error is not None else {"code": 0},
+        }
+        if self.parent_span_id is not None:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("agent_current_span", default=None)
+
+
+class Telemetry:
+    """Process-wide metrics and spans.
+
+    Args:
+        enabled (bool): Record anything at all.
+        max_spans (int): Finished spans kept for `spans` and `otlp_json`; the
+            oldest are dropped first.
+        buckets (tuple): Upper bounds of the latency histograms, in seconds.
+        service_name (str): `service.name` resource attribute of the spans.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_spans: int = 10_000,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        service_name: str = "email-assistant",
+    ):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._histograms: dict[str, dict[Labels, _Histogram]] = {}
+        self._spans: deque[Span] = deque(maxlen=max_spans)
+        self._processors: list[Callable[[Span], None]] = []
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Drop every recorded metric and span."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._spans.clear()
+
+    # Metrics
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add `value` to a counter."""
+        if not self.enabled:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Record a sample of a histogram."""
+        if not self.enabled:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(self.buckets) + 1)
+            histogram.counts[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def counter_value(self, name: str, **labels: str) -> float:
+        """Current value of a counter, summed over the series matching `labels`."""
+        wanted = {(k, str(v)) for k, v in labels.items()}
+        with self._lock:
+            return sum(value for key, value in self._counters.get(name, {}).items() if wanted <= set(key))
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {METRICS_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {METRICS_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip((*self.buckets, float("inf")), histogram.counts):
+                        cumulative += count
+                        le = f'le="{_format_number(bound)}"'
+                        lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # Spans
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Optional[Span]:
+        """Start a span, a child of `parent` or of the current span."""
+        if not self.enabled:
+            return None
+        parent = parent if parent is not None else _current_span.get()
+        return Span(
+            name=name,
+            trace_id=parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}",
+            span_id=f"{random.getrandbits(64):016x}",
+            parent_span_id=parent.span_id if parent is not None else None,
+            start_ns=time.time_ns(),
+            attributes=attributes,
+        )
+
+    def end_span(self, span: Optional[Span], error: Optional[BaseException] = None) -> None:
+        if span is None:
+            return
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self._spans.append(span)
+            processors = list(self._processors)
+        for processor in processors:
+            try:
+                processor(span)
+            except Exception:
+                logger.exception("Span processor %r failed", processor)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Record the enclosed block as a span, the current span within it."""
+        span = self.start_span(name, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            _current_span.reset(token)
+
+    @contextmanager
+    def timed(self, kind: str, name: str) -> Iterator[Optional[Span]]:
+        """Span, `agent_<kind>_duration_seconds` and errors of one call."""
+        if not self.enabled:
+            yield None
+            return
+        start = time.perf_counter()
+        try:
+            with self.span(f"{kind} {name}", **{f"agent.{kind}": name}) as span:
+                yield span
+        except BaseException as e:
+            # GraphInterrupt and the like are control flow, not failures
+            if isinstance(e, Exception) and not type(e).__name__.startswith("Graph"):
+                self.count(f"agent_{kind}_errors_total", **{kind: name})
+            raise
+        finally:
+            self.observe(f"agent_{kind}_duration_seconds", time.perf_counter() - start, **{kind: name})
+
+    def add_span_processor(self, processor: Callable[[Span], None]) -> None:
+        """Call `processor` with every finished span."""
+        with self._lock:
+            self._processors.append(processor)
+
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def otlp_json(self, clear: bool = False) -> dict:
+        """Finished spans as an OTLP/JSON `ExportTraceServiceRequest`.
+
+        Args:
+            clear (bool): Drop the exported spans, so the next export only has
+                the spans finished since.
+        """
+        with self._lock:
+            spans = list(self._spans)
+            if clear:
+                self._spans.clear()
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        }
+
+
+telemetry = Telemetry(enabled=_enabled_from_env())
+
+
+def traced(kind: str, name: Optional[str] = None):
+    """Decorator recording every call of a sync or async function.
+
+    The wrapper keeps the signature of the function, so RunnableLambda and
+    StructuredTool still pass it the `config`.
+
+    Args:
+        kind (str): 'node' or 'tool', the metric family of the calls.
+        name (str, optional): Label of the calls, the function name by default.
+    """
+
+    def decorator(func):
+        label = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not telemetry.enabled:
+                    return await func(*args, **kwargs)
+                with telemetry.timed(kind, label):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not telemetry.enabled:
+                return func(*args, **kwargs)
+            with telemetry.timed(kind, label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """Callback handler recording a span, the wall time and the tokens of model calls.
+
+    Spans are children of the node or tool span the model is called from.
+    """
+
+    run_inline = True
+
+    def __init__(self, telemetry: Telemetry = telemetry):
+        self.telemetry = telemetry
+        self._runs: dict[UUID, tuple[Span, str, float]] = {}
+
+    def _start(self, serialized: Optional[dict], run_id: UUID, metadata: Optional[dict]) -> None:
+        if not self.telemetry.enabled:
+            return
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or (serialized or {}).get("name") or "unknown"
+        span = self.telemetry.start_span(f"chat {model}", **{"gen_ai.request.model": model})
+        if span is None:
+            return
+        if metadata.get("ls_provider"):
+            span.attributes["gen_ai.system"] = metadata["ls_provider"]
+        self._runs[run_id] = (span, model, time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._start(serialized, run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._start(serialized, run_id, metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        span, model, start = run
+        tokens = {"input": 0, "output": 0, "cache_read": 0}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    tokens["input"] += usage.get("input_tokens", 0)
+                    tokens["output"] += usage.get("output_tokens", 0)
+                    tokens["cache_read"] += (usage.get("input_token_details") or {}).get("cache_read") or 0
+        for kind, value in tokens.items():
+            if value:
+                self.telemetry.count("agent_model_tokens_total", value, model=model, type=kind)
+        span.attributes["gen_ai.usage.input_tokens"] = tokens["input"]
+        span.attributes["gen_ai.usage.output_tokens"] = tokens["output"]
+        self.telemetry.observe("agent_model_duration_seconds", time.perf_counter() - start, model=model)
+        self.telemetry.end_span(span)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        span, model, start = run
+        self.telemetry.count("agent_model_errors_total", model=model)
+        self.telemetry.observe("agent_model_duration_seconds", time.perf_counter() - start, model=model)
+        self.telemetry.end_span(span, error)
+
+
+telemetry_handler = TelemetryCallbackHandler()
+
+
+def start_metrics_server(port: int = 9464, host: str = "0.0.0.0", telemetry: Telemetry = telemetry):
+    """Serve `/metrics` for Prometheus from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The server; call `shutdown()` to stop it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("Metrics request: " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="agent-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,135 @@
+"""Per-user profile, instructions and memory namespace.
+
+One deployment serves several mailboxes, each identified by the
+`langgraph_user_id` of the runnable config. A user's profile and prompt
+instructions are read from `<tenants_path>/<user_id>.json` when the user is
+first seen, over the defaults of `agent/prompts.py`, and kept in a bounded LRU
+cache. Only recently active users stay in memory.
+
+A tenant file looks like:
+
+    {
+        "profile": {"name": "Ana", "full_name": "Ana Lopez", ...},
+        "prompt_instructions": {"triage_rules": {"ignore": "..."}, ...}
+    }
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import quote
+
+from agent.prompts import profile as default_profile
+from agent.prompts import prompt_instructions as default_prompt_instructions
+
+logger = logging.getLogger(__name__)
+
+# Kept as is in file names, on top of letters, digits and "_.-~"
+SAFE_CHARACTERS = "@+"
+
+
+def safe_user_id(user_id: str) -> str:
+    """The user id as a file name, percent-encoded so distinct ids never share a file.
+
+    Ids made of letters, digits and `_.-~@+` are unchanged. A leading dot is
+    encoded too, so that no id names a hidden file or a parent directory.
+    """
+    encoded = quote(user_id, safe=SAFE_CHARACTERS)
+    return "%2E" + encoded[1:] if encoded.startswith(".") else encoded
+
+
+def _merge(defaults: dict, overrides: dict) -> dict:
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """The configuration of one user of the assistant."""
+
+    user_id: str
+    profile: dict
+    prompt_instructions: dict
+
+    @property
+    def memory_namespace(self) -> tuple[str, ...]:
+        return ("email_assistant", self.user_id, "collection")
+
+
+class TenantRegistry:
+    """LRU cache of tenants loaded from a directory of JSON files.
+
+    Args:
+        path (str, optional): Directory of the tenant files. Every user gets
+            the default profile if omitted.
+        max_tenants (int): Maximum number of tenants kept in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_tenants: int = 256):
+        self.path = path
+        self.max_tenants = max_tenants
+        self.loads = 0
+        self._tenants: OrderedDict[str, Tenant] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, user_id: str) -> Tenant:
+        self.loads += 1
+        overrides = {}
+        if self.path is not None:
+            file = os.path.join(self.path, f"{safe_user_id(user_id)}.json")
+            if os.path.exists(file):
+                with open(file) as f:
+                    overrides = json.load(f)
+            else:
+                logger.debug("No tenant file for %s, using the default profile", user_id)
+        return Tenant(
+            user_id=user_id,
+            profile=_merge(default_profile, overrides.get("profile", {})),
+            prompt_instructions=_merge(default_prompt_instructions, overrides.get("prompt_instructions", {})),
+        )
+
+    def get(self, user_id: str) -> Tenant:
+        with self._lock:
+            tenant = self._tenants.get(user_id)
+            if tenant is not None:
+                self._tenants.move_to_end(user_id)
+                return tenant
+        tenant = self._load(user_id)
+        with self._lock:
+            self._tenants[user_id] = tenant
+            while len(self._tenants) > self.max_tenants:
+                self._tenants.popitem(last=False)
+        return tenant
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Reload a user's file (or every file if omitted) on next use."""
+        with self._lock:
+            if user_id is None:
+                self._tenants.clear()
+            else:
+                self._tenants.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+
+@lru_cache
+def get_tenant_registry(path: Optional[str] = None, max_tenants: int = 256) -> TenantRegistry:
+    return TenantRegistry(path, max_tenants)
+
+
+def get_tenant(configuration) -> Tenant:
+    """Return the tenant of the user of a configuration."""
+    registry = get_tenant_registry(configuration.tenants_path, configuration.max_cached_tenants)
+    return registry.get(configuration.langgraph_user_id)
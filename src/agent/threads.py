@@ -0,0 +1,297 @@
+"""Preprocessing of long email threads.
+
+A reply usually carries the whole conversation below it: quoted messages,
+forwarded history and signatures. `split_thread` separates the new text of
+the latest message from that history deterministically, without a model.
+
+`ThreadPreprocessor` rewrites the body of an email before triage: the new text
+is kept, signatures are dropped, a short history is kept unquoted and a long
+one is summarized chunk by chunk, in parallel, by the summary model. The
+summary of a message's history is cached under its Message-ID, so a reply to
+that message only summarizes the parent's own new text, not the whole thread
+again. Token counts are approximate (about 4 characters per token).
+"""
+
+import hashlib
+import logging
+import re
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from functools import lru_cache
+from typing import Optional
+
+from agent.cache import InMemoryCacheBackend, SQLiteCacheBackend
+from agent.prompts import thread_summary_prompt
+from agent.state import EmailInput
+from agent.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Lines starting the history below a reply or a forward
+REPLY_HEADER = re.compile(r"^\s*On\b.{0,300}\bwrote:\s*$", re.IGNORECASE)
+SEPARATOR = re.compile(
+    r"^\s*(-{2,}\s*(Original Message|Forwarded message)\s*-{2,}|Begin forwarded message:|_{20,})\s*$",
+    re.IGNORECASE,
+)
+OUTLOOK_FROM = re.compile(r"^\s*\**From:\**\s+\S")
+OUTLOOK_FIELD = re.compile(r"^\s*\**(Sent|Date|To|Subject):\**\s", re.IGNORECASE)
+QUOTED = re.compile(r"^\s*>")
+# RFC 3676 signature delimiter and mobile client footers
+SIGNATURE_DELIMITER = re.compile(r"^-- ?$")
+MOBILE_FOOTER = re.compile(r"^\s*(Sent from my \w+|Get Outlook for \w+)", re.IGNORECASE)
+
+HISTORY_HEADER = "Earlier in the thread:"
+SUMMARY_HEADER = "Summary of the earlier messages in the thread:"
+CHARACTERS_PER_TOKEN = 4
+
+
+@dataclass
+class ThreadParts:
+    """The new text of the latest message and the history below it."""
+
+    new: str
+    history: str = ""
+
+
+def _reply_header_lines(lines: list[str], i: int) -> int:
+    """Number of lines of the "On <date>, <name> wrote:" header at line i, 0 if there is none."""
+    if REPLY_HEADER.match(lines[i]):
+        return 1
+    # Mail clients wrap long headers in two lines
+    if i + 1 < len(lines) and lines[i].lstrip().startswith("On ") and REPLY_HEADER.match(f"{lines[i]} {lines[i + 1]}"):
+        return 2
+    return 0
+
+
+def _is_outlook_header(lines: list[str], i: int) -> bool:
+    return bool(OUTLOOK_FROM.match(lines[i])) and any(OUTLOOK_FIELD.match(line) for line in lines[i + 1 : i + 4])
+
+
+def _history_start(lines: list[str]) -> Optional[int]:
+    for i in range(len(lines)):
+        if SEPARATOR.match(lines[i]) or _reply_header_lines(lines, i) or (i > 0 and _is_outlook_header(lines, i)):
+            return i
+    # A trailing block of quoted lines, but not inline replies between quotes
+    quoted = [i for i, line in enumerate(lines) if QUOTED.match(line)]
+    if quoted and all(QUOTED.match(line) or not line.strip() for line in lines[quoted[0] :]):
+        return quoted[0]
+    return None
+
+
+def strip_signature(text: str) -> str:
+    """Drop the signature block and mobile footers of a message."""
+    kept = []
+    for line in text.splitlines():
+        if SIGNATURE_DELIMITER.match(line):
+            break
+        if not MOBILE_FOOTER.match(line):
+            kept.append(line)
+    return "\n".join(kept).strip()
+
+
+def _unquote(lines: list[str]) -> list[str]:
+    return [re.sub(r"^\s*> ?", "", line, count=1) for line in lines]
+
+
+def split_thread(text: str) -> ThreadParts:
+    """Split an email body into its new text (without signature) and the history below it.
+
+    The history starts at the first reply header ("On ... wrote:"), forward or
+    original message separator, Outlook header block, or trailing quoted
+    block. One level of quoting is removed from it, so the history is in
+    turn the body of the previous message.
+    """
+    lines = text.splitlines()
+    start = _history_start(lines)
+    if start is None:
+        return ThreadParts(new=strip_signature(text))
+    history = lines[start:]
+    header = _reply_header_lines(lines, start) or int(not QUOTED.match(history[0]))
+    if all(QUOTED.match(line) or not line.strip() for line in history[header:]):
+        history = history[:header] + _unquote(history[header:])
+    return ThreadParts(new=strip_signature("\n".join(lines[:start])), history="\n".join(history).strip())
+
+
+def _previous_message(history: str) -> ThreadParts:
+    """Split a history into the message it starts with and the older history."""
+    lines = history.splitlines()
+    # Skip the header block naming the author of the previous message
+    body = _reply_header_lines(lines, 0) or int(bool(lines) and bool(SEPARATOR.match(lines[0]) or OUTLOOK_FROM.match(lines[0])))
+    while body < len(lines) and (not lines[body].strip() or OUTLOOK_FIELD.match(lines[body]) or OUTLOOK_FROM.match(lines[body])):
+        body += 1
+    parts = split_thread("\n".join(lines[body:]))
+    header = "\n".join(lines[:body])
+    return ThreadParts(new=f"{header}\n{parts.new}".strip(), history=parts.history)
+
+
+def clean_history(history: str) -> str:
+    """The messages of a history without their signatures, most recent first."""
+    messages = []
+    while history:
+        parts = _previous_message(history)
+        messages.append(parts.new)
+        history = parts.history
+    return "\n\n".join(message for message in messages if message)
+
+
+def count_tokens(text: str) -> int:
+    return len(text) // CHARACTERS_PER_TOKEN
+
+
+def chunk_text(text: str, max_tokens: int) -> list[str]:
+    """Cut a text into chunks of at most `max_tokens`, at line boundaries where possible."""
+    limit = max_tokens * CHARACTERS_PER_TOKEN
+    chunks, current, size = [], [], 0
+    for line in text.splitlines():
+        while len(line) > limit:
+            chunks.extend(["\n".join(current)] if current else [])
+            chunks.append(line[:limit])
+            line, current, size = line[limit:], [], 0
+        if size + len(line) + 1 > limit and current:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def _message_id(value) -> Optional[str]:
+    ids = re.findall(r"<[^<>\s]+>", str(value or ""))
+    return ids[-1] if ids else None
+
+
+@dataclass
+class ThreadPlan:
+    """What `ThreadPreprocessor` has to summarize for one email.
+
+    Attributes:
+        parts (ThreadParts): The new text and the cleaned history.
+        chunks (list[str]): Texts to summarize, in thread order (newest first).
+        cached (str, optional): Cached summary of the older history.
+        key (str, optional): Cache key the summary of this history is stored under.
+    """
+
+    parts: ThreadParts
+    chunks: list[str] = field(default_factory=list)
+    cached: Optional[str] = None
+    key: Optional[str] = None
+
+
+class ThreadPreprocessor:
+    """Strip and summarize the history of email threads.
+
+    Args:
+        backend: Cache of history summaries (`InMemoryCacheBackend` or
+            `SQLiteCacheBackend`).
+        summarize_min_tokens (int): Histories up to this size are kept verbatim.
+        chunk_tokens (int): Size of the chunks summarized in parallel.
+        summary_max_tokens (int): Size the summary of a thread is kept under;
+            the oldest chunk summaries are dropped first.
+    """
+
+    def __init__(self, backend, summarize_min_tokens: int = 1500, chunk_tokens: int = 1500, summary_max_tokens: int = 600):
+        self.backend = backend
+        self.summarize_min_tokens = summarize_min_tokens
+        self.chunk_tokens = chunk_tokens
+        self.summary_max_tokens = summary_max_tokens
+
+    def _cached(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        summary = self.backend.get(key)
+        telemetry.count("agent_cache_requests_total", cache="thread_summary", result="miss" if summary is None else "hit")
+        return summary
+
+    def plan(self, email_info: EmailInput, headers: Optional[EmailMessage] = None) -> ThreadPlan:
+        """Split the thread and find the parts that still need a summary."""
+        parts = split_thread(email_info.email_thread)
+        if not parts.history:
+            return ThreadPlan(parts)
+        raw_history, parts.history = parts.history, clean_history(parts.history)
+        if count_tokens(parts.history) <= self.summarize_min_tokens:
+            return ThreadPlan(parts)
+
+        headers = headers if headers is not None else {}
+        # Without headers (pasted emails), the history itself identifies the thread
+        key = _message_id(headers.get("Message-ID")) or "sha1:" + hashlib.sha1(parts.history.encode()).hexdigest()
+        summary = self._cached(key)
+        if summary is not None:
+            return ThreadPlan(parts, cached=summary)
+
+        # A reply to an already summarized message only summarizes the parent's text
+        parent = _message_id(headers.get("In-Reply-To")) or _message_id(headers.get("References"))
+        older = self._cached(parent)
+        if older is not None:
+            previous = _previous_message(raw_history)
+            return ThreadPlan(parts, chunks=chunk_text(previous.new, self.chunk_tokens), cached=older, key=key)
+        return ThreadPlan(parts, chunks=chunk_text(parts.history, self.chunk_tokens), key=key)
+
+    def messages(self, chunk: str) -> list[dict]:
+        words = max(20, self.summary_max_tokens // 4)
+        return [
+            {"role": "system", "content": thread_summary_prompt.format(words=words)},
+            {"role": "user", "content": chunk},
+        ]
+
+    def finish(self, email_info: EmailInput, plan: ThreadPlan, summaries: list[str]) -> EmailInput:
+        """Store the summary of the history and rewrite the email body."""
+        parts = plan.parts
+        if not parts.history:
+            body = parts.new
+        elif not plan.chunks and plan.cached is None:
+            body = f"{parts.new}\n\n{HISTORY_HEADER}\n{parts.history}"
+        else:
+            summary = self._join([*summaries, *([plan.cached] if plan.cached else [])])
+            if plan.key is not None and plan.chunks:
+                self.backend.set(plan.key, summary)
+            body = f"{parts.new}\n\n{SUMMARY_HEADER}\n{summary}"
+        return email_info.model_copy(update={"email_thread": body.strip() or email_info.email_thread})
+
+    def _join(self, summaries: list[str]) -> str:
+        kept, size = [], 0
+        for summary in summaries:
+            summary = summary.strip()
+            size += count_tokens(summary)
+            if kept and size > self.summary_max_tokens:
+                break
+            kept.append(summary)
+        return "\n".join(kept)
+
+    def summarize(self, plan: ThreadPlan, model) -> list[str]:
+        """Summarize the chunks of a plan in parallel with `model`."""
+        if not plan.chunks:
+            return []
+        return [str(message.content) for message in model.batch([self.messages(chunk) for chunk in plan.chunks])]
+
+    async def asummarize(self, plan: ThreadPlan, model) -> list[str]:
+        """Async version of `summarize`."""
+        if not plan.chunks:
+            return []
+        return [str(message.content) for message in await model.abatch([self.messages(chunk) for chunk in plan.chunks])]
+
+    def prepare(self, email_info: EmailInput, headers: Optional[EmailMessage], model) -> EmailInput:
+        """Rewrite the body of an email, summarizing a long history with `model`."""
+        plan = self.plan(email_info, headers)
+        return self.finish(email_info, plan, self.summarize(plan, model))
+
+
+@lru_cache
+def _preprocessor_for(
+    path: Optional[str], summarize_min_tokens: int, chunk_tokens: int, summary_max_tokens: int
+) -> ThreadPreprocessor:
+    backend = SQLiteCacheBackend(path) if path else InMemoryCacheBackend()
+    return ThreadPreprocessor(backend, summarize_min_tokens, chunk_tokens, summary_max_tokens)
+
+
+def get_thread_preprocessor(configuration) -> Optional[ThreadPreprocessor]:
+    """Return the process-wide thread preprocessor, or None if disabled."""
+    if not configuration.thread_preprocessing:
+        return None
+    return _preprocessor_for(
+        configuration.thread_summary_cache_path,
+        configuration.thread_summarize_min_tokens,
+        configuration.thread_chunk_tokens,
+        configuration.thread_summary_max_tokens,
+    )
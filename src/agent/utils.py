@@ -1,7 +1,4 @@
-from langchain_openai import ChatOpenAI
-from langchain_ollama import ChatOllama
-from langchain.prompts import PromptTemplate
-from langchain.output_parsers import StructuredOutputParser, ResponseSchema
+from typing import Optional
 
 
 def parse_email(email_input: dict) -> dict:
@@ -28,6 +25,21 @@ def parse_email(email_input: dict) -> dict:
         email_input["email_thread"],
     )
 
+def split_few_shot_example(value: str) -> tuple[str, str, str]:
+    """Split a stored example into its email, original and correct routing.
+
+    Args:
+        value (str): Example string with the format
+            'Email: {...} Original routing: {...} Correct routing: {...}'
+
+    Returns:
+        tuple[str, str, str]: The email part, the original routing and the
+            correct routing.
+    """
+    email_part, _, routing = value.partition('Original routing:')
+    original_routing, _, correct_routing = routing.partition('Correct routing:')
+    return email_part.strip(), original_routing.strip(), correct_routing.strip()
+
 def format_few_shot_examples(examples):
     """Format examples into a readable string representation.
 
@@ -47,9 +59,7 @@ def format_few_shot_examples(examples):
     formatted = []
     for example in examples:
         # Parse the example value string into components
-        email_part = example.value.split('Original routing:')[0].strip()
-        original_routing = example.value.split('Original routing:')[1].split('Correct routing:')[0].strip()
-        correct_routing = example.value.split('Correct routing:')[1].strip()
+        email_part, original_routing, correct_routing = split_few_shot_example(example.value)
         
         # Format into clean string
         formatted_example = f"""Example:
@@ -64,12 +74,22 @@ Correct Classification: {correct_routing}
 
 
 
-def load_chatollama_model():
-    """Load a chat model from Ollama."""
+def load_chatollama_model(model: str = "gemma3:27b", keep_alive: Optional[str] = "30m", callbacks: Optional[list] = None):
+    """Load a chat model from Ollama.
+
+    Args:
+        model (str): Name of the Ollama model.
+        keep_alive (str, optional): How long Ollama keeps the model, and the KV
+            cache of the last prompt, loaded between calls.
+        callbacks (list, optional): Callback handlers attached to every call.
+    """
+    from langchain_ollama import ChatOllama
+
     llm = ChatOllama(
-        model="gemma3:27b",
+        model=model,
         temperature=0,
-        # other params...
+        keep_alive=keep_alive,
+        callbacks=callbacks,
     )
 
     return llm
@@ -80,6 +100,7 @@ def load_model(fully_specified_name: str):
     Args:
         fully_specified_name (str): String in the format 'provider/model'.
     """
+    from langchain_openai import ChatOpenAI
 
     inference_server_url = "http://localhost:8000/v1"
 
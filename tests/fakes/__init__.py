@@ -0,0 +1,5 @@
+"""Offline stand-ins of the model providers and Google APIs, and a labeled corpus.
+
+Shared by the tests and the benchmarks (run from the repository root, e.g.
+`python -m benchmarks.pipeline`).
+"""
@@ -0,0 +1,145 @@
+"""Scripted chat models for tests and benchmarks.
+
+`FakeChatModel` answers from Python functions instead of a provider, sleeps to
+simulate model latency and records the approximate input tokens of every call,
+so the graph can be exercised and measured offline. Structured output works
+like a JSON-mode model: the structured responder's answer is serialized in the
+AI message and parsed back against the schema. A `malformed` fraction of these
+answers is damaged the way local models damage JSON (`damage_json`).
+"""
+
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel, Field, PrivateAttr
+
+Responder = Callable[[list[BaseMessage]], AIMessage]
+StructuredResponder = Callable[[list[BaseMessage], type[BaseModel]], BaseModel]
+
+
+# Ways a local model answers a JSON request with something that is not quite JSON
+DAMAGES = ("fence", "prose", "trailing_comma", "python", "truncated", "refusal")
+
+
+def damage_json(text: str, rng: random.Random) -> str:
+    """Damage a JSON answer in one of the `DAMAGES` ways, picked with `rng`."""
+    damage = rng.choice(DAMAGES)
+    if damage == "fence":
+        return f"```json\n{text}\n```"
+    if damage == "prose":
+        return f"Here is the classification you asked for:\n{text}\nLet me know if you need anything else."
+    if damage == "trailing_comma":
+        return text[:-1] + ",}"
+    if damage == "python":
+        value = json.loads(text)
+        return repr(value)
+    if damage == "truncated":
+        return text[: max(1, int(len(text) * rng.uniform(0.5, 0.95)))]
+    return "I'm sorry, I can't classify this email."
+
+
+def call_tool_then_answer(tool: str, args: dict) -> Responder:
+    """Call `tool` for every user message, then answer with its first line."""
+
+    def respond(messages: list[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"Done: {str(last.content).splitlines()[0]}")
+        return AIMessage(content="", tool_calls=[{"name": tool, "args": args, "id": f"call_{uuid.uuid4().hex}"}])
+
+    return respond
+
+
+class FakeChatModel(BaseChatModel):
+    """A chat model answering with `respond(messages)`.
+
+    Args:
+        respond (Callable, optional): Returns the AI message answering the
+            input messages.
+        structured (Callable, optional): Returns the answer of a structured
+            output call, an instance of the requested schema.
+        latency (float): Median seconds every call takes.
+        jitter (float): Standard deviation of the log of the latency, so some
+            calls are slower than others.
+        seed (int): Seed of the latency jitter and of the damaged answers.
+        malformed (float): Fraction of structured answers damaged by
+            `damage_json`.
+    """
+
+    respond: Optional[Responder] = None
+    structured: Optional[StructuredResponder] = None
+    latency: float = 0.0
+    jitter: float = 0.0
+    seed: int = 0
+    malformed: float = 0.0
+    input_tokens: list[int] = Field(default_factory=list)
+    _random: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, context: Any) -> None:
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def calls(self) -> int:
+        return len(self.input_tokens)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.input_tokens.clear()
+            self._random.seed(self.seed)
+
+    def bind_tools(self, tools: list, **kwargs: Any) -> "FakeChatModel":
+        return self
+
+    def with_structured_output(self, schema: type[BaseModel], *, include_raw: bool = False, **kwargs: Any) -> Runnable:
+        def parse(message: AIMessage) -> Any:
+            try:
+                parsed, error = schema.model_validate_json(message.content), None
+            except ValueError as e:
+                if not include_raw:
+                    raise
+                parsed, error = None, e
+            return {"raw": message, "parsed": parsed, "parsing_error": error} if include_raw else parsed
+
+        return self.bind(schema=schema) | RunnableLambda(parse)
+
+    def _delay(self) -> float:
+        with self._lock:
+            return self.latency * math.exp(self._random.gauss(0, self.jitter)) if self.jitter else self.latency
+
+    def _result(self, messages: list[BaseMessage], schema: Optional[type[BaseModel]]) -> ChatResult:
+        with self._lock:
+            self.input_tokens.append(count_tokens_approximately(messages))
+            damaged = self.malformed and self._random.random() < self.malformed
+        if schema is not None:
+            content = self.structured(messages, schema).model_dump_json()
+            if damaged:
+                with self._lock:
+                    content = damage_json(content, self._random)
+            message = AIMessage(content=content)
+        else:
+            message = self.respond(messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, schema=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay())
+        return self._result(messages, schema)
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, schema=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return self._result(messages, schema)
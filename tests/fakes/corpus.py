@@ -0,0 +1,288 @@
+"""Labeled synthetic emails for tests and benchmarks.
+
+`generate_corpus` builds variants of the sample email of `agent/prompts.py`:
+questions and meeting requests to answer, newsletters to ignore, alerts to be
+notified of, and plain user requests. Emails come either as raw RFC 822
+messages, which are parsed deterministically, or pasted as free text, which
+needs the parsing model. A fraction are repeated, as re-delivered mail is.
+
+Every item carries a reference (`SYN-00042`) in its text. `CorpusOracle`
+finds it in the model input to give the scripted answers of the fake models
+(see `tests/fakes/chat_models.py`): the label of the email for the structured
+stages, and the planned tool calls for the response agent.
+"""
+
+import random
+import re
+import uuid
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Literal, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from pydantic import BaseModel
+
+from agent.prompts import prefetched_memories_header
+from agent.state import EmailInput, EmailIntake, Router, email_detection
+
+Label = Literal["respond", "ignore", "notify", "request"]
+
+REFERENCE = re.compile(r"SYN-(\d{5})")
+
+SENDERS = [
+    ("Alice Smith", "alice.smith@company.com"),
+    ("Bob Chen", "bob.chen@company.com"),
+    ("Carla Diaz", "carla.diaz@partner.io"),
+    ("Deepak Rao", "deepak.rao@company.com"),
+    ("Emma Muller", "emma.muller@client.org"),
+    ("Farid Haddad", "farid.haddad@company.com"),
+]
+LISTS = [
+    ("Weekly Digest", "newsletter@news.example.com"),
+    ("Deals Team", "promo@shop.example.com"),
+    ("Dev Community", "community@lists.example.org"),
+]
+ALERTS = [
+    ("CI", "ci@builds.company.com"),
+    ("IT Security", "security@company.com"),
+    ("Calendar", "reminders@company.com"),
+]
+TOPICS = ["authentication service", "billing API", "search indexer", "mobile app", "data pipeline", "admin console"]
+ENDPOINTS = ["/auth/refresh", "/auth/validate", "/invoices", "/users/export", "/search", "/health"]
+
+RECIPIENT = ("John Doe", "john.doe@company.com")
+
+
+@dataclass(frozen=True)
+class SyntheticEmail:
+    """One labeled input of the corpus.
+
+    Attributes:
+        id (int): Number in the `SYN-00000` reference of the item.
+        text (str): The user message given to the graph.
+        label (str): 'respond', 'ignore' or 'notify' for emails, 'request'
+            for other user requests.
+        format (str): 'raw', 'pasted' or 'request'.
+        email (EmailInput, optional): The details of the email.
+        tool_calls (tuple): (tool, args) the response agent makes, in order.
+    """
+
+    id: int
+    text: str
+    label: Label
+    format: Literal["raw", "pasted", "request"]
+    email: Optional[EmailInput] = None
+    tool_calls: tuple[tuple[str, dict], ...] = ()
+
+    @property
+    def reference(self) -> str:
+        return f"SYN-{self.id:05d}"
+
+
+def _raw(email: EmailInput, headers: dict[str, str]) -> str:
+    lines = [
+        f"From: {email.author_name} <{email.author_email}>",
+        f"To: {email.to_name} <{email.to_email}>",
+        f"Subject: {email.subject}",
+        *(f"{name}: {value}" for name, value in headers.items()),
+        "",
+        email.email_thread,
+    ]
+    return "\n".join(lines)
+
+
+def _pasted(email: EmailInput) -> str:
+    # Pasted from a mail client, without headers the parser can read
+    return (
+        f"I received this email from {email.author_name} ({email.author_email}), "
+        f"subject \"{email.subject}\":\n\n{email.email_thread}"
+    )
+
+
+def _question(rng: random.Random, reference: str) -> tuple[str, str, str, str]:
+    name, address = rng.choice(SENDERS)
+    topic, endpoints = rng.choice(TOPICS), rng.sample(ENDPOINTS, 2)
+    body = (
+        f"Hi John,\n\nI was reviewing the API documentation for the {topic} and noticed a few endpoints "
+        "seem to be missing from the specs. Could you help clarify if this was intentional or if we "
+        f"should update the docs?\n\nSpecifically, I'm looking at:\n- {endpoints[0]}\n- {endpoints[1]}\n\n"
+        f"Thanks!\n{name.split()[0]}\n\nRef: {reference}"
+    )
+    return name, address, f"Quick question about the {topic} documentation", body
+
+
+def _meeting(rng: random.Random, reference: str, day: str) -> tuple[str, str, str, str]:
+    name, address = rng.choice(SENDERS)
+    topic = rng.choice(TOPICS)
+    body = (
+        f"Hi John,\n\nCould we find 30 minutes on {day} to go over the {topic} rollout plan? "
+        f"Any time in the afternoon works for me.\n\nBest,\n{name.split()[0]}\n\nRef: {reference}"
+    )
+    return name, address, f"Meeting about the {topic} rollout", body
+
+
+def _newsletter(rng: random.Random, reference: str) -> tuple[str, str, str, str]:
+    name, address = rng.choice(LISTS)
+    topic = rng.choice(TOPICS)
+    body = (
+        f"This week: 10 tips to scale your {topic}, community highlights and 20% off all courses.\n\n"
+        f"You are receiving this email because you subscribed. Unsubscribe at any time.\n\nRef: {reference}"
+    )
+    return name, address, f"This week in {topic} news", body
+
+
+def _alert(rng: random.Random, reference: str, day: str) -> tuple[str, str, str, str]:
+    name, address = rng.choice(ALERTS)
+    topic = rng.choice(TOPICS)
+    subject, body = rng.choice([
+        (f"Build failed on main for the {topic}", f"The nightly build of the {topic} failed at the test stage."),
+        (f"Security update required for the {topic}", f"A critical patch for the {topic} must be deployed by {day}."),
+        (f"Reminder: {topic} review due {day}", f"The quarterly review of the {topic} is due on {day}."),
+    ])
+    return name, address, subject, f"{body}\n\nNo action is needed in reply to this message.\n\nRef: {reference}"
+
+
+def _request(rng: random.Random, i: int, reference: str, day: str) -> SyntheticEmail:
+    name, address = rng.choice(SENDERS)
+    if rng.random() < 0.5:
+        topic = rng.choice(TOPICS)
+        subject = f"Status of the {topic}"
+        text = f"Send an email to {name} ({address}) asking for an update on the {topic} (ticket {reference})."
+        tool_calls = (("write_email", {"to": address, "subject": subject, "content": f"Hi {name.split()[0]}, any update?"}),)
+    else:
+        text = f"Am I free on {day}? I need to plan the next release (ticket {reference})."
+        tool_calls = (("check_calendar_availability", {"day": day}),)
+    return SyntheticEmail(id=i, text=text, label="request", format="request", tool_calls=tool_calls)
+
+
+def generate_corpus(
+    n: int = 500,
+    seed: int = 0,
+    duplicates: float = 0.1,
+    pasted: float = 0.25,
+    requests: float = 0.15,
+    mix: tuple[float, float, float] = (0.5, 0.25, 0.25),
+) -> list[SyntheticEmail]:
+    """Generate `n` labeled items, the same ones for the same arguments.
+
+    Args:
+        n (int): Number of items.
+        seed (int): Seed of the generator.
+        duplicates (float): Fraction of items repeating an earlier email.
+        pasted (float): Fraction of emails pasted as text instead of raw.
+        requests (float): Fraction of user requests that are not emails.
+        mix (tuple): Weights of the respond, ignore and notify emails.
+    """
+    rng = random.Random(seed)
+    start = date(2025, 5, 5)
+    corpus: list[SyntheticEmail] = []
+    for i in range(n):
+        if corpus and rng.random() < duplicates:
+            corpus.append(rng.choice(corpus))
+            continue
+        reference = f"SYN-{i:05d}"
+        day = (start + timedelta(days=rng.randrange(20))).isoformat()
+        if rng.random() < requests:
+            corpus.append(_request(rng, i, reference, day))
+            continue
+
+        label = rng.choices(["respond", "ignore", "notify"], weights=mix)[0]
+        headers: dict[str, str] = {}
+        tool_calls: tuple[tuple[str, dict], ...] = ()
+        if label == "respond" and rng.random() < 0.4:
+            name, address, subject, body = _meeting(rng, reference, day)
+            tool_calls = (
+                ("check_calendar_availability", {"day": day}),
+                ("schedule_meeting", {"attendees": [address], "subject": subject, "duration_minutes": 30, "preferred_day": day}),
+            )
+        elif label == "respond":
+            name, address, subject, body = _question(rng, reference)
+            tool_calls = (("write_email", {"to": address, "subject": f"Re: {subject}", "content": "Thanks, I will look into it."}),)
+        elif label == "ignore":
+            name, address, subject, body = _newsletter(rng, reference)
+            headers = {"List-Unsubscribe": f"<mailto:{address}>", "Precedence": "bulk"}
+        else:
+            name, address, subject, body = _alert(rng, reference, day)
+        email = EmailInput(
+            author_name=name, author_email=address, to_name=RECIPIENT[0], to_email=RECIPIENT[1],
+            subject=subject, email_thread=body,
+        )
+        is_pasted = rng.random() < pasted
+        corpus.append(SyntheticEmail(
+            id=i,
+            text=_pasted(email) if is_pasted else _raw(email, headers),
+            label=label,
+            format="pasted" if is_pasted else "raw",
+            email=email,
+            tool_calls=tool_calls,
+        ))
+    return corpus
+
+
+class CorpusOracle:
+    """Scripted answers of the fake chat models for the items of a corpus.
+
+    Args:
+        corpus (list[SyntheticEmail]): The items the answers are looked up in.
+        low_confidence (float): Fraction of emails the triage answer reports a
+            low confidence for, so a cascade escalates them.
+        search_memory (bool): Search memory for the sender and subject before
+            answering an email, unless the prompt already has the memories.
+    """
+
+    def __init__(self, corpus: list[SyntheticEmail], low_confidence: float = 0.1, search_memory: bool = False):
+        self.items = {item.id: item for item in corpus}
+        self.low_confidence = low_confidence
+        self.search_memory = search_memory
+
+    def find(self, messages: list[BaseMessage], follow_ups: bool = False) -> Optional[SyntheticEmail]:
+        """The item of the last user message; with `follow_ups`, of the last one with a reference."""
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                match = REFERENCE.search(str(message.content))
+                if match or not follow_ups:
+                    return self.items[int(match.group(1))] if match else None
+        return None
+
+    def _confidence(self, item: SyntheticEmail) -> float:
+        return 0.5 if random.Random(item.id).random() < self.low_confidence else 0.95
+
+    def structured(self, messages: list[BaseMessage], schema: type[BaseModel]) -> BaseModel:
+        # A structured call may be asked again for valid JSON in a follow-up message
+        item = self.find(messages, follow_ups=True)
+        if item is None:
+            raise ValueError("No corpus reference in the model input")
+        is_email = item.label != "request"
+        reasoning = f"Scripted answer for {item.reference}."
+        if schema is EmailIntake:
+            if not is_email:
+                return EmailIntake(email_found=False)
+            return EmailIntake(email_found=True, email=item.email, reasoning=reasoning, classification=item.label)
+        if schema is email_detection:
+            return email_detection(email_found=is_email)
+        if schema is EmailInput:
+            return item.email
+        if schema is Router:
+            return Router(reasoning=reasoning, classification=item.label, confidence=self._confidence(item))
+        raise ValueError(f"No scripted answer for {schema.__name__}")
+
+    def _plan(self, item: SyntheticEmail, prompt: str) -> tuple[tuple[str, dict], ...]:
+        if self.search_memory and item.email is not None and prefetched_memories_header not in prompt:
+            query = f"{item.email.author_name} {item.email.subject}"
+            return (("search_memory", {"query": query}),) + item.tool_calls
+        return item.tool_calls
+
+    def respond(self, messages: list[BaseMessage]) -> AIMessage:
+        """Make the planned tool calls of the item, one per step, then answer."""
+        item = self.find(messages)
+        done, prompt = 0, ""
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                prompt = str(message.content)
+                break
+            done += isinstance(message, ToolMessage)
+        plan = () if item is None else self._plan(item, prompt)
+        if item is None or done >= len(plan):
+            return AIMessage(content="Done." if item is None else f"Handled {item.reference}.")
+        tool, args = plan[done]
+        return AIMessage(content="", tool_calls=[{"name": tool, "args": args, "id": f"call_{uuid.uuid4().hex}"}])
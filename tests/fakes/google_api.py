@@ -0,0 +1,260 @@
+"""In-memory fake of the Gmail and Calendar HTTP APIs.
+
+`FakeGoogleHttp` implements the httplib2 `request` interface used by
+googleapiclient, including the multipart batch endpoint, so the real API
+clients can be exercised in tests and benchmarks without network access.
+"""
+
+import base64
+import itertools
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.parser import Parser
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from agent.google_auth import ServiceRegistry
+
+Route = tuple[str, re.Pattern, Callable]
+
+
+class FakeGoogleHttp:
+    """A thread-safe fake Google API server behind an httplib2-like transport.
+
+    Args:
+        latency (float): Seconds added to every HTTP round trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent_messages: list[dict] = []
+        self.events: dict[str, dict] = {}
+        self._event_changes: list[str] = []
+        self.inbox: dict[str, dict] = {}
+        self.history_id = 1000
+        self._history: list[tuple[int, str]] = []
+        self.round_trips = 0
+        self.requests: list[tuple[str, str]] = []
+        self._failures: dict[str, list[int]] = defaultdict(list)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._routes: list[Route] = [
+            ("POST", re.compile(r"^/gmail/v1/users/([^/]+)/messages/send$"), self._send_message),
+            ("GET", re.compile(r"^/gmail/v1/users/([^/]+)/profile$"), self._profile),
+            ("GET", re.compile(r"^/gmail/v1/users/([^/]+)/messages$"), self._list_messages),
+            ("GET", re.compile(r"^/gmail/v1/users/([^/]+)/messages/([^/]+)$"), self._get_message),
+            ("GET", re.compile(r"^/gmail/v1/users/([^/]+)/history$"), self._list_history),
+            ("POST", re.compile(r"^/calendar/v3/calendars/([^/]+)/events$"), self._insert_event),
+            ("GET", re.compile(r"^/calendar/v3/calendars/([^/]+)/events$"), self._list_events),
+            ("POST", re.compile(r"^/calendar/v3/freeBusy$"), self._free_busy),
+        ]
+
+    # Test helpers
+
+    def fail(self, path_pattern: str, *statuses: int) -> None:
+        """Answer the next requests whose path matches with the given statuses."""
+        with self._lock:
+            self._failures[path_pattern].extend(statuses)
+
+    def deliver(self, raw: str, label_ids: tuple[str, ...] = ("INBOX",)) -> str:
+        """Receive a raw RFC 822 email in the mailbox and return its message id."""
+        with self._lock:
+            self.history_id += 1
+            message = {
+                "id": self._next_id("in"),
+                "threadId": self._next_id("thread"),
+                "labelIds": list(label_ids),
+                "historyId": str(self.history_id),
+                "raw": base64.urlsafe_b64encode(raw.encode()).decode(),
+            }
+            self.inbox[message["id"]] = message
+            self._history.append((self.history_id, message["id"]))
+            return message["id"]
+
+    def add_event(self, summary: str, start: str, end: str) -> dict:
+        """Create an event as another client would (ISO datetimes in UTC)."""
+        with self._lock:
+            return self._insert_event(None, {}, {"summary": summary, "start": {"dateTime": start}, "end": {"dateTime": end}})[1]
+
+    def cancel_event(self, event_id: str) -> None:
+        """Cancel an event as another client would."""
+        with self._lock:
+            self.events[event_id]["status"] = "cancelled"
+            self._event_changes.append(event_id)
+
+    def service(self, api: str, version: str):
+        """Build a real API client that talks to this fake."""
+        return build(api, version, http=self, static_discovery=True, cache_discovery=False)
+
+    def registry(self) -> ServiceRegistry:
+        """A service registry whose clients talk to this fake."""
+        return ServiceRegistry(credentials=Credentials(token="fake-token"), http_factory=lambda: self)
+
+    def _next_id(self, prefix: str) -> str:
+        return f"{prefix}{next(self._ids)}"
+
+    # httplib2 interface
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.round_trips += 1
+        parsed = urlparse(uri)
+        if parsed.path == "/batch" or parsed.path.startswith("/batch/"):
+            return self._batch(body, headers or {})
+        status, payload = self._dispatch(method, parsed.path, parse_qs(parsed.query), body)
+        return self._response(status), json.dumps(payload).encode()
+
+    def _response(self, status: int, content_type: str = "application/json; charset=UTF-8") -> httplib2.Response:
+        return httplib2.Response({"status": str(status), "content-type": content_type})
+
+    def _dispatch(self, method: str, path: str, query: dict, body) -> tuple[int, dict]:
+        with self._lock:
+            self.requests.append((method, path))
+            for pattern, statuses in self._failures.items():
+                if statuses and re.search(pattern, path):
+                    status = statuses.pop(0)
+                    return status, {"error": {"code": status, "message": "Injected failure"}}
+
+            if isinstance(body, bytes):
+                body = body.decode()
+            data = json.loads(body) if body else {}
+            for route_method, pattern, handler in self._routes:
+                match = pattern.match(path)
+                if match and route_method == method:
+                    return handler(match, query, data)
+        return 404, {"error": {"code": 404, "message": f"Not found: {method} {path}"}}
+
+    def _batch(self, body, headers: dict) -> tuple[httplib2.Response, bytes]:
+        if isinstance(body, bytes):
+            body = body.decode()
+        content_type = next(value for key, value in headers.items() if key.lower() == "content-type")
+        message = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n{body}")
+        boundary = "batch_fake_boundary"
+        parts = []
+        for part in message.get_payload():
+            request_line, rest = part.get_payload().split("\n", 1)
+            method, target, _ = request_line.split(" ", 2)
+            sub_body = rest.split("\n\n", 1)[1] if "\n\n" in rest else rest.split("\r\n\r\n", 1)[-1]
+            parsed = urlparse(target)
+            status, payload = self._dispatch(method, parsed.path, parse_qs(parsed.query), sub_body.strip())
+            content_id = part["Content-ID"].strip("<>")
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--\r\n"
+        return self._response(200, f"multipart/mixed; boundary={boundary}"), content.encode()
+
+    # Gmail
+
+    def _send_message(self, match, query, data) -> tuple[int, dict]:
+        message = {"id": self._next_id("msg"), "threadId": self._next_id("thread"), "labelIds": ["SENT"], **data}
+        self.sent_messages.append(message)
+        return 200, {key: message[key] for key in ("id", "threadId", "labelIds")}
+
+    def _profile(self, match, query, data) -> tuple[int, dict]:
+        return 200, {"emailAddress": "me@example.com", "historyId": str(self.history_id)}
+
+    def _page(self, items: list, query: dict, default_size: int) -> tuple[list, Optional[str]]:
+        start = int(query.get("pageToken", ["0"])[0])
+        size = int(query.get("maxResults", [str(default_size)])[0])
+        next_token = str(start + size) if start + size < len(items) else None
+        return items[start:start + size], next_token
+
+    def _list_messages(self, match, query, data) -> tuple[int, dict]:
+        labels = set(query.get("labelIds", []))
+        messages = [
+            {"id": message["id"], "threadId": message["threadId"]}
+            for message in reversed(self.inbox.values())
+            if labels <= set(message["labelIds"])
+        ]
+        page, next_token = self._page(messages, query, 100)
+        response = {"messages": page, "resultSizeEstimate": len(messages)}
+        if next_token:
+            response["nextPageToken"] = next_token
+        return 200, response
+
+    def _get_message(self, match, query, data) -> tuple[int, dict]:
+        message = self.inbox.get(match.group(2))
+        if message is None:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+        return 200, message
+
+    def _list_history(self, match, query, data) -> tuple[int, dict]:
+        start = int(query["startHistoryId"][0])
+        if self._history and start < self._history[0][0] - 1:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+        label = query.get("labelId", [None])[0]
+        records = [
+            {"id": str(history_id), "messagesAdded": [{"message": {"id": message_id, "labelIds": self.inbox[message_id]["labelIds"]}}]}
+            for history_id, message_id in self._history
+            if history_id > start and (label is None or label in self.inbox[message_id]["labelIds"])
+        ]
+        page, next_token = self._page(records, query, 100)
+        response = {"history": page, "historyId": str(self.history_id)}
+        if next_token:
+            response["nextPageToken"] = next_token
+        return 200, response
+
+    # Calendar
+
+    def _insert_event(self, match, query, data) -> tuple[int, dict]:
+        event = {"id": self._next_id("evt"), "status": "confirmed", **data}
+        self.events[event["id"]] = event
+        self._event_changes.append(event["id"])
+        return 200, event
+
+    def _active_events(self, time_min: str, time_max: str) -> list[dict]:
+        start, end = _utc(time_min), _utc(time_max)
+        items = [
+            event
+            for event in self.events.values()
+            if event["status"] != "cancelled"
+            and _utc(event["end"]["dateTime"]) > start
+            and _utc(event["start"]["dateTime"]) < end
+        ]
+        return sorted(items, key=lambda event: _utc(event["start"]["dateTime"]))
+
+    def _list_events(self, match, query, data) -> tuple[int, dict]:
+        sync_token = query.get("syncToken", [None])[0]
+        if sync_token is not None:
+            changed = dict.fromkeys(self._event_changes[int(sync_token):])
+            items = [self.events[event_id] for event_id in changed]
+        else:
+            items = self._active_events(query.get("timeMin", [MIN_TIME])[0], query.get("timeMax", [MAX_TIME])[0])
+        return 200, {"kind": "calendar#events", "items": items, "nextSyncToken": str(len(self._event_changes))}
+
+    def _free_busy(self, match, query, data) -> tuple[int, dict]:
+        calendars = {
+            item["id"]: {
+                "busy": [
+                    {"start": event["start"]["dateTime"], "end": event["end"]["dateTime"]}
+                    for event in self._active_events(data["timeMin"], data["timeMax"])
+                ]
+            }
+            for item in data["items"]
+        }
+        return 200, {"kind": "calendar#freeBusy", "calendars": calendars}
+
+
+MIN_TIME = "0001-01-01T00:00:00+00:00"
+MAX_TIME = "9999-12-31T00:00:00+00:00"
+
+
+def _utc(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
@@ -1,11 +1,40 @@
+import asyncio
+
 import pytest
-from langsmith import unit
 
-from agent import graph
+from agent import build_email_agent, google_auth
+from agent.configuration import Configuration
+from agent.models import STAGES, register_chat_model
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+from tests.fakes.google_api import FakeGoogleHttp
 
 
 @pytest.mark.asyncio
-@unit
-async def test_agent_simple_passthrough() -> None:
-    res = await graph.ainvoke({"changeme": "some_val"})
-    assert res is not None
+@pytest.mark.parametrize("intake_mode", ["fused", "staged"])
+async def test_corpus_runs_offline(intake_mode: str, tmp_path) -> None:
+    corpus = generate_corpus(40, seed=1)
+    oracle = CorpusOracle(corpus)
+    models = {stage: FakeChatModel(respond=oracle.respond, structured=oracle.structured) for stage in STAGES}
+    for stage, model in models.items():
+        register_chat_model(f"fake:{stage}", model)
+    fake = FakeGoogleHttp()
+    google_auth.set_service_registry(fake.registry(), Configuration.langgraph_user_id)
+
+    graph = build_email_agent()
+    configurable = {f"{stage}_model": f"fake:{stage}" for stage in STAGES}
+    # The same corpus runs for each mode, so its emails must not be deduplicated
+    outbox = {"outbox_path": str(tmp_path / "outbox.sqlite"), "outbox_wait_seconds": 10, "outbox_dedup_seconds": 0}
+    config = {"configurable": {**configurable, **outbox, "intake_mode": intake_mode, "classification_cache": "none"}}
+    results = await asyncio.gather(
+        *(graph.ainvoke({"messages": [{"role": "user", "content": item.text}]}, config) for item in corpus)
+    )
+
+    for item, result in zip(corpus, results):
+        # Emails to answer and user requests reach the agent with their content
+        expected = f"Handled {item.reference}." if item.label in ("respond", "request") else "Done."
+        assert result["messages"][-1].content == expected
+    planned = [tool for item in corpus for tool, _ in item.tool_calls if item.label in ("respond", "request")]
+    assert len(fake.sent_messages) == planned.count("write_email")
+    assert len(fake.events) == planned.count("schedule_meeting")
+    assert models["response"].calls > 0
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from agent import google_auth, graph
+from agent.state import Router
+from tests.fakes.google_api import FakeGoogleHttp
+
+MODEL_LATENCY = 0.1
+
+
+def _email(i: int) -> str:
+    return f"From: sender{i}@example.com\nTo: john@company.com\nSubject: Question {i}\n\nCan we meet?"
+
+
+async def _slow_classify(messages) -> Router:
+    await asyncio.sleep(MODEL_LATENCY)
+    return Router(reasoning="test", classification="respond")
+
+
+def test_async_triage_scales_with_concurrency(monkeypatch) -> None:
+    def blocking_classify(messages) -> Router:
+        time.sleep(MODEL_LATENCY)
+        return Router(reasoning="test", classification="respond")
+
+    model = RunnableLambda(blocking_classify, afunc=_slow_classify)
+    monkeypatch.setattr(graph, "get_stage_model", lambda configuration, stage, schema: model)
+    config = {"configurable": {"classification_cache": "none", "preclassifier": False, "intake_mode": "staged"}}
+
+    async def load(n: int) -> float:
+        states = [{"messages": [HumanMessage(content=_email(i))]} for i in range(n)]
+        start = time.perf_counter()
+        commands = await asyncio.gather(*(graph.atriage_router(state, config) for state in states))
+        assert all(command.goto == "response_agent" for command in commands)
+        return time.perf_counter() - start
+
+    # 20x the load takes about as long as a single email: the loop never blocks on the model
+    single, many = asyncio.run(load(1)), asyncio.run(load(20))
+    assert many < 5 * single
+
+
+def test_async_tools_share_one_batch(monkeypatch, tmp_path) -> None:
+    fake = FakeGoogleHttp(latency=0.05)
+    gmail = fake.registry().service("gmail", "v1")
+    monkeypatch.setattr(google_auth, "get_gmail_service", lambda user_id=None: gmail)
+
+    # An outbox of its own, whose rate limit lets the 10 emails go at once
+    outbox = {"outbox_path": str(tmp_path / "outbox.sqlite"), "outbox_rate_per_second": 100.0, "outbox_burst": 10}
+    config = {"configurable": {**outbox, "outbox_wait_seconds": 10}}
+
+    async def send_all() -> list[ToolMessage]:
+        return await asyncio.gather(
+            *(
+                graph.write_email.ainvoke({
+                    "name": "write_email",
+                    "args": {"to": "alice@company.com", "subject": f"Update {i}", "content": "Hi"},
+                    "id": f"call_{i}",
+                    "type": "tool_call",
+                }, config)
+                for i in range(10)
+            )
+        )
+
+    results = asyncio.run(send_all())
+    assert all("Message ID" in result.content for result in results)
+    assert len(fake.sent_messages) == 10
+    assert fake.round_trips == 1
@@ -0,0 +1,47 @@
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from agent import graph, triage_batch
+from agent.state import Router
+
+
+def test_triage_batch_yields_every_email(monkeypatch) -> None:
+    def classify(messages):
+        ignore = "newsletter" in messages[-1]["content"]
+        return Router(reasoning="test", classification="ignore" if ignore else "notify")
+
+    monkeypatch.setattr(graph, "get_stage_model", lambda configuration, stage, schema: RunnableLambda(classify))
+    emails = [
+        f"From: sender{i}@example.com\nTo: john@company.com\nSubject: Update {i}\n\n{body}"
+        for i, body in enumerate(["Weekly newsletter", "Build failed", "Monthly newsletter"])
+    ]
+
+    batch = triage_batch(emails, max_concurrency=2, config={"configurable": {"classification_cache": "none"}})
+    results = sorted(batch, key=lambda result: result.index)
+
+    assert [result.router.classification for result in results] == ["ignore", "notify", "ignore"]
+    assert all(result.error is None for result in results)
+    assert batch.completed == 3 and batch.emails_per_second > 0
+
+
+def test_batch_and_graph_triage_a_thread_the_same_way(monkeypatch) -> None:
+    prompts = []
+
+    def classify(messages):
+        prompts.append(messages[-1]["content"])
+        return Router(reasoning="test", classification="ignore" if "Sent from my iPhone" in prompts[-1] else "respond")
+
+    monkeypatch.setattr(graph, "get_stage_model", lambda configuration, stage, schema: RunnableLambda(classify))
+    email = (
+        "From: Alice <alice@example.com>\nTo: John <john@company.com>\nSubject: Re: Review\n\n"
+        "Tuesday works for me.\n\nAlice\nSent from my iPhone\n\n"
+        "On Mon, May 5, 2025 at 10:00 AM John <john@company.com> wrote:\n> Can we move the review to Tuesday?"
+    )
+    config = {"configurable": {"classification_cache": "none", "preclassifier": False}}
+
+    [result] = list(triage_batch([email], config=config))
+    command = graph.triage_router({"messages": [HumanMessage(content=email)]}, config)
+
+    assert result.router.classification == "respond" and command.goto == "response_agent"
+    assert prompts[0] == prompts[1]
+    assert "Sent from my iPhone" not in result.email_info.email_thread
@@ -0,0 +1,49 @@
+from agent.cache import ClassificationCache, InMemoryCacheBackend, SQLiteCacheBackend
+from agent.state import EmailInput, Router
+
+EMAIL = EmailInput(
+    author_name="CI",
+    author_email="ci@builds.example.com",
+    to_name="John",
+    to_email="john@company.com",
+    subject="Build 41 passed",
+    email_thread="Pipeline   main #41 passed in 3m.",
+)
+RULES = {"ignore": "Marketing", "notify": "Build notifications", "respond": "Questions"}
+PROFILE = {"name": "John"}
+RESULT = Router(reasoning="Build notification", classification="notify")
+
+
+def test_near_duplicates_hit_the_cache() -> None:
+    cache = ClassificationCache(InMemoryCacheBackend())
+    assert cache.get(EMAIL, RULES, PROFILE) is None
+    cache.set(EMAIL, RULES, PROFILE, RESULT)
+    copy = EMAIL.model_copy(update={"subject": "Build 42 passed", "email_thread": "Pipeline main #42 passed in 4m."})
+    assert cache.get(copy, RULES, PROFILE) == RESULT
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_lru_and_ttl_eviction() -> None:
+    backend = InMemoryCacheBackend(max_entries=1)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    assert backend.get("a") is None and backend.get("b") == "2"
+
+    expired = InMemoryCacheBackend(ttl_seconds=-1)
+    expired.set("a", "1")
+    assert expired.get("a") is None
+
+
+def test_sqlite_cache_survives_restart_and_rule_changes(tmp_path) -> None:
+    path = str(tmp_path / "cache.sqlite")
+    cache = ClassificationCache(SQLiteCacheBackend(path))
+    cache.set(EMAIL, RULES, PROFILE, RESULT)
+    cache.set(EMAIL, RULES, PROFILE, RESULT, scope="alice")
+
+    cache = ClassificationCache(SQLiteCacheBackend(path))
+    assert cache.get(EMAIL, RULES, PROFILE) == RESULT
+
+    # New rules of one user miss, without dropping the entries of other users
+    changed = {**RULES, "notify": "Team member out sick"}
+    assert cache.get(EMAIL, changed, PROFILE) is None
+    assert cache.get(EMAIL, RULES, PROFILE, scope="alice") == RESULT
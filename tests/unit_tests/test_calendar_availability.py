@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+from agent.calendar_availability import AvailabilityEngine, IntervalIndex
+from tests.fakes.google_api import FakeGoogleHttp
+
+
+def _utc(value: str) -> datetime:
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def test_interval_index_merges_and_finds_gaps() -> None:
+    index = IntervalIndex()
+    index.add(_utc("2025-03-31T10:00"), _utc("2025-03-31T11:00"))
+    index.add(_utc("2025-03-31T10:30"), _utc("2025-03-31T12:00"))
+    index.add(_utc("2025-03-31T15:00"), _utc("2025-03-31T15:15"))
+    assert len(index) == 2
+
+    free = index.free(_utc("2025-03-31T09:00"), _utc("2025-03-31T18:00"), timedelta(hours=1))
+    assert free == [
+        (_utc("2025-03-31T09:00"), _utc("2025-03-31T10:00")),
+        (_utc("2025-03-31T12:00"), _utc("2025-03-31T15:00")),
+        (_utc("2025-03-31T15:15"), _utc("2025-03-31T18:00")),
+    ]
+
+
+def test_engine_answers_locally_and_syncs_remote_changes() -> None:
+    fake = FakeGoogleHttp()
+    calendar = fake.registry().service("calendar", "v3")
+    fake.add_event("Standup", "2025-03-31T09:00:00+00:00", "2025-03-31T09:30:00+00:00")
+    engine = AvailabilityEngine(lambda: calendar, sync_interval=0)
+
+    day = (_utc("2025-03-31T00:00"), _utc("2025-04-01T00:00"))
+    assert engine.free_slots(*day, min_minutes=60)[0][0] == _utc("2025-03-31T09:30")
+    assert engine.free_slots(_utc("2025-04-02T00:00"), _utc("2025-04-03T00:00"))
+    assert engine.queries == 1
+
+    event = {"start": {"dateTime": "2025-03-31T09:30:00+00:00"}, "end": {"dateTime": "2025-03-31T12:00:00+00:00"}}
+    calendar.events().insert(calendarId="primary", body=event).execute()
+    engine.add_busy(_utc("2025-03-31T09:30"), _utc("2025-03-31T12:00"))
+    assert engine.index.busy(*day) == [(_utc("2025-03-31T09:00"), _utc("2025-03-31T12:00"))]
+
+    fake.add_event("Offsite", "2025-03-31T12:00:00+00:00", "2025-03-31T18:00:00+00:00")
+    assert engine.free_slots(*day, min_minutes=60) == []
+    # Only the changed day was reloaded, other days are still answered locally
+    assert engine.queries == 2
+    assert engine.free_slots(_utc("2025-04-02T00:00"), _utc("2025-04-03T00:00"))
+    assert engine.queries == 2
+
+    # A changed recurring series reloads the whole window
+    weekly = {**event, "summary": "1:1", "recurrence": ["RRULE:FREQ=WEEKLY"]}
+    calendar.events().insert(calendarId="primary", body=weekly).execute()
+    assert engine.free_slots(_utc("2025-04-02T00:00"), _utc("2025-04-03T00:00"))
+    assert engine.queries == 3
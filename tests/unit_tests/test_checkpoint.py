@@ -0,0 +1,110 @@
+import pytest
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langgraph.constants import CONFIG_KEY_CHECKPOINTER
+
+from agent import build_email_agent, google_auth, graph
+from agent.checkpoint import SqliteCheckpointer
+from agent.configuration import Configuration
+from agent.models import STAGES, register_chat_model
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+from tests.fakes.google_api import FakeGoogleHttp
+
+
+def _send_now(tmp_path) -> dict:
+    # Wait for each email to be sent, through an outbox of the test's own
+    return {"outbox_path": str(tmp_path / "outbox.sqlite"), "outbox_wait_seconds": 10, "outbox_dedup_seconds": 0}
+
+
+@pytest.fixture
+def fake_google() -> FakeGoogleHttp:
+    fake = FakeGoogleHttp()
+    google_auth.set_service_registry(fake.registry(), Configuration.langgraph_user_id)
+    return fake
+
+
+def _email_to_answer():
+    corpus = generate_corpus(40, seed=3)
+    item = next(item for item in corpus if item.label == "respond" and item.tool_calls[0][0] == "write_email")
+    return item, CorpusOracle(corpus)
+
+
+def _register(oracle: CorpusOracle, respond) -> dict:
+    for stage in STAGES:
+        register_chat_model(f"fake:{stage}", FakeChatModel(respond=respond, structured=oracle.structured))
+    return {f"{stage}_model": f"fake:{stage}" for stage in STAGES}
+
+
+def test_interrupted_run_resumes_without_resending(tmp_path, fake_google) -> None:
+    item, oracle = _email_to_answer()
+    crash = True
+
+    def respond(messages: list[BaseMessage]) -> AIMessage:
+        # The worker dies right after the email was sent
+        if crash and isinstance(messages[-1], ToolMessage):
+            raise RuntimeError("worker killed")
+        return oracle.respond(messages)
+
+    configurable = _register(oracle, respond)
+    config = {"configurable": {**configurable, "classification_cache": "none", "thread_id": "t1", **_send_now(tmp_path)}}
+    input = {"messages": [{"role": "user", "content": item.text}]}
+
+    checkpointer = SqliteCheckpointer(str(tmp_path / "checkpoints.sqlite"))
+    with pytest.raises(RuntimeError):
+        build_email_agent(checkpointer=checkpointer).invoke(input, config)
+    checkpointer.close()
+    assert len(fake_google.sent_messages) == 1
+
+    # A new worker resumes from the database
+    crash = False
+    checkpointer = SqliteCheckpointer(str(tmp_path / "checkpoints.sqlite"))
+    agent = build_email_agent(checkpointer=checkpointer)
+    assert agent.get_state(config).next == ("response_agent",)
+    result = agent.invoke(None, config)
+    assert result["messages"][-1].content == f"Handled {item.reference}."
+    assert len(fake_google.sent_messages) == 1
+    assert len(list(checkpointer.list(config))) > 2
+    checkpointer.close()
+
+
+@pytest.mark.asyncio
+async def test_async_run_is_checkpointed(tmp_path, fake_google) -> None:
+    item, oracle = _email_to_answer()
+    configurable = _register(oracle, oracle.respond)
+    config = {"configurable": {**configurable, **_send_now(tmp_path), "classification_cache": "none", "thread_id": "t2"}}
+
+    checkpointer = SqliteCheckpointer(str(tmp_path / "checkpoints.sqlite"), compress_min_bytes=64)
+    agent = build_email_agent(checkpointer=checkpointer)
+    result = await agent.ainvoke({"messages": [{"role": "user", "content": item.text}]}, config)
+
+    state = await agent.aget_state(config)
+    assert state.next == ()
+    assert [m.id for m in state.values["messages"]] == [m.id for m in result["messages"]]
+    assert any(type_.endswith("+zlib") for (type_,) in checkpointer._query("SELECT type FROM blobs", ()))
+    checkpointer.close()
+
+
+def test_tool_call_is_made_once_per_thread(tmp_path, fake_google) -> None:
+    checkpointer = SqliteCheckpointer(str(tmp_path / "checkpoints.sqlite"), flush_interval_ms=0)
+    call = {
+        "name": "write_email",
+        "args": {"to": "alice@company.com", "subject": "Update", "content": "Hi"},
+        "id": "call_1",
+        "type": "tool_call",
+    }
+
+    def invoke(thread_id: str) -> ToolMessage:
+        config = {"configurable": {"thread_id": thread_id, CONFIG_KEY_CHECKPOINTER: checkpointer, **_send_now(tmp_path)}}
+        return graph.write_email.invoke(call, config)
+
+    first, replayed = invoke("t1"), invoke("t1")
+    assert replayed.content == first.content
+    assert len(fake_google.sent_messages) == 1
+    invoke("t2")
+    assert len(fake_google.sent_messages) == 2
+
+    # A call claimed by a worker that died before recording the result is not repeated
+    checkpointer.ledger.claim("t3:call_1", "write_email")
+    assert "not repeated" in invoke("t3").content
+    assert len(fake_google.sent_messages) == 2
+    checkpointer.close()
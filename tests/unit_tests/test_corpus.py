@@ -0,0 +1,25 @@
+from agent.state import EmailIntake, Router
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+
+
+def test_corpus_is_reproducible_and_labeled() -> None:
+    corpus = generate_corpus(200, seed=3)
+    assert [item.text for item in corpus] == [item.text for item in generate_corpus(200, seed=3)]
+    assert {item.label for item in corpus} == {"respond", "ignore", "notify", "request"}
+    assert {item.format for item in corpus} == {"raw", "pasted", "request"}
+    assert all(item.reference in item.text for item in corpus)
+    assert all((item.email is None) == (item.label == "request") for item in corpus)
+
+
+def test_fake_model_structured_output_from_oracle() -> None:
+    corpus = generate_corpus(50)
+    model = FakeChatModel(structured=CorpusOracle(corpus, low_confidence=0).structured)
+    email = next(item for item in corpus if item.label == "notify")
+    request = next(item for item in corpus if item.label == "request")
+
+    router = model.with_structured_output(Router).invoke([{"role": "user", "content": email.text}])
+    assert router.classification == "notify" and router.confidence == 0.95
+    raw = model.with_structured_output(EmailIntake, include_raw=True).invoke(request.text)
+    assert raw["parsing_error"] is None and raw["parsed"].email_found is False
+    assert model.calls == 2
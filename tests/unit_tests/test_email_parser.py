@@ -0,0 +1,52 @@
+from agent.email_parser import parse_raw_email
+
+RAW_EMAIL = """From: Alice Smith <alice.smith@company.com>
+To: John Doe <john.doe@company.com>, Bob <bob@company.com>
+Subject: Quick question about API documentation
+
+Hi John,
+
+Could you help clarify if the missing endpoints were intentional?
+
+Thanks!
+Alice
+"""
+
+
+def test_parse_raw_email() -> None:
+    email_info = parse_raw_email(RAW_EMAIL)
+    assert email_info is not None
+    assert email_info.author_name == "Alice Smith"
+    assert email_info.author_email == "alice.smith@company.com"
+    assert email_info.to_email == "john.doe@company.com"
+    assert email_info.subject == "Quick question about API documentation"
+    assert email_info.email_thread.startswith("Hi John,")
+
+
+def test_parse_multipart_prefers_plain_text() -> None:
+    raw = """From: ci@builds.example.com
+To: john.doe@company.com
+Subject: Build passed
+MIME-Version: 1.0
+Content-Type: multipart/alternative; boundary="b"
+
+--b
+Content-Type: text/html
+
+<p>Build <b>42</b> passed</p>
+--b
+Content-Type: text/plain
+
+Build 42 passed
+--b--
+"""
+    email_info = parse_raw_email(raw)
+    assert email_info is not None
+    assert email_info.author_name == "ci@builds.example.com"
+    assert email_info.email_thread == "Build 42 passed"
+
+
+def test_ambiguous_input_falls_back() -> None:
+    assert parse_raw_email("Hey, can you send an email to Alice?") is None
+    assert parse_raw_email("From: a@x.com\nSubject: hi\n\nno recipient") is None
+    assert parse_raw_email("From: a@x.com, b@x.com\nTo: c@x.com\nSubject: hi\n\nbody") is None
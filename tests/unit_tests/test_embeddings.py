@@ -0,0 +1,39 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from agent.embeddings import EmbeddingService
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        self.calls.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_concurrent_requests_share_forward_passes(tmp_path) -> None:
+    encoder = CountingEncoder()
+    service = EmbeddingService(cache_path=str(tmp_path / "cache.sqlite"), max_wait_ms=50, encoder=encoder)
+
+    texts = [f"memory {i}" for i in range(20)]
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        embeddings = list(pool.map(service.embed_query, texts))
+
+    assert embeddings[12] == [len("memory 12"), 1.0]
+    assert len(encoder.calls) < 5
+    assert service.stats().encoded == 20
+
+
+def test_embeddings_are_cached_on_disk(tmp_path) -> None:
+    path = str(tmp_path / "cache.sqlite")
+    EmbeddingService(cache_path=path, encoder=CountingEncoder()).embed_documents(["a", "bb"])
+
+    encoder = CountingEncoder()
+    service = EmbeddingService(cache_path=path, encoder=encoder)
+    assert asyncio.run(service.aembed_documents(["bb", "ccc", "a"])) == [[2.0, 1.0], [3.0, 1.0], [1.0, 1.0]]
+    assert encoder.calls == [["ccc"]]
+    assert service.stats().cache_hits == 2
@@ -0,0 +1,78 @@
+from langchain_core.messages import BaseMessage
+
+from agent import graph
+from agent.configuration import Configuration
+from agent.examples import ExampleStore, hash_embed, register_example_store
+from agent.models import register_chat_model
+from agent.state import EmailInput, Router
+from tests.fakes.chat_models import FakeChatModel
+
+
+def _email(author_email: str, subject: str, body: str) -> EmailInput:
+    return EmailInput(
+        author_name="Sender",
+        author_email=author_email,
+        to_name="John",
+        to_email="john@company.com",
+        subject=subject,
+        email_thread=body,
+    )
+
+
+INVOICE = _email("billing@acme.com", "Invoice 1042 overdue", "Your invoice 1042 from ACME is overdue, please pay.")
+LUNCH = _email("team@company.com", "Friday team lunch", "The team lunch on Friday moves to the rooftop.")
+
+
+def test_nearest_examples_per_user_with_cached_snippets(tmp_path) -> None:
+    store = ExampleStore(str(tmp_path), embed=hash_embed, dims=256)
+    invoice = store.add(INVOICE, "respond", "ignore", user_id="alice")
+    store.add(LUNCH, "notify", user_id="alice")
+    store.add(INVOICE, "ignore", user_id="bob")
+
+    similar = _email("billing@acme.com", "Invoice 1043 overdue", "Invoice 1043 from ACME is overdue.")
+    assert [e.id for e in store.nearest(similar, k=1, user_id="alice")] == [invoice.id]
+    assert [e.correct for e in store.nearest(similar, k=1, user_id="bob")] == ["ignore"]
+
+    fetched = []
+    get = store.get
+    store.get = lambda ids: fetched.append(ids) or get(ids)
+    message = store.examples_message(similar, k=1, user_id="alice")
+    assert "Classification: respond (not ignore)" in message and "Subject: Invoice 1042 overdue" in message
+    assert store.examples_message(similar, k=1, user_id="alice") == message
+    assert fetched == [[invoice.id]]
+
+    # Records and vectors survive a restart
+    store.index.flush()
+    reopened = ExampleStore(str(tmp_path), embed=hash_embed, dims=256)
+    assert [e.email for e in reopened.nearest(similar, k=1, user_id="alice")] == [INVOICE]
+    assert [e.correct for e in reopened.all("alice")] == ["respond", "notify"]
+
+
+def test_triage_prompt_includes_similar_corrections(tmp_path) -> None:
+    calls: list[list[BaseMessage]] = []
+
+    def structured(messages: list[BaseMessage], schema) -> Router:
+        calls.append(messages)
+        return Router(reasoning="", classification="ignore")
+
+    register_chat_model("fake:triage-examples", FakeChatModel(structured=structured))
+    path = str(tmp_path)
+    register_example_store(path, ExampleStore(path, embed=hash_embed, dims=256))
+    config = {
+        "configurable": {
+            "triage_model": "fake:triage-examples",
+            "preclassifier": False,
+            "classification_cache": "none",
+            "triage_examples_path": path,
+        }
+    }
+    graph.record_triage_correction(INVOICE, "respond", "ignore", config)
+
+    configuration = Configuration.from_runnable_config(config)
+    graph._classify(_email("billing@acme.com", "Invoice 1043 overdue", "ACME invoice 1043 is overdue."), configuration)
+    graph._classify(LUNCH, configuration)
+
+    with_examples, without_examples = calls
+    assert with_examples[0].content == without_examples[0].content
+    assert "Classification: respond (not ignore)" in with_examples[1].content
+    assert len(with_examples) == 3 and len(without_examples) == 2
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+
+from agent.google_auth import ServiceRegistry, create_message
+from agent.google_batch import MutationBatcher
+from tests.fakes.google_api import FakeGoogleHttp
+
+
+def _send(gmail, subject: str):
+    return gmail.users().messages().send(userId="me", body=create_message("alice@company.com", subject, "Hi"))
+
+
+def test_mutations_are_coalesced_into_one_batch() -> None:
+    fake = FakeGoogleHttp()
+    gmail = fake.registry().service("gmail", "v1")
+    batcher = MutationBatcher(window=0.05)
+
+    futures = [batcher.submit(_send(gmail, f"Update {i}")) for i in range(5)]
+    results = [future.result(timeout=5) for future in futures]
+
+    assert len({result["id"] for result in results}) == 5
+    assert len(fake.sent_messages) == 5
+    assert fake.round_trips == 1
+
+
+def test_rate_limited_requests_are_retried() -> None:
+    fake = FakeGoogleHttp()
+    gmail = fake.registry().service("gmail", "v1")
+    batcher = MutationBatcher(window=0.01, backoff_base=0.01)
+
+    fake.fail("messages/send", 429, 503)
+    futures = [batcher.submit(_send(gmail, f"Update {i}")) for i in range(3)]
+    assert all(future.result(timeout=5)["id"] for future in futures)
+    assert len(fake.sent_messages) == 3
+    assert batcher.retries == 2
+
+
+def test_client_errors_are_not_retried() -> None:
+    fake = FakeGoogleHttp()
+    calendar = fake.registry().service("calendar", "v3")
+    batcher = MutationBatcher(window=0.01, backoff_base=0.01)
+
+    fake.fail("events", 400)
+    request = calendar.events().insert(calendarId="primary", body={"summary": "Sync"})
+    with pytest.raises(HttpError):
+        batcher.execute(request, timeout=5)
+    assert batcher.retries == 0
+
+
+def test_network_errors_are_retried_only_for_idempotent_requests() -> None:
+    fake = FakeGoogleHttp()
+    gmail = fake.registry().service("gmail", "v1")
+    batcher = MutationBatcher(window=0.01, backoff_base=0.01)
+    request = fake.request
+    drops = []
+
+    def drop_connection(*args, **kwargs):
+        # The request reaches the server, the response is lost
+        response = request(*args, **kwargs)
+        if drops:
+            drops.pop()
+            raise ConnectionResetError("Connection reset by peer")
+        return response
+
+    fake.request = drop_connection
+
+    drops.append(1)
+    futures = [batcher.submit(_send(gmail, f"Update {i}")) for i in range(2)]
+    for future in futures:
+        with pytest.raises(ConnectionResetError):
+            future.result(timeout=5)
+    assert len(fake.sent_messages) == 2 and batcher.retries == 0
+
+    drops.append(1)
+    assert batcher.execute(gmail.users().getProfile(userId="me"), timeout=5)["emailAddress"] == "me@example.com"
+    assert batcher.retries == 1
+
+
+def test_requests_use_the_transport_of_the_executing_thread() -> None:
+    fake = FakeGoogleHttp()
+    calls = []
+
+    class Transport:
+        """One httplib2 transport per thread, recording the threads using it."""
+
+        def __init__(self):
+            self.owner = threading.get_ident()
+
+        def request(self, *args, **kwargs):
+            calls.append((self.owner, threading.get_ident()))
+            return fake.request(*args, **kwargs)
+
+    registry = ServiceRegistry(credentials=Credentials(token="fake-token"), http_factory=Transport)
+    gmail = registry.service("gmail", "v1")
+
+    # Built here, executed by the batcher's threads. The window is wide enough
+    # for both sends to share one batch on a loaded machine
+    batcher = MutationBatcher(window=0.5)
+    futures = [batcher.submit(_send(gmail, f"Update {i}")) for i in range(2)]
+    futures.append(batcher.submit(gmail.users().getProfile(userId="me"), group="single"))
+    assert all(future.result(timeout=5) for future in futures)
+    assert len(calls) == 2 and all(owner == thread != threading.get_ident() for owner, thread in calls)
@@ -0,0 +1,74 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import START, StateGraph
+from langgraph.prebuilt import create_react_agent
+from langgraph.store.memory import InMemoryStore
+
+from agent.history import SUMMARY_ID, amanage_history, compact, count_tokens, manage_history, propagate
+from agent.state import State
+from tests.fakes.chat_models import FakeChatModel, call_tool_then_answer
+
+
+@tool
+def check_calendar_availability(day: str) -> str:
+    """Check calendar availability for a given day."""
+    return "\n".join(f"{day} {hour:02d}:00-{hour:02d}:30" for hour in range(24) for _ in range(10))
+
+
+def test_compact_keeps_whole_turns_within_budget() -> None:
+    messages = []
+    for i in range(10):
+        messages += [
+            HumanMessage(f"Request {i} " + "x" * 400, id=f"h{i}"),
+            AIMessage("", tool_calls=[{"name": "check_calendar_availability", "args": {}, "id": f"c{i}"}], id=f"a{i}"),
+            ToolMessage("slot\n" * 2000, tool_call_id=f"c{i}", name="check_calendar_availability", id=f"t{i}"),
+            AIMessage(f"Answer {i}", id=f"r{i}"),
+        ]
+
+    compaction = compact(messages, max_tokens=1000, tool_output_max_tokens=100)
+    assert compaction.changed
+    assert compaction.messages[0].id == SUMMARY_ID
+    assert f"Request {len(compaction.evicted) - 1} " in compaction.messages[0].content
+    # Only whole turns are evicted, and the latest one is kept
+    assert [m.id for m in compaction.messages[-4:]] == ["h9", "a9", "t9", "r9"]
+    assert all(turn[0].type == "human" for turn in compaction.evicted)
+    assert "more lines trimmed" in compaction.messages[-2].content
+    assert count_tokens([compaction.messages[-2]]) <= 100
+
+    # Compacting the result again changes nothing
+    again = compact(compaction.messages, max_tokens=1000, tool_output_max_tokens=100)
+    assert not again.changed and again.messages == compaction.messages
+    kept = compaction.messages[-2].content.splitlines()[:-1]
+    assert compaction.messages[-2].content.endswith(f"({2000 - len(kept)} more lines trimmed, narrow the request to see them)")
+
+    assert not compact(messages[-4:-1], max_tokens=None, tool_output_max_tokens=10_000).changed
+
+
+def test_tokens_per_call_stay_flat_on_long_threads() -> None:
+    model = FakeChatModel(respond=call_tool_then_answer("check_calendar_availability", {"day": "2025-05-01"}))
+    agent = create_react_agent(
+        model,
+        tools=[check_calendar_availability],
+        pre_model_hook=RunnableLambda(manage_history, afunc=amanage_history),
+    )
+    builder = StateGraph(State)
+    builder.add_node("response_agent", lambda state, config: propagate(state["messages"], agent.invoke(state, config)))
+    builder.add_edge(START, "response_agent")
+    store = InMemoryStore()
+    graph = builder.compile(store=store, checkpointer=InMemorySaver())
+
+    config = {"configurable": {"thread_id": "thread", "history_max_tokens": 1500, "tool_output_max_tokens": 200}}
+    for i in range(30):
+        result = graph.invoke({"messages": [{"role": "user", "content": f"Am I free on day {i}? " + "x" * 300}]}, config)
+
+    # Two model calls per turn (before and after the tool call): after the
+    # first turns, neither input grows any more
+    assert max(model.input_tokens) <= 1500
+    for calls in (model.input_tokens[20::2], model.input_tokens[21::2]):
+        assert max(calls) - min(calls) < 20
+    # Evicted turns are searchable memories and left the thread
+    memories = store.search(("email_assistant", "lance", "collection"), limit=100)
+    assert len(memories) + len(result["messages"]) // 4 == 30
+    assert result["messages"][0].id == SUMMARY_ID
@@ -0,0 +1,52 @@
+import asyncio
+
+from agent import google_auth
+from agent.ingestion import GmailIngestor, IngestionCheckpoint
+from tests.fakes.google_api import FakeGoogleHttp
+
+
+def _raw(i: int) -> str:
+    return f"From: sender{i}@example.com\nTo: john@company.com\nSubject: Update {i}\n\nBody {i}"
+
+
+async def _drain(ingestor: GmailIngestor, stop_after: int = -1) -> list[str]:
+    subjects = []
+    async for email in ingestor.stream(follow=False):
+        subjects.append(email.email_info.subject)
+        await ingestor.ack(email)
+        if len(subjects) == stop_after:
+            break
+    return subjects
+
+
+def test_backfill_then_incremental_sync_resumes_after_restart(tmp_path) -> None:
+    fake = FakeGoogleHttp()
+    gmail = fake.registry().service("gmail", "v1")
+    for i in range(5):
+        fake.deliver(_raw(i))
+    path = str(tmp_path / "ingestion.sqlite")
+
+    def ingestor() -> GmailIngestor:
+        return GmailIngestor(lambda: gmail, IngestionCheckpoint(path), max_in_flight=2, page_size=2)
+
+    # The worker dies after two emails of the backfill
+    assert len(asyncio.run(_drain(ingestor(), stop_after=2))) == 2
+    # The restarted worker only processes what is left
+    assert len(asyncio.run(_drain(ingestor()))) == 3
+
+    fake.deliver(_raw(5))
+    assert asyncio.run(_drain(ingestor())) == ["Update 5"]
+    assert asyncio.run(_drain(ingestor())) == []
+
+
+def test_ingestion_has_a_token_of_its_own(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(google_auth, "TOKENS_DIR", str(tmp_path))
+    monkeypatch.setattr(google_auth, "_registries", type(google_auth._registries)())
+    path = google_auth.ingestion_token_path_for("lance")
+    assert path != google_auth.token_path_for("lance")
+
+    registry = google_auth.get_service_registry(path, google_auth.INGESTION_SCOPES)
+    assert registry.scopes == google_auth.INGESTION_SCOPES
+    # Existing tokens are refreshed with the scopes they were granted
+    assert google_auth.get_service_registry(google_auth.token_path_for("lance")).scopes == google_auth.SCOPES
+    assert not set(google_auth.INGESTION_SCOPES) & set(google_auth.SCOPES)
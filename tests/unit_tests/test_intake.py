@@ -0,0 +1,44 @@
+from langchain_core.messages import HumanMessage
+
+from agent import graph
+from agent.models import STAGES, register_chat_model
+from agent.state import EmailIntake
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+
+
+def _config(oracle: CorpusOracle, **configurable) -> dict:
+    for stage in STAGES:
+        register_chat_model(f"fake:{stage}", FakeChatModel(respond=oracle.respond, structured=oracle.structured))
+    models = {f"{stage}_model": f"fake:{stage}" for stage in STAGES}
+    return {"configurable": {**models, "classification_cache": "none", "preclassifier": False, **configurable}}
+
+
+def _staged(state: dict, config: dict):
+    command = graph.detect_email(state, config)
+    return graph.triage_router(state, config) if command.goto == "triage_router" else command
+
+
+def test_fused_intake_routes_the_corpus_like_the_staged_nodes() -> None:
+    corpus = generate_corpus(60, seed=2)
+    config = _config(CorpusOracle(corpus))
+
+    for item in corpus:
+        state = {"messages": [HumanMessage(content=item.text)]}
+        fused, staged = graph.intake(state, config), _staged(state, config)
+        assert fused.goto == staged.goto
+        assert fused.update == staged.update
+        # Only the user requests reach the agent as they were written
+        assert (fused.update == graph._request_update(item.text)) == (item.label == "request")
+
+
+def test_fused_intake_without_a_classification_is_a_request() -> None:
+    corpus = [item for item in generate_corpus(20, seed=3) if item.format == "pasted"][:1]
+    oracle = CorpusOracle(corpus)
+    # The model found an email but did not classify it
+    oracle.structured = lambda messages, schema: EmailIntake(email_found=True, email=corpus[0].email)
+    state = {"messages": [HumanMessage(content=corpus[0].text)]}
+
+    command = graph.intake(state, _config(oracle))
+    assert command.goto == "response_agent"
+    assert command.update == graph._request_update(corpus[0].text)
@@ -0,0 +1,77 @@
+import numpy as np
+
+from agent.memory_index import AnnMemoryStore, IVFIndex
+
+NAMESPACE = ("email_assistant", "lance", "collection")
+
+
+def test_ivf_index_matches_brute_force_and_persists(tmp_path) -> None:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    vectors = centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.normal(size=(2000, 32))
+    index = IVFIndex(32, path=str(tmp_path), nprobe=4, train_threshold=500)
+    index.add_batch([(NAMESPACE, str(i), vector) for i, vector in enumerate(vectors[:1000])])
+    # Inserted after training, assigned to the existing lists
+    for i, vector in enumerate(vectors[1000:], start=1000):
+        index.add(NAMESPACE, str(i), vector)
+    index.add(("other",), "x", vectors[0])
+
+    recalls = []
+    for query in vectors[rng.integers(0, 2000, size=20)]:
+        approximate = {key for _, key, _ in index.search(query, NAMESPACE, 10)}
+        exact = {key for _, key, _ in index.exact_search(query, NAMESPACE, 10)}
+        recalls.append(len(approximate & exact) / 10)
+    assert np.mean(recalls) >= 0.9
+
+    # A namespace too small for the probed lists is scanned without the others
+    assert index.search(vectors[0], ("other",), 10)[0][1] == "x"
+    assert len(index._namespace_rows(("other",))) == 1 and len(index._namespace_rows(NAMESPACE)) == 2000
+
+    index.delete(NAMESPACE, "5")
+    index.flush()
+    reopened = IVFIndex(32, path=str(tmp_path), train_threshold=500)
+    assert len(reopened) == 2000
+    assert reopened.search(vectors[0], ("other",), 1)[0][1] == "x"
+    assert "5" not in {key for _, key, _ in reopened.exact_search(vectors[5], NAMESPACE, 3)}
+
+
+def test_store_search_uses_index_and_caches_queries() -> None:
+    calls = []
+
+    def embed(texts):
+        calls.extend(texts)
+        return [[text.count("invoice"), text.count("meeting"), 1.0] for text in texts]
+
+    store = AnnMemoryStore(index={"dims": 3, "embed": embed, "fields": ["content"]})
+    store.put(NAMESPACE, "a", {"content": "invoice invoice from ACME"})
+    store.put(NAMESPACE, "b", {"content": "meeting meeting with Jim"})
+    store.put(("other",), "c", {"content": "invoice invoice"})
+
+    for _ in range(2):
+        results = store.search(NAMESPACE, query="invoice", limit=1)
+        assert [item.key for item in results] == ["a"]
+    assert calls.count("invoice") == 1 and store.query_cache_hits == 1
+
+    store.delete(NAMESPACE, "a")
+    assert [item.key for item in store.search(NAMESPACE, query="invoice", limit=1)] == ["b"]
+    assert store.get(NAMESPACE, "b").value["content"] == "meeting meeting with Jim"
+
+
+def test_store_items_and_index_survive_reopening(tmp_path) -> None:
+    def embed(texts):
+        return [[text.count("invoice"), text.count("meeting"), 1.0] for text in texts]
+
+    store = AnnMemoryStore(index={"dims": 3, "embed": embed, "fields": ["content"]}, path=str(tmp_path))
+    store.put(NAMESPACE, "a", {"content": "invoice invoice from ACME"})
+    store.put(NAMESPACE, "b", {"content": "meeting meeting with Jim"})
+    store.put(NAMESPACE, "b", {"content": "meeting meeting with Pam"})
+    store.put(("other",), "c", {"content": "invoice invoice"})
+    store.delete(("other",), "c")
+    store.close()
+
+    reopened = AnnMemoryStore(index={"dims": 3, "embed": embed, "fields": ["content"]}, path=str(tmp_path))
+    assert [item.key for item in reopened.search(NAMESPACE, query="invoice", limit=1)] == ["a"]
+    assert reopened.get(NAMESPACE, "b").value["content"] == "meeting meeting with Pam"
+    assert reopened.get(("other",), "c") is None
+    assert {item.key for item in reopened.search(NAMESPACE)} == {"a", "b"}
+    assert reopened.list_namespaces() == [NAMESPACE]
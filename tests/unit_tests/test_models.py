@@ -0,0 +1,34 @@
+from langchain_core.runnables import RunnableLambda
+
+from agent.models import ModelStats, StageModel
+from agent.state import Router
+
+
+def _small(messages) -> dict:
+    subject = messages[-1]["content"]
+    if subject == "garbled":
+        return {"raw": None, "parsed": None, "parsing_error": ValueError("invalid JSON")}
+    confidence = 0.4 if subject == "unsure" else 0.95
+    return {"raw": None, "parsed": Router(reasoning="small", classification="notify", confidence=confidence), "parsing_error": None}
+
+
+def _large(messages) -> Router:
+    return Router(reasoning="large", classification="respond")
+
+
+def test_cascade_escalates_invalid_or_unconfident_answers() -> None:
+    stats = ModelStats()
+    model = StageModel("triage", RunnableLambda(_large), RunnableLambda(_small), min_confidence=0.7, stats=stats)
+
+    answers = [model.invoke([{"role": "user", "content": subject}]).reasoning for subject in ["easy", "unsure", "garbled", "easy"]]
+
+    assert answers == ["small", "large", "large", "small"]
+    report = stats.report()["triage"]
+    assert report.calls == 4 and report.escalation_rate == 0.5
+
+
+def test_stage_without_cascade_calls_the_stage_model() -> None:
+    stats = ModelStats()
+    model = StageModel("parsing", RunnableLambda(_large), stats=stats)
+    assert model.invoke([{"role": "user", "content": "easy"}]).reasoning == "large"
+    assert stats.report()["parsing"].escalations == 0
@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from agent.outbox import Outbox, OutboxEntry, TokenBucket
+
+
+class Transient(Exception):
+    pass
+
+
+class Recorder:
+    """Sends entries at once, failing the first sends of a subject with the given errors."""
+
+    def __init__(self, failures: dict[str, list[Exception]] | None = None):
+        self.sent: list[tuple[float, OutboxEntry]] = []
+        self.failures = failures or {}
+        self._lock = threading.Lock()
+
+    def __call__(self, entry: OutboxEntry) -> Future:
+        future: Future = Future()
+        with self._lock:
+            errors = self.failures.get(entry.subject)
+            if errors:
+                future.set_exception(errors.pop(0))
+                return future
+            self.sent.append((time.monotonic(), entry))
+            future.set_result({"id": f"msg-{len(self.sent)}"})
+        return future
+
+
+def test_token_bucket() -> None:
+    now = [0.0]
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=lambda: now[0])
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == 0.5
+    now[0] = 0.5
+    assert bucket.take() == 0.0
+    bucket.pause(2.0)
+    assert bucket.take() == 2.5
+
+
+def test_outbox_rate_limits_deduplicates_and_retries(tmp_path) -> None:
+    send = Recorder({"Retried": [Transient("503")], "Broken": [ValueError("bad address")]})
+    outbox = Outbox(
+        str(tmp_path / "outbox.sqlite"), send, rate=20.0, burst=2, backoff_base=0.01,
+        retryable=lambda error: isinstance(error, Transient),
+    )
+    start = time.monotonic()
+    entries = [outbox.enqueue("alice", "bob@example.com", f"Update {i}", "Hi Bob") for i in range(6)]
+    # The same email queued again while retrying a tool call is not sent twice
+    again = outbox.enqueue("alice", "Bob@example.com ", "Update 0", "Hi  Bob")
+    assert again.duplicate and again.id == entries[0].id
+    other = outbox.enqueue("carol", "bob@example.com", "Update 0", "Hi Bob")
+    assert not other.duplicate
+
+    assert outbox.join(timeout=5)
+    times = sorted(sent_at for sent_at, entry in send.sent if entry.account == "alice")
+    assert len(times) == 6
+    # Two at once, then 20 per second
+    assert times[-1] - start >= 0.15
+    assert outbox.wait(entries[3].id).status == "sent"
+
+    retried = outbox.enqueue("alice", "bob@example.com", "Retried", "Hi")
+    broken = outbox.enqueue("alice", "bob@example.com", "Broken", "Hi")
+    assert outbox.wait(retried.id, timeout=5).status == "sent"
+    assert outbox.get(retried.id).attempts == 2
+    failed = outbox.wait(broken.id, timeout=5)
+    assert (failed.status, failed.error) == ("failed", "bad address")
+    # A failed email can be queued again
+    assert not outbox.enqueue("alice", "bob@example.com", "Broken", "Hi").duplicate
+    outbox.close()
+
+
+def test_outbox_sends_queued_emails_after_restart(tmp_path) -> None:
+    path = str(tmp_path / "outbox.sqlite")
+    # The worker dies while the email is being sent
+    outbox = Outbox(path, lambda entry: Future(), lease_seconds=0.5)
+    entry = outbox.enqueue("alice", "bob@example.com", "Update", "Hi")
+    assert outbox.wait(entry.id, timeout=0.2).status == "sending"
+    outbox.close()
+
+    # The next worker leaves it alone until the lease expires, then sends it
+    send = Recorder()
+    outbox = Outbox(path, send)
+    assert outbox.wait(entry.id, timeout=0.1).status == "sending" and not send.sent
+    assert outbox.wait(entry.id, timeout=5).message_id == "msg-1"
+    assert outbox.pending() == 0
+    outbox.close()
+
+
+def test_workers_sharing_a_queue_send_each_email_once(tmp_path) -> None:
+    path = str(tmp_path / "outbox.sqlite")
+    send = Recorder()
+    workers = [Outbox(path, send, rate=1000.0, burst=1000) for _ in range(3)]
+    entries = [workers[i % 3].enqueue("alice", "bob@example.com", f"Update {i}", "Hi") for i in range(60)]
+    for worker in workers:
+        worker._wake.set()
+    assert all(worker.join(timeout=5) for worker in workers)
+    assert sorted(entry.subject for _, entry in send.sent) == sorted(entry.subject for entry in entries)
+    for worker in workers:
+        worker.close()
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+from agent.email_parser import email_from_message, parse_headers
+from agent.configuration import Configuration
+from agent.preclassifier import PreClassifier, get_preclassifier
+from agent.state import EmailInput
+
+
+def _email(author_email: str, subject: str, body: str) -> EmailInput:
+    return EmailInput(
+        author_name="",
+        author_email=author_email,
+        to_name="John",
+        to_email="john@company.com",
+        subject=subject,
+        email_thread=body,
+    )
+
+
+def test_header_rules() -> None:
+    preclassifier = PreClassifier(threshold=0.9)
+    headers = parse_headers(
+        "From: Deals <deals@shop.example.com>\n"
+        "To: john@company.com\n"
+        "Subject: 20% off this weekend\n"
+        "List-Unsubscribe: <https://shop.example.com/unsubscribe>\n\n"
+        "Our newsletter: limited time discount!"
+    )
+    prediction = preclassifier.predict(email_from_message(headers), headers)
+    assert prediction.classification == "ignore" and prediction.stage == "rules"
+
+    ci = _email("noreply@github.com", "[api] Run failed: tests", "The workflow run failed for main.")
+    assert preclassifier.predict(ci).classification == "notify"
+
+    question = _email("alice@company.com", "API docs", "Could you clarify the missing endpoints?")
+    assert preclassifier.predict(question) is None
+    assert preclassifier.stats.hit_rate("rules") == 2 / 3
+
+
+def test_model_trained_from_examples() -> None:
+    examples = [
+        SimpleNamespace(value=f"Email: {text} Original routing: respond Correct routing: {label}")
+        for label, text in [
+            *[("ignore", f"Weekly marketing digest issue {i} with product offers") for i in range(5)],
+            *[("notify", f"Teammate {i} is out sick today and will be back tomorrow") for i in range(5)],
+            *[("respond", f"Can we meet on day {i} to review the design question") for i in range(5)],
+        ]
+    ]
+    preclassifier = PreClassifier(threshold=0.8).fit_from_examples(examples)
+
+    prediction = preclassifier.predict(_email("news@vendor.com", "Digest", "Weekly marketing digest with offers"))
+    assert prediction.classification == "ignore" and prediction.stage == "model"
+    # Emails that may need a reply always go to the triage model
+    assert preclassifier.predict(_email("bob@company.com", "Design", "Can we meet to review the design")) is None
+
+
+def test_each_user_gets_their_own_model(tmp_path) -> None:
+    def trained(label: str) -> PreClassifier:
+        texts = [f"Weekly digest of the team, issue {i}" for i in range(5)]
+        other = [f"Lunch plans for friday number {i}" for i in range(5)]
+        questions = [f"Can you review the proposal {i}" for i in range(5)]
+        labels = [label] * 5 + ["notify" if label == "ignore" else "ignore"] * 5 + ["respond"] * 5
+        return PreClassifier().fit(texts + other + questions, labels)
+
+    trained("ignore").save(str(tmp_path / "alice.json"))
+    trained("notify").save(str(tmp_path / "bob.json"))
+    digest = _email("team@company.com", "Digest", "Weekly digest of the team")
+
+    def predict(user_id: str):
+        configuration = Configuration(preclassifier_model_path=str(tmp_path), langgraph_user_id=user_id)
+        return get_preclassifier(configuration).predict(digest)
+
+    assert predict("alice").classification == "ignore"
+    assert predict("bob").classification == "notify"
+    # Users without a model of their own only get the header rules
+    assert predict("carol") is None
@@ -0,0 +1,47 @@
+import json
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from agent.prompt_cache import PromptCache, PromptUsage
+from agent.tenants import TenantRegistry
+
+
+def test_prompts_are_rendered_once_per_tenant_version(tmp_path) -> None:
+    registry = TenantRegistry(str(tmp_path))
+    cache = PromptCache()
+    tenant = registry.get("john")
+    first = cache.agent_system_message(tenant.profile, tenant.prompt_instructions)
+    assert cache.agent_system_message(tenant.profile, tenant.prompt_instructions) is first
+
+    triage = cache.triage_system_prompt(tenant.profile, tenant.prompt_instructions)
+    # The intake prompt extends the triage prompt, so both share the same prefix
+    assert cache.intake_system_prompt(tenant.profile, tenant.prompt_instructions).startswith(triage)
+
+    # An edited tenant file is a new version of the prompt inputs
+    (tmp_path / "john.json").write_text(json.dumps({"profile": {"name": "Johnny"}}))
+    registry.invalidate("john")
+    tenant = registry.get("john")
+    changed = cache.triage_system_prompt(tenant.profile, tenant.prompt_instructions)
+    assert changed != triage and "Johnny" in changed
+    assert cache.stats().hits == 2 and cache.stats().misses == 4
+
+
+def test_prompt_usage_counts_cached_tokens() -> None:
+    usage = PromptUsage()
+    message = AIMessage(
+        content="ok",
+        usage_metadata={
+            "input_tokens": 1200,
+            "output_tokens": 10,
+            "total_tokens": 1210,
+            "input_token_details": {"cache_read": 1024},
+        },
+        response_metadata={"model_name": "gpt-4o-mini"},
+    )
+    for _ in range(2):
+        usage.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+
+    stats = usage.stats()["gpt-4o-mini"]
+    assert stats.calls == 2 and stats.cached_tokens == 2048
+    assert round(stats.cached_ratio, 2) == 0.85
@@ -0,0 +1,68 @@
+import pytest
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from agent import build_email_agent, google_auth
+from agent.configuration import Configuration
+from agent.memory_index import AnnMemoryStore
+from agent.models import STAGES, register_chat_model
+from agent.prompts import prefetched_memories_header
+from agent.tenants import Tenant
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+from tests.fakes.google_api import FakeGoogleHttp
+
+
+def _embed(texts: list[str]) -> list[list[float]]:
+    return [[float(len(text)), float(text.count("a")), 1.0] for text in texts]
+
+
+def _agent(item_label: str, speculate: bool, tmp_path):
+    corpus = generate_corpus(40, seed=3, requests=0.0, duplicates=0.0)
+    item = next(item for item in corpus if item.label == item_label and item.format == "raw")
+    oracle = CorpusOracle(corpus, search_memory=True)
+    prompts: list[list[BaseMessage]] = []
+
+    def respond(messages: list[BaseMessage]) -> AIMessage:
+        prompts.append(messages)
+        return oracle.respond(messages)
+
+    for stage in STAGES:
+        register_chat_model(f"fake:{stage}", FakeChatModel(respond=respond, structured=oracle.structured))
+    google_auth.set_service_registry(FakeGoogleHttp().registry(), Configuration.langgraph_user_id)
+
+    store = AnnMemoryStore(index={"dims": 3, "embed": _embed, "fields": ["content"]})
+    store.put(Tenant(Configuration.langgraph_user_id, {}, {}).memory_namespace, "m1", {"content": f"{item.email.author_name} prefers short replies"})
+    config = {
+        "configurable": {
+            **{f"{stage}_model": f"fake:{stage}" for stage in STAGES},
+            "langgraph_user_id": Configuration.langgraph_user_id,
+            "classification_cache": "none",
+            "outbox_path": str(tmp_path / "outbox.sqlite"),
+            "preclassifier": False,
+            "speculative_memory_search": speculate,
+        }
+    }
+    return build_email_agent(store=store), {"messages": [HumanMessage(content=item.text)]}, config, item, prompts
+
+
+@pytest.mark.asyncio
+async def test_respond_email_gets_memories_in_first_prompt(tmp_path) -> None:
+    agent, input, config, item, prompts = _agent("respond", speculate=False, tmp_path=tmp_path)
+    result = await agent.ainvoke(input, config)
+    assert any(m.name == "search_memory" for m in result["messages"] if m.type == "tool")
+    baseline_calls = len(prompts)
+
+    agent, input, config, item, prompts = _agent("respond", speculate=True, tmp_path=tmp_path)
+    result = await agent.ainvoke(input, config)
+    first_prompt = prompts[0][-1].content
+    assert prefetched_memories_header in first_prompt and "prefers short replies" in first_prompt
+    assert not any(m.name == "search_memory" for m in result["messages"] if m.type == "tool")
+    assert result["messages"][-1].content == f"Handled {item.reference}."
+    # One ReAct round trip less
+    assert len(prompts) == baseline_calls - 1
+
+
+def test_speculation_is_dropped_for_ignored_emails(tmp_path) -> None:
+    agent, input, config, item, prompts = _agent("ignore", speculate=True, tmp_path=tmp_path)
+    agent.invoke(input, config)
+    assert all(prefetched_memories_header not in str(m.content) for m in prompts[0])
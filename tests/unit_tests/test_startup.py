@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+# Cold import of the agent on a developer machine takes about 0.6s; the budget
+# leaves room for slower CI runners. Override with STARTUP_BUDGET_MS.
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 2000))
+
+# Imported on first use only
+DEFERRED_MODULES = [
+    "langchain_openai",
+    "langchain_ollama",
+    "langchain.output_parsers",
+    "langgraph.prebuilt",
+    "langmem",
+    "googleapiclient",
+    "numpy",
+    "transformers",
+]
+
+
+def test_import_is_lazy_and_within_budget() -> None:
+    code = f"import sys, agent; print([m for m in {DEFERRED_MODULES!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+    agent_line = next(line for line in result.stderr.splitlines() if line.rstrip().endswith("| agent"))
+    cumulative_ms = int(agent_line.split("|")[1]) / 1000
+    assert cumulative_ms < STARTUP_BUDGET_MS, f"import agent took {cumulative_ms:.0f}ms"
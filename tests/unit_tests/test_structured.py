@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from agent.state import Router, email_detection
+from agent.structured import StructuredOutput, StructuredOutputError, repair_json
+
+VALID = '{"reasoning": "A question for John.", "classification": "respond", "confidence": 0.9}'
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (f"```json\n{VALID}\n```", "respond"),
+        (f"Here is the classification:\n{VALID}\nHope it helps!", "respond"),
+        ('{"reasoning": "ok", "classification": "notify",}', "notify"),
+        ("{'reasoning': 'it\\'s spam', 'classification': 'ignore', 'confidence': None}", "ignore"),
+        # Truncated in the last member: the incomplete member is dropped
+        ('{"reasoning": "ok", "classification": "respond", "confid', "respond"),
+    ],
+)
+def test_repair_json(text: str, expected: str) -> None:
+    assert Router.model_validate(repair_json(text)).classification == expected
+
+
+def test_repair_json_gives_up_on_prose() -> None:
+    assert repair_json("I'm sorry, I can't classify this email.") is None
+    # Truncated in the first member: only the reasoning is left, which `Router` rejects
+    assert repair_json('{"reasoning": "The sender asks') == {"reasoning": "The sender asks"}
+
+
+class ChatOllama:
+    """Stands in for `langchain_ollama.ChatOllama`: answers from a script and records the bound format."""
+
+    def __init__(self, *answers: str):
+        self.answers = list(answers)
+        self.formats: list[dict] = []
+        self.inputs: list = []
+
+    def bind(self, format: dict) -> RunnableLambda:
+        self.formats.append(format)
+        return RunnableLambda(self._answer)
+
+    def _answer(self, messages) -> AIMessage:
+        self.inputs.append(messages)
+        return AIMessage(content=self.answers.pop(0))
+
+
+def test_ollama_answers_are_constrained_repaired_then_retried() -> None:
+    model = ChatOllama(f"```json\n{VALID}\n```")
+    structured = StructuredOutput(model, Router, retries=1)
+    assert structured.invoke([{"role": "user", "content": "Classify"}]).classification == "respond"
+    assert model.formats == [Router.model_json_schema()]
+    assert len(model.inputs) == 1
+
+    # Unrepairable answers are asked again with the error, within the budget
+    model = ChatOllama("I'm sorry, I can't.", '{"reasoning": "The sender asks', VALID)
+    structured = StructuredOutput(model, Router, retries=2)
+    assert asyncio.run(structured.ainvoke([{"role": "user", "content": "Classify"}])).confidence == 0.9
+    retry = model.inputs[-1]
+    assert [type(m) for m in retry] == [HumanMessage, AIMessage, HumanMessage]
+    assert retry[1].content == '{"reasoning": "The sender asks'
+    assert "classification" in retry[2].content
+
+    model = ChatOllama("no", "still no")
+    with pytest.raises(StructuredOutputError):
+        StructuredOutput(model, email_detection, retries=1).invoke("Did I get an email?")
+    result = StructuredOutput(ChatOllama("no"), email_detection, retries=0, include_raw=True).invoke("Hi")
+    assert result["parsed"] is None and result["raw"].content == "no"
+    assert result["parsing_error"] is not None
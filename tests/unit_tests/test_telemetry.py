@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from agent import build_email_agent, google_auth
+from agent.configuration import Configuration
+from agent.models import STAGES, register_chat_model
+from agent.telemetry import Telemetry, telemetry, telemetry_handler, traced
+from tests.fakes.chat_models import FakeChatModel
+from tests.fakes.corpus import CorpusOracle, generate_corpus
+from tests.fakes.google_api import FakeGoogleHttp
+
+
+@pytest.fixture
+def enabled():
+    telemetry.reset()
+    telemetry.enable()
+    yield telemetry
+    telemetry.disable()
+    telemetry.reset()
+
+
+def test_disabled_records_nothing() -> None:
+    recorder = Telemetry(enabled=False)
+    recorder.count("agent_cache_requests_total", cache="prompt", result="hit")
+    recorder.observe("agent_node_duration_seconds", 0.1, node="intake")
+    with recorder.span("node intake") as span:
+        assert span is None
+    assert recorder.prometheus_text() == "\n"
+    assert recorder.spans() == []
+
+
+def test_prometheus_text_format() -> None:
+    recorder = Telemetry(enabled=True, buckets=(0.1, 1.0))
+    recorder.count("agent_cache_requests_total", cache="prompt", result="hit")
+    recorder.count("agent_cache_requests_total", 2, cache="prompt", result="hit")
+    recorder.observe("agent_node_duration_seconds", 0.05, node='say "hi"')
+    recorder.observe("agent_node_duration_seconds", 0.5, node='say "hi"')
+
+    text = recorder.prometheus_text()
+    assert "# TYPE agent_cache_requests_total counter" in text
+    assert 'agent_cache_requests_total{cache="prompt",result="hit"} 3' in text
+    assert "# TYPE agent_node_duration_seconds histogram" in text
+    assert 'agent_node_duration_seconds_bucket{node="say \\"hi\\"",le="0.1"} 1' in text
+    assert 'agent_node_duration_seconds_bucket{node="say \\"hi\\"",le="+Inf"} 2' in text
+    assert 'agent_node_duration_seconds_count{node="say \\"hi\\""} 2' in text
+
+
+def test_traced_keeps_signature_and_nests_spans(enabled) -> None:
+    @traced("tool", "inner")
+    def inner(x: int) -> int:
+        return x + 1
+
+    @traced("node", "outer")
+    async def outer(x: int) -> int:
+        return inner(x)
+
+    assert asyncio.run(outer(1)) == 2
+    spans = {span.name: span for span in enabled.spans()}
+    assert spans["tool inner"].parent_span_id == spans["node outer"].span_id
+    assert spans["tool inner"].trace_id == spans["node outer"].trace_id
+
+    @traced("tool", "failing")
+    def failing() -> None:
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        failing()
+    assert enabled.counter_value("agent_tool_errors_total", tool="failing") == 1
+    assert enabled.spans()[-1].to_otlp()["status"] == {"code": 2, "message": "ValueError: boom"}
+
+
+@pytest.mark.asyncio
+async def test_graph_run_is_traced(enabled, tmp_path) -> None:
+    corpus = [item for item in generate_corpus(30, seed=2) if item.label == "respond"][:3]
+    oracle = CorpusOracle(corpus)
+    for stage in STAGES:
+        model = FakeChatModel(respond=oracle.respond, structured=oracle.structured, callbacks=[telemetry_handler])
+        register_chat_model(f"fake:{stage}", model)
+    google_auth.set_service_registry(FakeGoogleHttp().registry(), Configuration.langgraph_user_id)
+
+    graph = build_email_agent()
+    configurable = {f"{stage}_model": f"fake:{stage}" for stage in STAGES}
+    outbox = {"outbox_path": str(tmp_path / "outbox.sqlite"), "outbox_wait_seconds": 10}
+    config = {"configurable": {**configurable, **outbox, "classification_cache": "none"}}
+    for item in corpus:
+        await graph.ainvoke({"messages": [{"role": "user", "content": item.text}]}, config)
+
+    text = enabled.prometheus_text()
+    assert 'agent_node_duration_seconds_count{node="response_agent"} 3' in text
+    assert 'agent_model_duration_seconds_count{model="FakeChatModel"}' in text
+    planned = [tool for item in corpus for tool, _ in item.tool_calls]
+    for tool in set(planned):
+        assert f'agent_tool_duration_seconds_count{{tool="{tool}"}} {planned.count(tool)}' in text
+    mutations = planned.count("write_email") + planned.count("schedule_meeting")
+    assert enabled.counter_value("agent_google_api_requests_total") >= mutations
+    assert enabled.counter_value("agent_cache_requests_total", cache="prompt") > 0
+
+    # Model and tool spans are children of the node they run in
+    spans = enabled.spans()
+    by_id = {span.span_id: span for span in spans}
+    for span in spans:
+        if span.name.startswith(("chat ", "tool ")):
+            assert by_id[span.parent_span_id].name.startswith("node ")
+    exported = enabled.otlp_json()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len(exported) == len(spans)
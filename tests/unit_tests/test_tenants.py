@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from agent import graph
+from agent.cache import ClassificationCache, InMemoryCacheBackend
+from agent.configuration import Configuration
+from agent.state import EmailInput, Router
+from agent.tenants import Tenant, TenantRegistry, get_tenant, safe_user_id
+
+
+def test_tenants_are_loaded_lazily_and_evicted(tmp_path) -> None:
+    (tmp_path / "ana.json").write_text(
+        json.dumps({"profile": {"name": "Ana"}, "prompt_instructions": {"triage_rules": {"ignore": "Sports scores"}}})
+    )
+    registry = TenantRegistry(str(tmp_path), max_tenants=2)
+
+    ana = registry.get("ana")
+    assert ana.profile["name"] == "Ana" and ana.profile["full_name"] == "Abdallah Farouk"
+    assert ana.prompt_instructions["triage_rules"]["ignore"] == "Sports scores"
+    assert ana.prompt_instructions["triage_rules"]["notify"].startswith("Team member out sick")
+    assert ana.memory_namespace == ("email_assistant", "ana", "collection")
+    assert registry.get("../../etc/passwd").profile["name"] == "Farouk"
+
+    # "ana" was evicted by the two other users and is loaded again
+    registry.get("bob")
+    assert registry.get("ana") == ana
+    assert len(registry) == 2 and registry.loads == 4
+
+
+def test_user_ids_map_to_distinct_file_names() -> None:
+    ids = ["a_b", "a/b", "a:b", "a%2Fb", "A_B", "ana@example.com", "..", ".hidden", "%2E.", ""]
+    names = [safe_user_id(user_id) for user_id in ids]
+    assert len(set(names)) == len(ids)
+    assert safe_user_id("ana@example.com") == "ana@example.com"
+    assert all("/" not in name and not name.startswith(".") for name in names)
+
+
+def test_prompts_and_cache_entries_are_per_user(tmp_path) -> None:
+    (tmp_path / "ana.json").write_text(json.dumps({"profile": {"name": "Ana"}}))
+    configs = {
+        user: {"configurable": {"langgraph_user_id": user, "tenants_path": str(tmp_path)}} for user in ("ana", "bob")
+    }
+    prompts = {user: graph.create_prompt({"messages": []}, config)[0].content for user, config in configs.items()}
+    assert "Ana" in prompts["ana"] and "Ana" not in prompts["bob"]
+
+    cache = ClassificationCache(InMemoryCacheBackend())
+    email = EmailInput(author_name="A", author_email="a@x.com", to_name="B", to_email="b@x.com", subject="Hi", email_thread="Hello")
+    tenants = {user: get_tenant(Configuration.from_runnable_config(config)) for user, config in configs.items()}
+    ana, bob = tenants["ana"], tenants["bob"]
+    cache.set(email, ana.prompt_instructions["triage_rules"], ana.profile, Router(reasoning="", classification="notify"), "ana")
+    # Another user's triage context neither sees nor clears it
+    assert cache.get(email, bob.prompt_instructions["triage_rules"], bob.profile, "bob") is None
+    assert cache.get(email, ana.prompt_instructions["triage_rules"], ana.profile, "ana").classification == "notify"
+
+
+def test_memory_tools_default_to_the_configured_user() -> None:
+    from langgraph.constants import CONFIG_KEY_STORE
+    from langgraph.store.memory import InMemoryStore
+
+    store = InMemoryStore()
+    manage, search = graph.get_tools()[-2:]
+    config = {"configurable": {CONFIG_KEY_STORE: store}}
+    manage.invoke({"content": "Prefers short replies"}, config)
+    namespace = Tenant(Configuration.langgraph_user_id, {}, {}).memory_namespace
+    assert [item.value["content"] for item in store.search(namespace)] == ["Prefers short replies"]
+    assert "Prefers short replies" in asyncio.run(search.ainvoke({"query": "replies"}, config))
+
+    # An explicit user id keeps its own namespace
+    manage.invoke({"content": "Likes emojis"}, {"configurable": {CONFIG_KEY_STORE: store, "langgraph_user_id": "ana"}})
+    assert len(store.search(("email_assistant", "ana", "collection"))) == 1
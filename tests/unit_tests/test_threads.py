@@ -0,0 +1,87 @@
+from langchain_core.messages import AIMessage, BaseMessage
+
+from agent.cache import InMemoryCacheBackend
+from agent.email_parser import email_from_message, parse_headers
+from agent.threads import SUMMARY_HEADER, ThreadPreprocessor, clean_history, split_thread
+from tests.fakes.chat_models import FakeChatModel
+
+REPLY = """Sounds good, let's do Tuesday.
+
+Thanks,
+Bob
+--
+Bob Smith | ACME Corp
++1 555 0100
+
+On Mon, May 5, 2025 at 10:00 AM Alice Jones <alice@example.com>
+wrote:
+> Can we move the review to Tuesday?
+>
+> Alice
+> Sent from my iPhone
+>
+> On Sun, May 4, 2025 at 9:00 AM Bob Smith <bob@acme.com> wrote:
+>> The review is on Monday at 3pm.
+"""
+
+
+def test_split_thread_strips_history_and_signatures() -> None:
+    parts = split_thread(REPLY)
+    assert parts.new == "Sounds good, let's do Tuesday.\n\nThanks,\nBob"
+    assert clean_history(parts.history).splitlines() == [
+        "On Mon, May 5, 2025 at 10:00 AM Alice Jones <alice@example.com>",
+        "wrote:",
+        "Can we move the review to Tuesday?",
+        "",
+        "Alice",
+        "",
+        "On Sun, May 4, 2025 at 9:00 AM Bob Smith <bob@acme.com> wrote:",
+        "The review is on Monday at 3pm.",
+    ]
+
+    forward = "FYI\n\n-----Original Message-----\nFrom: Carol <carol@example.com>\nSent: Monday\nSubject: Budget\n\nApproved."
+    assert split_thread(forward).new == "FYI"
+    # Inline answers between quotes are not history
+    inline = "> Can you come?\nYes.\n> At 3pm?\nBetter at 4pm."
+    assert split_thread(inline).new == inline
+
+
+def _raw(message_id: str, in_reply_to: str, body: str) -> str:
+    return (
+        f"From: Alice <alice@example.com>\nTo: John <john@company.com>\nSubject: Re: Launch plan\n"
+        f"Message-ID: {message_id}\nIn-Reply-To: {in_reply_to}\n\n{body}"
+    )
+
+
+def _quote(text: str) -> str:
+    return "\n".join(f"> {line}" for line in text.splitlines())
+
+
+def test_long_thread_is_summarized_in_chunks_and_cached_by_message_id() -> None:
+    chunks: list[str] = []
+
+    def summarize(messages: list[BaseMessage]) -> AIMessage:
+        chunk = str(messages[-1].content)
+        chunks.append(chunk)
+        return AIMessage(content=f"summary of: {chunk.splitlines()[0]}")
+
+    model = FakeChatModel(respond=summarize)
+    preprocessor = ThreadPreprocessor(InMemoryCacheBackend(), summarize_min_tokens=100, chunk_tokens=100)
+
+    old = "\n".join(f"Launch checklist item {i}: owner and date to confirm." for i in range(60))
+    second = f"Here is the full checklist.\n\nOn Mon, May 5, 2025 at 9:00 AM John <john@company.com> wrote:\n{_quote(old)}"
+    headers = parse_headers(_raw("<m2@example.com>", "<m1@example.com>", second))
+    email = preprocessor.prepare(email_from_message(headers), headers, model)
+    assert len(chunks) > 3
+    first_summary = "summary of: On Mon, May 5, 2025 at 9:00 AM John <john@company.com> wrote:"
+    assert email.email_thread.startswith(f"Here is the full checklist.\n\n{SUMMARY_HEADER}\n{first_summary}")
+
+    # The reply only summarizes the new text of the message it answers
+    chunks.clear()
+    new_part = "\n".join(f"Checklist item {i} is done." for i in range(40))
+    reply = f"Great, thanks!\n\nOn Tue, May 6, 2025 at 9:00 AM Alice <alice@example.com> wrote:\n{_quote(new_part + chr(10) + chr(10) + second)}"
+    headers = parse_headers(_raw("<m3@example.com>", "<m2@example.com>", reply))
+    email = preprocessor.prepare(email_from_message(headers), headers, model)
+    assert chunks and all("Launch checklist" not in chunk for chunk in chunks)
+    assert email.email_thread.splitlines()[0] == "Great, thanks!"
+    assert first_summary in email.email_thread